@@ -1,61 +1,49 @@
 """
 Initialize the backend:
-get the app secret key, database name and email configuration from the designed
-files when called.
+the app secret key, database name and email configuration are loaded when the app is
+initialized (or the email is sent), not on import, see the config module.
 """
-import os
-
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 
+from . import engine
+from .config import get_app_key, get_db
+
 
 app = Flask(__name__)
-db = SQLAlchemy()
-
-def get_app_key():
-    """Get the app key from file, the key is loaded from the first line of the file.
-    Returns the key."""
-    with open(os.path.join("", "app", ".config",  "app.key")) as f:
-        key = f.readline().strip()
-    print("<SERVER><LOG> App key loaded.")
-    return key
-
-def get_db():
-    """Get the db name from file, the name is loaded from the first line of the file.
-    Returns the db."""
-    with open(os.path.join("", "app", ".config",  "db.key")) as f:
-        db = f.readline().strip()
-    print("<SERVER><LOG> Db config loaded.")
-    return db
-
-def get_email_config():
-    """Get the email config from file, reads the email, email password and recipient
-    each as a line form the file in this order.
-    Returns a tuple of (emial, email password, recipient email)."""
-    with open(os.path.join("", "app", ".config",  "email.key")) as f:
-        email = f.readline().strip()
-        email_key = f.readline().strip()
-        to_email = f.readline().strip()
-    print("<SERVER><LOG> Email config loaded.")
-    return email, email_key, to_email
-
-# Stored email config for other modules.
-EMAIL, EMAIL_KEY, TO_EMAIL = get_email_config()
+db = SQLAlchemy(session_options={"class_": engine.RoutingSession})
 
 def init_app():
     """Initialize the app, load the blueprints for the routes and create the db.
-    The db is created only if it does not exist.
+    The db is created only if it does not exist, the schema of an existing db is migrated
+    to the current version, nothing is done if it already is at the current version.
+    The engines are set up with the SQLite profile of the engine module, and timed by the
+    SQL profiler if on (see the profiler module).
+    The background mail sender is not started here, only by the servers (see mailer.start).
     Returns the app."""
     app.config.update(
         SECRET_KEY=get_app_key(),
         SQLALCHEMY_DATABASE_URI=f"sqlite:///{get_db()}"
     )
+    engine.configure(app)
     db.init_app(app)
+    engine.setup(app, db)
+    from . import profiler
+    profiler.setup(app, db)
+
+    from .serialize import FastJSONProvider
+    app.json = FastJSONProvider(app)
 
     from .routes import routes
     app.register_blueprint(routes, url_prefix="/")
+    from . import cli
 
+    from .migrations import SCHEMA_VERSION, get_schema_version, migrate
     with app.app_context():
-        db.create_all()
+        with db.engine.connect() as conn:
+            up_to_date = get_schema_version(conn) == SCHEMA_VERSION
+        if not up_to_date:
+            db.create_all()
+            migrate()
 
     return app
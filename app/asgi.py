@@ -0,0 +1,42 @@
+"""
+Module for the ASGI variant of the blog app, served by an ASGI server (e.g. hypercorn, see asgi.py).
+The app is a Quart app with the async endpoints of the async_routes module, using the
+config, the db and the migrations of the Flask app (init_app), the same JSON encoding and
+the same background mail sender.
+"""
+import asyncio
+
+from quart import Quart
+
+from . import app, init_app
+from . import async_control
+from . import mailer
+from .serialize import FastJSONProvider
+
+
+def create_app():
+    """Initialize the Flask app, if not initialized yet, and create the ASGI app on top of it.
+    The async engines and HTTP client are made when the server starts serving,
+    within its event loop, and closed when it stops, the mail sender is started and stopped with them.
+    Returns the Quart app."""
+    if "sqlalchemy" not in app.extensions:
+        init_app()
+
+    from .async_routes import routes
+
+    asgi_app = Quart(__name__)
+    asgi_app.config.update(app.config)
+    asgi_app.json = FastJSONProvider(asgi_app)
+    asgi_app.register_blueprint(routes, url_prefix="/")
+
+    @asgi_app.before_serving
+    async def start():
+        await async_control.init()
+        mailer.start()
+
+    @asgi_app.after_serving
+    async def stop():
+        await asyncio.to_thread(mailer.sender.stop, mailer.SMTP_TIMEOUT)
+        await async_control.close()
+
+    return asgi_app
@@ -0,0 +1,592 @@
+"""
+Module to interact with the db of the blog app from asyncio, for the ASGI app (see the asgi module).
+Same functions as the control module, as coroutines: the db is used through an AsyncSession
+with the aiosqlite driver and the images are checked with httpx, so a slow query or a slow
+remote image holds no thread while waiting.
+The queries, the response cache, the validators and the post dicts are shared with the
+control module, the results are the same.
+The engines and the HTTP client are made by init() within the event loop of the app,
+and closed by close().
+"""
+import asyncio
+import datetime
+import inspect
+import time
+
+import imghdr
+
+from html import escape
+
+import httpx
+from requests.exceptions import MissingSchema
+from sqlalchemy import select, update, delete
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import selectinload
+
+from . import app
+from . import db
+from . import cache
+from . import control
+from . import engine
+from . import images
+from . import mailer
+from . import metrics
+from . import profiler
+from .control import (
+    COMMENTS_BATCH,
+    DELETE_BATCH,
+    STREAM_BATCH,
+    _cache_key,
+    _contact_message,
+    _newest_comments_query,
+    _post_dict,
+    _posts_query,
+    _posts_to_list,
+    _search_query,
+    _set_newest_comments,
+    _touch_post_query,
+    _uncount_comments_query,
+    _validators,
+    make_excerpt,
+)
+from .models import Post, Comment, OutboxMail
+
+
+# Set up by init(): the engine of the writes, the sessions of the writes and of the reads,
+# and the client of the image checks.
+_writer = None
+_reader = None
+_write_session = None
+_read_session = None
+_client = None
+
+# The function of this module doing the work of each function of the control module the
+# handlers call, see handlers.run_async.
+VARIANTS = {}
+
+
+def _parameters(function):
+    """Helper to get the parameters of a function.
+    Returns a list of (name, kind, default)."""
+    return [(param.name, param.kind, param.default) for param in inspect.signature(function).parameters.values()]
+
+
+def _variant_of(function):
+    """Decorator registering the decorated function as the variant of the given function of
+    the control module, in VARIANTS.
+    Raises TypeError if their parameters differ."""
+    def register(variant):
+        if _parameters(variant) != _parameters(function):
+            raise TypeError(f"The parameters of {variant.__name__} differ from the ones of control.{function.__name__}.")
+        VARIANTS[function] = variant
+        return variant
+    return register
+
+
+async def init():
+    """Make the async engines from the engines of the app (same db and engine profile,
+    a single writer connection and read-only readers) and the HTTP client of the image checks.
+    The app must have been initialized (init_app)."""
+    global _writer, _reader, _write_session, _read_session, _client
+    with app.app_context():
+        writer_url = db.engine.url
+        reader_engine = db.engines.get(engine.READER)
+        reader_url = reader_engine.url if reader_engine is not None else None
+        options = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+
+    _writer = create_async_engine(writer_url.set(drivername="sqlite+aiosqlite"), **options)
+    engine.setup_engine(app, _writer.sync_engine, writer=True)
+    profiler.setup_engine(app, _writer.sync_engine)
+    _reader = _writer
+    if reader_url is not None:
+        _reader = create_async_engine(
+            reader_url.set(drivername="sqlite+aiosqlite"),
+            pool_size=app.config["SQLITE_POOL_SIZE"],
+            max_overflow=app.config["SQLITE_MAX_OVERFLOW"],
+            pool_timeout=app.config["SQLITE_POOL_TIMEOUT"],
+        )
+        engine.setup_engine(app, _reader.sync_engine, writer=False)
+        profiler.setup_engine(app, _reader.sync_engine)
+    _write_session = async_sessionmaker(_writer, expire_on_commit=False)
+    _read_session = async_sessionmaker(_reader, expire_on_commit=False)
+
+    _client = httpx.AsyncClient(
+        timeout=httpx.Timeout(images.READ_TIMEOUT, connect=images.CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_keepalive_connections=images.POOL_SIZE),
+        follow_redirects=True,
+    )
+
+
+async def close():
+    """Close the engines and the HTTP client made by init()."""
+    if _client is not None:
+        await _client.aclose()
+    if _reader is not None and _reader is not _writer:
+        await _reader.dispose()
+    if _writer is not None:
+        await _writer.dispose()
+
+
+async def _sniff(img_url):
+    """Helper, download the start of the file at the given url and detect the type of the image.
+    The small responses are read to the end, so their connection is reused, see the images module.
+    Returns the type of the image if any, None if not an image or too large.
+    Raises MissingSchema if the given url is not a valid url format."""
+    try:
+        async with _client.stream("GET", img_url, headers=images.SNIFF_HEADERS) as response:
+            drain = images._is_small(response)
+            if not response.is_success:
+                if drain:
+                    await response.aread()
+                return None
+            size = images._file_size(response)
+            if size is not None and size > images.MAX_IMG_BYTES:
+                return None
+            head = b""
+            async for chunk in response.aiter_raw():
+                head += chunk
+                if len(head) >= images.SNIFF_BYTES and not drain:
+                    break
+    except (httpx.UnsupportedProtocol, httpx.InvalidURL) as err:
+        raise MissingSchema(str(err)) from err
+    except httpx.HTTPError:
+        return None
+    return imghdr.what("", head[:images.SNIFF_BYTES])
+
+
+async def sniff_img_type(img_url):
+    """Async images.sniff_img_type: same limits, the whole check is cancelled after DEADLINE seconds.
+    Returns the type of the image if any, None if not an image, too large, not reachable
+    or the deadline has been exceeded.
+    Raises MissingSchema if the given url is not a valid url format."""
+    try:
+        return await asyncio.wait_for(_sniff(img_url), images.DEADLINE)
+    except asyncio.TimeoutError:
+        return None
+
+
+async def _img_cache(method, *args):
+    """Helper to call a method of the cache of the image checks, in a thread if the cache
+    is persisted in the db.
+    Returns the result of the method."""
+    if app.config.get("IMG_CACHE_PERSIST", False):
+        return await asyncio.to_thread(method, *args)
+    return method(*args)
+
+
+@_variant_of(control.validate_img_url)
+async def validate_img_url(img_url):
+    """Async control.validate_img_url, the results are cached with the ones of the control module.
+    Returns the type of the image if any, None if not an image.
+    Raises MissingSchema if the given url is not a valid url format."""
+    url = images.normalize_url(img_url)
+    found, img_type = await _img_cache(images.cache.get, url)
+    if found:
+        return img_type
+    start = time.perf_counter()
+    try:
+        img_type = await sniff_img_type(img_url)
+    finally:
+        metrics.record_img_fetch(time.perf_counter() - start)
+    await _img_cache(images.cache.set, url, img_type)
+    return img_type
+
+
+async def _add_newest_comments(session, posts: list, limit: int):
+    """Helper, async control._add_newest_comments within the given session."""
+    comments = {}
+    for start in range(0, len(posts), COMMENTS_BATCH):
+        ids = [post["id"] for post in posts[start:start + COMMENTS_BATCH]]
+        rows = (await session.execute(_newest_comments_query(ids, limit))).scalars()
+        for comment in rows:
+            comments.setdefault(comment.post_id, []).append(comment.to_dict())
+    _set_newest_comments(posts, comments, limit)
+
+
+@_variant_of(control.get_posts)
+async def get_posts(
+        num: int=0,
+        page: int=1,
+        comments: bool=False,
+        after: str=None,
+        comments_limit: int=None,
+        summary: bool=False,
+        validators: tuple=None
+):
+    """Async control.get_posts, same params and result, cached with the same key.
+    Raises ValueError if 'after' is not a valid cursor."""
+    if validators is None:
+        validators = await get_posts_validators(
+            num, page, comments, after, comments_limit=comments_limit, summary=summary
+        )
+    key = _cache_key(validators, "posts", num, page, comments, after, comments_limit, summary)
+    found, result = cache.responses.get(key)
+    if found:
+        return result
+    generation = cache.responses.generation
+    query = _posts_query(num=num, page=page, after=after, summary=summary)
+    if comments and not comments_limit:
+        query = query.options(selectinload(Post.comments))
+    async with _read_session() as session:
+        posts = (await session.execute(query)).scalars().all()
+        if comments and comments_limit and posts:
+            result = _posts_to_list(posts, summary=summary)
+            await _add_newest_comments(session, result, comments_limit)
+        else:
+            result = _posts_to_list(posts, comments, summary) if posts else None
+    tags = ["posts"]
+    if result:
+        tags.extend(f"post:{post['id']}" for post in result)
+    cache.responses.set(key, result, tags, generation)
+    return result
+
+
+@_variant_of(control.iter_posts)
+async def iter_posts(
+        num: int=0,
+        page: int=1,
+        comments: bool=False,
+        after: str=None,
+        comments_limit: int=None,
+        summary: bool=False,
+        user: str=None
+):
+    """Async control.iter_posts, the posts are loaded STREAM_BATCH at a time.
+    Yields post objects representet as a dict.
+    Raises ValueError if 'after' is not a valid cursor (when the iteration starts)."""
+    query = _posts_query(num=num, page=page, after=after, user=user, summary=summary)
+    if comments and not comments_limit:
+        query = query.options(selectinload(Post.comments))
+    async with _read_session() as session:
+        result = await session.stream_scalars(query.execution_options(yield_per=STREAM_BATCH))
+        async for batch in result.partitions():
+            posts = _posts_to_list(batch, comments and not comments_limit, summary)
+            if comments and comments_limit:
+                await _add_newest_comments(session, posts, comments_limit)
+            for post in posts:
+                yield post
+
+
+@_variant_of(control.has_posts)
+async def has_posts(num: int=0, page: int=1, after: str=None, user: str=None):
+    """Async control.has_posts.
+    Returns bool.
+    Raises ValueError if 'after' is not a valid cursor."""
+    query = _posts_query(num=num, page=page, after=after, user=user)
+    async with _read_session() as session:
+        first = (await session.execute(query.with_only_columns(Post.id).limit(1))).first()
+    return first is not None
+
+
+@_variant_of(control.get_post)
+async def get_post(id, validators: tuple=None):
+    """Async control.get_post, same params and result, cached with the same key.
+    Returns a dict or None if there is no post by the given id."""
+    if validators is None:
+        validators = await get_post_validators(id)
+    key = _cache_key(validators, "post", id)
+    found, result = cache.responses.get(key)
+    if found:
+        return result
+    generation = cache.responses.generation
+    async with _read_session() as session:
+        post = (await session.execute(
+            select(Post)
+            .options(selectinload(Post.comments))
+            .where(Post.id == id)
+        )).scalar()
+    result = _post_dict(post, comments=True) if post else None
+    cache.responses.set(key, result, [f"post:{id}"], generation)
+    return result
+
+
+@_variant_of(control.get_posts_by_user)
+async def get_posts_by_user(
+        user,
+        num: int=0,
+        page: int=1,
+        after: str=None,
+        summary: bool=False,
+        validators: tuple=None
+):
+    """Async control.get_posts_by_user, same params and result, cached with the same key.
+    Raises ValueError if 'after' is not a valid cursor."""
+    if validators is None:
+        validators = await get_posts_validators(num, page, after=after, user=user, summary=summary)
+    key = _cache_key(validators, "user", user, num, page, after, summary)
+    found, result = cache.responses.get(key)
+    if found:
+        return result
+    generation = cache.responses.generation
+    query = _posts_query(num=num, page=page, after=after, user=user, summary=summary)
+    async with _read_session() as session:
+        posts = (await session.execute(query)).scalars().all()
+    result = _posts_to_list(posts=posts, comments=False, summary=summary) if posts else None
+    tags = [f"user:{user}"]
+    if result:
+        tags.extend(f"post:{post['id']}" for post in result)
+    cache.responses.set(key, result, tags, generation)
+    return result
+
+
+@_variant_of(control.get_posts_validators)
+async def get_posts_validators(
+        num: int=0,
+        page: int=1,
+        comments: bool=False,
+        after: str=None,
+        user: str=None,
+        comments_limit: int=None,
+        summary: bool=False,
+        cursor: bool=False
+):
+    """Async control.get_posts_validators.
+    Returns a tuple of (etag, None) or None if there are no posts.
+    Raises ValueError if 'after' is not a valid cursor."""
+    query = _posts_query(num=num, page=page, after=after, user=user)
+    async with _read_session() as session:
+        rows = (await session.execute(
+            query.with_only_columns(Post.id, Post.version, Post.modified)
+        )).all()
+    return _validators(rows, "posts", cursor, comments, num, after, comments_limit, summary, listing=True)
+
+
+@_variant_of(control.get_post_validators)
+async def get_post_validators(id):
+    """Async control.get_post_validators.
+    Returns a tuple of (etag, last modified time in UTC) or None if there is no post by the given id."""
+    async with _read_session() as session:
+        rows = (await session.execute(
+            select(Post.id, Post.version, Post.modified)
+            .where(Post.id == id)
+        )).all()
+    return _validators(rows, "post")
+
+
+@_variant_of(control.search_posts)
+async def search_posts(query: str, num: int=10, page: int=1):
+    """Async control.search_posts.
+    Returns a list of dict or None if there are no results.
+    Raises ValueError if the search has no words, OperationalError if the index is not available."""
+    stmt, params = _search_query(query, num, page)
+    async with _read_session() as session:
+        rows = (await session.execute(stmt, params)).mappings().all()
+    if not rows:
+        return None
+    return [dict(row) for row in rows]
+
+
+@_variant_of(control.send_contact_email)
+async def send_contact_email(name, email, message):
+    """Async control.send_contact_email, the email is queued in the outbox of the mailer module.
+    Returns the id of the queued email."""
+    msg = _contact_message(name, email, message)
+    now = datetime.datetime.now()
+    async with _write_session() as session:
+        mail = OutboxMail(message=msg.as_string(), created=now, next_try=now, attempts=0)
+        session.add(mail)
+        await session.commit()
+    mailer.sender.wake()
+    return mail.id
+
+
+@_variant_of(control.add_post)
+async def add_post(
+    author,
+    title,
+    subtitle,
+    body,
+    img_url=None
+):
+    """Async control.add_post."""
+    now = datetime.datetime.now()
+    async with _write_session() as session:
+        post = Post(
+            author=author,
+            title=title,
+            subtitle=subtitle,
+            body=body,
+            excerpt=make_excerpt(body),
+            date=now,
+            img_url=img_url,
+            version=1,
+            modified=now
+        )
+        session.add(post)
+        await session.commit()
+    cache.responses.invalidate("posts", f"user:{author}", f"post:{post.id}")
+
+
+@_variant_of(control.update_post)
+async def update_post(
+        id:int,
+        title:str,
+        subtitle:str,
+        body:str,
+        img_url:str=None
+):
+    """Async control.update_post.
+    Returns True if the post has been updated, False if there is no post with the id."""
+    if img_url:
+        img_url = escape(img_url)
+    async with _write_session() as session:
+        now = datetime.datetime.now()
+        author = (await session.execute(
+            update(Post)
+            .where(Post.id == id)
+            .values(
+                title=escape(title),
+                subtitle=escape(subtitle),
+                body=escape(body),
+                excerpt=make_excerpt(escape(body)),
+                date=now,
+                img_url=img_url,
+                version=Post.version + 1,
+                modified=now,
+            )
+            .returning(Post.author)
+        )).scalar()
+        if author is None:
+            await session.rollback()
+            return False
+        await session.commit()
+    cache.responses.invalidate("posts", f"user:{author}", f"post:{id}")
+    return True
+
+
+@_variant_of(control.delete_post)
+async def delete_post(id):
+    """Async control.delete_post.
+    Returns True if the post has been deleted, False if there is no post with the id."""
+    async with _write_session() as session:
+        author = (await session.execute(
+            delete(Post)
+            .where(Post.id == id)
+            .returning(Post.author)
+        )).scalar()
+        await session.commit()
+    if author is None:
+        return False
+    cache.responses.invalidate("posts", f"user:{author}", f"post:{id}")
+    return True
+
+
+@_variant_of(control.delete_posts)
+async def delete_posts(ids: list):
+    """Async control.delete_posts.
+    Returns the list of the ids of the deleted posts, ids without a post are left out."""
+    deleted = []
+    authors = set()
+    ids = list(dict.fromkeys(ids))
+    async with _write_session() as session:
+        for start in range(0, len(ids), DELETE_BATCH):
+            rows = (await session.execute(
+                delete(Post)
+                .where(Post.id.in_(ids[start:start + DELETE_BATCH]))
+                .returning(Post.id, Post.author)
+            )).all()
+            deleted.extend(row.id for row in rows)
+            authors.update(row.author for row in rows)
+        await session.commit()
+    if deleted:
+        cache.responses.invalidate(
+            "posts",
+            *(f"user:{author}" for author in authors),
+            *(f"post:{id}" for id in deleted)
+        )
+    return deleted
+
+
+@_variant_of(control.add_comment)
+async def add_comment(
+        author:str,
+        body:str,
+        post_id:int
+):
+    """Async control.add_comment.
+    Returns True if the comment has been added, False if there is no post with the id."""
+    now = datetime.datetime.now()
+    async with _write_session() as session:
+        touched = (await session.execute(_touch_post_query(post_id, now, comments=1))).rowcount
+        if not touched:
+            return False
+        session.add(Comment(
+            post_id=post_id,
+            author=escape(author),
+            body=escape(body),
+            date=now
+        ))
+        await session.commit()
+    cache.responses.invalidate(f"post:{post_id}")
+    return True
+
+
+@_variant_of(control.delete_comment)
+async def delete_comment(comment_id):
+    """Async control.delete_comment.
+    Returns True if the comment has been deleted, False if there is no comment with the id."""
+    async with _write_session() as session:
+        post_id = (await session.execute(
+            delete(Comment)
+            .where(Comment.id == comment_id)
+            .returning(Comment.post_id)
+        )).scalar()
+        if post_id is None:
+            await session.rollback()
+            return False
+        await session.execute(_touch_post_query(post_id, datetime.datetime.now(), comments=-1))
+        await session.commit()
+    cache.responses.invalidate(f"post:{post_id}")
+    return True
+
+
+@_variant_of(control.delete_comments)
+async def delete_comments(comment_ids: list):
+    """Async control.delete_comments.
+    Returns the list of the ids of the deleted comments, ids without a comment are left out."""
+    deleted = []
+    removed = {}
+    comment_ids = list(dict.fromkeys(comment_ids))
+    now = datetime.datetime.now()
+    async with _write_session() as session:
+        for start in range(0, len(comment_ids), DELETE_BATCH):
+            rows = (await session.execute(
+                delete(Comment)
+                .where(Comment.id.in_(comment_ids[start:start + DELETE_BATCH]))
+                .returning(Comment.id, Comment.post_id)
+            )).all()
+            deleted.extend(row.id for row in rows)
+            for row in rows:
+                if row.post_id is not None:
+                    removed[row.post_id] = removed.get(row.post_id, 0) + 1
+        if removed:
+            connection = await session.connection()
+            await connection.execute(
+                _uncount_comments_query(now),
+                [{"post_id": post_id, "removed": count} for post_id, count in removed.items()]
+            )
+        await session.commit()
+    if removed:
+        cache.responses.invalidate(*(f"post:{post_id}" for post_id in removed))
+    return deleted
+
+
+@_variant_of(control.edit_comment)
+async def edit_comment(comment_id, body):
+    """Async control.edit_comment.
+    Returns True if the comment has been edited, False if there is no comment with the id."""
+    now = datetime.datetime.now()
+    async with _write_session() as session:
+        post_id = (await session.execute(
+            update(Comment)
+            .where(Comment.id == comment_id)
+            .values(body=escape(body), date=now)
+            .returning(Comment.post_id)
+        )).scalar()
+        if post_id is None:
+            await session.rollback()
+            return False
+        await session.execute(_touch_post_query(post_id, now))
+        await session.commit()
+    cache.responses.invalidate(f"post:{post_id}")
+    return True
@@ -0,0 +1,87 @@
+"""
+Module for the async API endpoints of the blog app, served over ASGI (see the asgi module).
+The endpoints are the handlers of the handlers module, the same as the routes module, their
+db work is awaited with the async_control module, so slow requests (remote image checks,
+long listings) wait without holding a thread and many of them can be served by a single worker.
+The bulk /import-posts and /export-posts are only served by the WSGI app and the CLI.
+"""
+from quart import Blueprint, Response, current_app, request, jsonify, make_response
+from werkzeug.exceptions import BadRequest
+
+from . import async_control
+from . import handlers
+from . import metrics
+from . import profiler
+
+routes = Blueprint("async_routes", __name__)
+
+
+@routes.before_request
+async def _start_metrics():
+    """Start the metrics and the SQL profile of the request, see the metrics and profiler modules."""
+    metrics.start_request()
+    profiler.start_request()
+
+
+@routes.after_request
+async def _record_metrics(response):
+    """Record the metrics and the SQL profile of the request once its response is ready,
+    see the metrics and profiler modules."""
+    endpoint = request.url_rule.rule if request.url_rule else request.path
+    metrics.end_request(endpoint, request.method, response.status_code, response.content_length)
+    profiler.end_request(endpoint)
+    return response
+
+
+async def _body():
+    """Helper to get the JSON body of the request.
+    Returns the body, or handlers.NOT_JSON / handlers.INVALID_JSON."""
+    if not request.is_json:
+        return handlers.NOT_JSON
+    try:
+        return await request.get_json()
+    except BadRequest:
+        return handlers.INVALID_JSON
+
+
+async def _respond(reply):
+    """Helper to make the response of a Reply or Stream of a handler, see the handlers module.
+    Returns a Response."""
+    if isinstance(reply, handlers.Stream):
+        encoder = handlers.StreamEncoder(current_app.json.dumps, reply.ndjson)
+
+        async def generate():
+            async for post in reply.posts:
+                chunk = encoder.add(post)
+                if chunk:
+                    yield chunk.encode()
+            yield encoder.close().encode()
+
+        return Response(generate(), status=200, mimetype=reply.mimetype)
+
+    if isinstance(reply.body, str):
+        response = await make_response(reply.body, reply.status)
+        if reply.content_type:
+            response.content_type = reply.content_type
+    else:
+        response = await make_response(jsonify(reply.body), reply.status)
+    if reply.validators:
+        etag, last_modified = reply.validators
+        response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+    return response
+
+
+def _view(handler):
+    """Helper to make the view coroutine of a handler, its db work awaited with the async_control module.
+    Returns a coroutine function."""
+    async def view():
+        return await _respond(await handlers.run_async(handler, request, await _body(), async_control.VARIANTS))
+    view.__name__ = handler.__name__
+    view.__doc__ = handler.__doc__
+    return view
+
+
+for _rule, _methods, _handler in handlers.ENDPOINTS:
+    routes.add_url_rule(_rule, view_func=_view(_handler), methods=_methods)
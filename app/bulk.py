@@ -0,0 +1,172 @@
+"""
+Module for the bulk import and export of the posts and comments of the blog app.
+Posts are imported and exported as dicts, one per post with its comments:
+
+{
+    "id": int, optional on import, kept if given,
+    "author": str,
+    "title": str,
+    "subtitle": str,
+    "body": str,
+    "date": str, ISO 8601, optional on import (time of the import),
+    "img_url": str or null, optional, not validated on import,
+    "comments": [{"author": str, "body": str, "date": str, optional}], optional
+}
+
+An import is a single transaction, the posts and comments are inserted IMPORT_BATCH
+posts at a time with executemany inserts. Within a unit of work, the import joins it and
+is committed or rolled back with it (see the transaction module). The texts are stored
+as given, they are not escaped (an export already holds the escaped texts).
+"""
+import datetime
+from itertools import islice
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import selectinload
+
+from . import app
+from . import db
+from . import cache
+from . import transaction
+from .models import Post, Comment, make_excerpt
+
+
+# Number of posts inserted, or exported, at once.
+IMPORT_BATCH = 2000
+EXPORT_BATCH = 500
+
+
+def _parse_date(value, where: str):
+    """Helper to parse an optional ISO 8601 date of an imported record.
+    Returns a datetime, the current time if not given.
+    Raises ValueError if the date is not valid."""
+    if value is None:
+        return datetime.datetime.now()
+    if not isinstance(value, str):
+        raise ValueError(f"{where}: 'date' must be str.")
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{where}: 'date' is not a valid ISO 8601 date.") from None
+
+
+def _check_str(record: dict, param: str, where: str, optional: bool=False):
+    """Helper to check a str param of an imported record.
+    Raises ValueError if missing (and not optional) or not a str."""
+    if param not in record:
+        if optional:
+            return
+        raise ValueError(f"{where}: Missing param: '{param}'")
+    if not isinstance(record[param], str) and not (optional and record[param] is None):
+        raise ValueError(f"{where}: '{param}' must be str.")
+
+
+def _post_rows(record, number: int):
+    """Helper to convert an imported record to the rows of its post and comments.
+    Returns a tuple of (post row, list of comment rows).
+    Raises ValueError if the record is not valid."""
+    where = f"Post {number}"
+    if not isinstance(record, dict):
+        raise ValueError(f"{where}: must be an object.")
+    for param in ["author", "title", "subtitle", "body"]:
+        _check_str(record, param, where)
+    _check_str(record, "img_url", where, optional=True)
+    if "id" in record and not isinstance(record["id"], int):
+        raise ValueError(f"{where}: 'id' must be int.")
+    comments = record.get("comments") or []
+    if not isinstance(comments, list):
+        raise ValueError(f"{where}: 'comments' must be a list.")
+
+    date = _parse_date(record.get("date"), where)
+    comment_rows = []
+    for index, comment in enumerate(comments, start=1):
+        comment_where = f"{where}, comment {index}"
+        if not isinstance(comment, dict):
+            raise ValueError(f"{comment_where}: must be an object.")
+        _check_str(comment, "author", comment_where)
+        _check_str(comment, "body", comment_where)
+        comment_rows.append({
+            "author": comment["author"],
+            "body": comment["body"],
+            "date": _parse_date(comment.get("date"), comment_where),
+        })
+    post_row = {
+        "author": record["author"],
+        "title": record["title"],
+        "subtitle": record["subtitle"],
+        "body": record["body"],
+        "excerpt": make_excerpt(record["body"]),
+        "date": date,
+        "img_url": record.get("img_url"),
+        "version": 1,
+        "modified": max([date] + [comment["date"] for comment in comment_rows]),
+        "comment_count": len(comment_rows),
+    }
+    if "id" in record:
+        post_row["id"] = record["id"]
+    return post_row, comment_rows
+
+
+def import_posts(records):
+    """Insert the posts (with their comments) of an iterable of records in a single transaction.
+    Returns a tuple of (number of posts, number of comments) inserted.
+    Raises ValueError if a record is not valid, IntegrityError if a post is a duplicate
+    (title or id), nothing is inserted then: out of a unit of work the session is rolled
+    back, within a unit the rows are rolled back with the unit (the batch or the request
+    ending with the error)."""
+    records = iter(records)
+    posts = 0
+    comments = 0
+    with transaction.context():
+        try:
+            while True:
+                batch = list(islice(records, IMPORT_BATCH))
+                if not batch:
+                    break
+                rows = [_post_rows(record, posts + number) for number, record in enumerate(batch, start=1)]
+                ids = db.session.execute(
+                    insert(Post).returning(Post.id, sort_by_parameter_order=True),
+                    [post_row for post_row, _ in rows]
+                ).scalars().all()
+                comment_rows = []
+                for post_id, (_, post_comments) in zip(ids, rows):
+                    for comment in post_comments:
+                        comment["post_id"] = post_id
+                        comment_rows.append(comment)
+                if comment_rows:
+                    db.session.execute(insert(Comment), comment_rows)
+                posts += len(rows)
+                comments += len(comment_rows)
+            transaction.commit()
+        except Exception:
+            transaction.rollback()
+            raise
+    transaction.at_end(cache.responses.clear)
+    return posts, comments
+
+
+def export_posts():
+    """Iterate over every post with its comments, oldest id first, EXPORT_BATCH posts loaded
+    at a time. The records can be imported again with import_posts.
+    Yields dicts, see the module docstring."""
+    query = (
+        select(Post)
+        .options(selectinload(Post.comments))
+        .order_by(Post.id)
+        .execution_options(yield_per=EXPORT_BATCH)
+    )
+    with app.app_context():
+        for post in db.session.execute(query).scalars():
+            yield {
+                "id": post.id,
+                "author": post.author,
+                "title": post.title,
+                "subtitle": post.subtitle,
+                "body": post.body,
+                "date": post.date.isoformat(),
+                "img_url": post.img_url,
+                "comments": [
+                    {"author": comment.author, "body": comment.body, "date": comment.date.isoformat()}
+                    for comment in post.comments
+                ],
+            }
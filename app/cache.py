@@ -0,0 +1,110 @@
+"""
+Module for the in-process cache of the responses of the blog app.
+The results of the read functions of the control module are cached here, every
+entry is tagged with what it depends on ("posts", "user:<author>", "post:<id>"),
+the write functions of the control module invalidate the tags they change.
+
+The cache is per process only: it lives in the memory of a process, with several
+worker processes a write only invalidates the cache of the process handling it.
+So the entries of the posts are also keyed by the ETag of the posts they are made of
+(see control._cache_key), loaded from the db for every request anyway: after a write
+in an other process the ETag changes and the stale entries of this process are never
+served again, they are evicted by the LRU or expire after TTL seconds.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+# Max number of entries kept, and seconds an entry is trusted at most.
+MAXSIZE = 1024
+TTL = 60
+
+
+class ResponseCache:
+    """LRU cache with tag based invalidation and hit/miss counters."""
+
+    def __init__(self, maxsize: int=MAXSIZE, ttl: float=TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Get the cached value of the given key.
+        Returns a tuple of (found, value)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[2] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[0]
+            if entry:
+                self._drop(key)
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value, tags, generation: int):
+        """Store a value with the tags it depends on.
+        'generation' is the generation of the cache read before computing the value,
+        if anything has been invalidated since, the value may be stale and is not stored."""
+        with self._lock:
+            if generation != self.generation:
+                return
+            if key in self._entries:
+                self._drop(key)
+            tags = frozenset(tags)
+            self._entries[key] = (value, tags, time.monotonic() + self.ttl)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, *tags):
+        """Drop every entry tagged with any of the given tags."""
+        with self._lock:
+            self.generation += 1
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    if key in self._entries:
+                        self._drop(key)
+                        self.invalidations += 1
+
+    def clear(self):
+        """Drop every entry, the counters are kept."""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self):
+        """Get the counters of the cache.
+        Returns a dict."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+    def _drop(self, key):
+        """Helper to remove an entry and its tags, the lock must be held."""
+        _, tags, _ = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+responses = ResponseCache()
@@ -0,0 +1,134 @@
+"""
+Module for the maintenance commands of the blog app, run with the flask cli:
+
+    flask --app "app:init_app()" <command>
+"""
+import datetime
+import json
+import time
+
+import click
+from sqlalchemy import select, text
+from sqlalchemy.exc import IntegrityError
+
+from . import app
+from . import db
+from . import bulk
+from . import control
+from . import seed as seeding
+from .models import Comment
+
+
+def _hot_queries():
+    """Helper to build the queries the app runs most, with the index each should use.
+    Returns a dict of {name: (select, index name)}."""
+    cursor = control.encode_cursor({"date": datetime.datetime.now(), "id": 1})
+    return {
+        "get_posts": (
+            control._posts_query(num=10, page=2),
+            "ix_posts_date_id",
+        ),
+        "get_posts (cursor)": (
+            control._posts_query(num=10, after=cursor),
+            "ix_posts_date_id",
+        ),
+        "get_posts_by_user": (
+            control._posts_query(num=10, page=2, user="user"),
+            "ix_posts_author_date",
+        ),
+        "comments of a post": (
+            select(Comment).where(Comment.post_id == 1).order_by(Comment.date),
+            "ix_comments_post_id_date",
+        ),
+    }
+
+
+def explain_query(query):
+    """Get the SQLite query plan of the given select.
+    Must be called within an app context.
+    Returns the plan as a list of the 'detail' column of EXPLAIN QUERY PLAN."""
+    compiled = query.compile(db.engine, compile_kwargs={"literal_binds": True})
+    rows = db.session.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))
+    return [row.detail for row in rows]
+
+
+@app.cli.command("check-indexes")
+def check_indexes():
+    """Check that the hot queries use the secondary indexes according to EXPLAIN QUERY PLAN."""
+    failed = False
+    with app.app_context():
+        for name, (query, index) in _hot_queries().items():
+            plan = explain_query(query)
+            used = any(index in detail for detail in plan)
+            failed = failed or not used
+            click.echo(f"{'OK  ' if used else 'FAIL'} {name}: expected {index}")
+            for detail in plan:
+                click.echo(f"       {detail}")
+    if failed:
+        raise click.ClickException("Some queries do not use the expected index.")
+
+
+@app.cli.command("repair-comment-counts")
+def repair_comment_counts():
+    """Count the comments of every post again and fix the stored comment counts."""
+    fixed = control.repair_comment_counts()
+    click.echo(f"Fixed the comment count of {fixed} post(s).")
+
+
+@app.cli.command("rebuild-search-index")
+def rebuild_search_index():
+    """Rebuild the full-text search index of the posts, creating it if missing."""
+    if not control.rebuild_search_index():
+        raise click.ClickException("SQLite is built without FTS5, full-text search is not available.")
+    click.echo("Search index rebuilt.")
+
+
+@app.cli.command("import-posts")
+@click.argument("file", type=click.File("r", encoding="utf-8"))
+def import_posts(file):
+    """Import posts and comments from an NDJSON FILE (one post per line, - for stdin),
+    in a single transaction. See the bulk module for the format."""
+    records = (json.loads(line) for line in file if line.strip())
+    try:
+        posts, comments = bulk.import_posts(records)
+    except ValueError as err:
+        raise click.ClickException(f"Nothing imported. {err}")
+    except IntegrityError as err:
+        raise click.ClickException(f"Nothing imported, duplicate post: {err.orig}")
+    click.echo(f"Imported {posts} post(s) and {comments} comment(s).")
+
+
+@app.cli.command("export-posts")
+@click.argument("file", type=click.File("w", encoding="utf-8", lazy=False), default="-")
+def export_posts(file):
+    """Export every post with its comments to an NDJSON FILE (one post per line, - for stdout)."""
+    for record in bulk.export_posts():
+        file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+@app.cli.command("seed")
+@click.option("--posts", type=click.IntRange(min=1), default=100000, show_default=True, help="Posts to add.")
+@click.option("--comments", type=click.FloatRange(min=0), default=5, show_default=True,
+              help="Average number of comments per post.")
+@click.option("--authors", type=click.IntRange(min=1), default=1000, show_default=True, help="Number of authors.")
+@click.option("--processes", type=click.IntRange(min=1), default=1, show_default=True,
+              help="Processes making the data, the writes are made by this one.")
+@click.option("--seed", "random_seed", type=int, default=0, show_default=True,
+              help="Seed of the random generator, the same seed gives the same data.")
+@click.option("--rebuild-fts/--keep-fts", default=True, show_default=True,
+              help="Drop the full-text index trigger during the load and rebuild the index at the end.")
+def seed(posts, comments, authors, processes, random_seed, rebuild_fts):
+    """Add synthetic posts and comments to the db, after the existing posts, see the seed module."""
+    start = time.perf_counter()
+
+    def progress(added_posts, added_comments):
+        click.echo(f"{added_posts}/{posts} posts, {added_comments} comments written.", err=True)
+
+    added_posts, added_comments = seeding.seed(
+        posts, comments=comments, authors=authors, processes=processes,
+        seed=random_seed, rebuild_fts=rebuild_fts, progress=progress
+    )
+    click.echo(
+        f"Added {added_posts} post(s) and {added_comments} comment(s) "
+        f"in {time.perf_counter() - start:.1f}s."
+    )
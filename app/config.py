@@ -0,0 +1,110 @@
+"""
+Module for the settings of the blog app: app secret key, db name and email configuration.
+Nothing is read when the module is imported, every setting is read the first time it is
+asked for and cached for the life of the process.
+
+Every setting is looked up, in this order:
+    1. in the environment: BLOG_SECRET_KEY, BLOG_DB, BLOG_EMAIL, BLOG_EMAIL_KEY, BLOG_TO_EMAIL,
+    2. in a single file of "NAME=value" lines with the same names (blank lines and lines
+       starting with # are skipped), at BLOG_CONFIG_FILE or CONFIG_FILE by default,
+    3. in the legacy files of CONFIG_DIR: app.key (secret key), db.key (db name) and
+       email.key (email, email password and recipient email, a line each).
+"""
+import functools
+import os
+
+
+CONFIG_DIR = os.path.join("", "app", ".config")
+CONFIG_FILE = os.path.join(CONFIG_DIR, "blog.env")
+
+# Legacy file and line of every setting.
+_LEGACY = {
+    "BLOG_SECRET_KEY": ("app.key", 0),
+    "BLOG_DB": ("db.key", 0),
+    "BLOG_EMAIL": ("email.key", 0),
+    "BLOG_EMAIL_KEY": ("email.key", 1),
+    "BLOG_TO_EMAIL": ("email.key", 2),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _config_file():
+    """Helper to read the single config file, if any.
+    Returns a dict of the settings of the file, empty if there is no file."""
+    path = os.environ.get("BLOG_CONFIG_FILE", CONFIG_FILE)
+    settings = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#") or "=" not in line:
+                    continue
+                name, _, value = line.partition("=")
+                settings[name.strip()] = value.strip()
+    except FileNotFoundError:
+        pass
+    return settings
+
+
+@functools.lru_cache(maxsize=None)
+def _legacy_file(name: str):
+    """Helper to read the lines of a legacy config file of CONFIG_DIR.
+    Returns a list of the stripped lines, None if there is no such file."""
+    try:
+        with open(os.path.join(CONFIG_DIR, name)) as f:
+            return [line.strip() for line in f]
+    except FileNotFoundError:
+        return None
+
+
+def get(name: str):
+    """Get a setting, see the module docstring for where it is looked up.
+    Returns the value as a str.
+    Raises RuntimeError if the setting is found nowhere."""
+    if name in os.environ:
+        return os.environ[name]
+    settings = _config_file()
+    if name in settings:
+        return settings[name]
+    file, line = _LEGACY[name]
+    lines = _legacy_file(file)
+    if lines is not None:
+        # Missing lines are read as empty, the same as the files have always been read.
+        return lines[line] if line < len(lines) else ""
+    raise RuntimeError(
+        f"Missing setting {name}: set it in the environment, in the config file "
+        f"({os.environ.get('BLOG_CONFIG_FILE', CONFIG_FILE)}) or in {os.path.join(CONFIG_DIR, file)}."
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_app_key():
+    """Get the app key, loaded once.
+    Returns the key."""
+    key = get("BLOG_SECRET_KEY")
+    print("<SERVER><LOG> App key loaded.")
+    return key
+
+
+@functools.lru_cache(maxsize=None)
+def get_db():
+    """Get the db name, loaded once.
+    Returns the db."""
+    db = get("BLOG_DB")
+    print("<SERVER><LOG> Db config loaded.")
+    return db
+
+
+@functools.lru_cache(maxsize=None)
+def get_email_config():
+    """Get the email config, loaded once: the email, email password and recipient.
+    Returns a tuple of (email, email password, recipient email)."""
+    config = get("BLOG_EMAIL"), get("BLOG_EMAIL_KEY"), get("BLOG_TO_EMAIL")
+    print("<SERVER><LOG> Email config loaded.")
+    return config
+
+
+def clear():
+    """Forget the cached settings, the next ones asked for are read again."""
+    for function in (_config_file, _legacy_file, get_app_key, get_db, get_email_config):
+        function.cache_clear()
@@ -3,26 +3,37 @@ Module to interact with the db of the for the blog app.
 Contains the implementation of the CRUD for the models,
 and helper functions for validation and sending an email.
 Format and data validation is handled in the routes module.
+Every function commits its own changes, unless called within a unit of work (a request,
+or a batch): the changes of the unit are committed together, see the transaction module.
 """
+import base64
+import binascii
 import datetime
+import hashlib
+import json
 
 import re
 
 from html import escape
 
-import smtplib
 from email.message import EmailMessage
 
-import imghdr
-import requests
-
-from sqlalchemy import select, update
-from sqlalchemy.orm import joinedload
+from sqlalchemy import select, update, delete, bindparam, and_, or_, func, text, DateTime
+from sqlalchemy.orm import selectinload, aliased, defer
 
 from . import app
 from . import db
-from . import EMAIL, EMAIL_KEY, TO_EMAIL
-from .models import Post, Comment
+from .models import Post, Comment, make_excerpt
+from .serialize import PostDict
+from . import cache
+from . import images
+from . import mailer
+from . import migrations
+from . import transaction
+
+
+# Format of a valid email address.
+EMAIL_RE = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,7}\b')
 
 
 def validate_bool(param):
@@ -56,8 +67,7 @@ def validate_bool(param):
 def validate_email(email):
     """Check if the given email corresponds to the regex specified as a valid email format.
     Returns the email address or None if not a valid email address."""
-    exp = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,7}\b')
-    email = re.fullmatch(exp, email)
+    email = EMAIL_RE.fullmatch(email)
     if not email:
         return None
     return email.string
@@ -65,110 +75,397 @@ def validate_email(email):
 
 def validate_img_url(img_url):
     """Check if the given url corresponds to an image.
+    Only the start of the remote file is downloaded and the results are cached, see the
+    images module.
     Returns the type of the image if any, None if not an image.
     Raises MissingSchema if the given url is not a valid url format."""
-    img_type = imghdr.what("", requests.get(img_url, timeout=10).content)
+    img_type = images.check_img_url(img_url)
     return img_type
 
 
-def get_posts(num: int=0, page: int=1, comments: bool=False):
+# Words of a full-text search.
+WORD_RE = re.compile(r"\w+")
+# Number of posts the comments are loaded for in a single query, when limited per post.
+COMMENTS_BATCH = 500
+# Number of posts loaded at once when iterating over a listing (see iter_posts).
+STREAM_BATCH = 200
+# Number of ids deleted in a single statement by the batch deletes, below the SQLite variable limit.
+DELETE_BATCH = 500
+
+
+def encode_cursor(post: dict):
+    """Build an opaque cursor for keyset pagination from the 'date' and 'id' of a post dict.
+    Returns the cursor as an url safe string."""
+    raw = json.dumps([post["date"].isoformat(), post["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Decode a cursor made by encode_cursor.
+    Returns a tuple of (date, id).
+    Raises ValueError if the cursor is not a valid cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        date, id = json.loads(raw)
+        date = datetime.datetime.fromisoformat(date)
+    except (TypeError, ValueError, binascii.Error) as err:
+        raise ValueError("Invalid cursor.") from err
+    if not isinstance(id, int):
+        raise ValueError("Invalid cursor.")
+    return date, id
+
+
+def _posts_query(num: int=0, page: int=1, after: str=None, user: str=None, summary: bool=False):
+    """Helper to build the select for a listing of posts, newest first.
+    If 'after' is given the listing continues from the cursor (keyset pagination)
+    and 'page' is ignored, otherwise the listing is paginated with an offset.
+    If 'summary' is True the body of the posts is not loaded (accessing it raises).
+    Raises ValueError if 'after' is not a valid cursor."""
+    query = select(Post).order_by(Post.date.desc(), Post.id.desc())
+    if summary:
+        query = query.options(defer(Post.body, raiseload=True))
+    if user is not None:
+        query = query.where(Post.author == user)
+    if after is not None:
+        date, id = decode_cursor(after)
+        query = query.where(or_(Post.date < date, and_(Post.date == date, Post.id < id)))
+    if num:
+        query = query.limit(num)
+        if after is None:
+            query = query.offset((page - 1) * num)
+    return query
+
+
+def _cache_key(validators, *key):
+    """Helper to make the key of a response in the cache from what it depends on and the
+    validators of its posts (see _validators): a change made by an other process gives new
+    validators, so the entries made before it are not served, see the cache module.
+    Returns a tuple."""
+    return (*key, validators[0] if validators else None)
+
+
+def get_posts(
+        num: int=0,
+        page: int=1,
+        comments: bool=False,
+        after: str=None,
+        comments_limit: int=None,
+        summary: bool=False,
+        validators: tuple=None
+):
     """Get the posts from the db, depending on the given args as a list.
     num: the desired number of post to retrieve (if 0, get all posts). (>=0)
     page: pagination for the set of posts (if num not 0). Gives the offset for the querry. (>=1)
     comment: determines if the comments should be loaded for the posts, as a list.
-    Returns a list of post object representet as a dict or none if there are no posts."""
-    with app.app_context():
-        if not num:
-            if not comments:
-                posts = db.session.execute(
-                    select(Post)
-                    .order_by(Post.date.desc()),
-                    execution_options={"prebuffer_rows": True}
-                ).scalars().all()
-            else:
-                posts = db.session.execute(
-                    select(Post)
-                    .options(joinedload(Post.comments))
-                    .order_by(Post.date.desc()),
-                    execution_options={"prebuffer_rows": True}
-                ).scalars().unique()
+    after: cursor of the last post of the previous page, used instead of 'page' if given.
+    comments_limit: if given, only the newest comments_limit comments are loaded per post, and
+    the number of all comments of the post is added as 'comment_total'. (>=1)
+    summary: if True the body of the posts is not loaded, their 'excerpt' is given instead.
+    validators: the validators of the posts if already loaded (see get_posts_validators).
+    The comments of the posts are loaded with a single IN query for the whole page.
+    Returns a list of post object representet as a dict or none if there are no posts.
+    The result is cached, see the cache module and _cache_key.
+    Raises ValueError if 'after' is not a valid cursor."""
+    if validators is None:
+        validators = get_posts_validators(
+            num, page, comments, after, comments_limit=comments_limit, summary=summary
+        )
+    key = _cache_key(validators, "posts", num, page, comments, after, comments_limit, summary)
+    found, result = cache.responses.get(key)
+    if found:
+        return result
+    generation = cache.responses.generation
+    query = _posts_query(num=num, page=page, after=after, summary=summary)
+    if comments and not comments_limit:
+        query = query.options(selectinload(Post.comments))
+    with transaction.context():
+        posts = db.session.execute(
+            query,
+            execution_options={"prebuffer_rows": True}
+        ).scalars().all()
+        if comments and comments_limit and posts:
+            result = _posts_to_list(posts, summary=summary)
+            _add_newest_comments(result, comments_limit)
         else:
-            if not comments:
-                posts = db.session.execute(
-                    select(Post)
-                    .order_by(Post.date.desc())
-                    .limit(num)
-                    .offset((page - 1) * num),
-                    execution_options={"prebuffer_rows": True}
-                ).scalars().all()
-            else:
-                posts = db.session.execute(
-                    select(Post)
-                    .options(joinedload(Post.comments))
-                    .order_by(Post.date.desc())
-                    .limit(num)
-                    .offset((page - 1) * num),
-                    execution_options={"prebuffer_rows": True}
-                ).scalars().unique()
-    if not posts:
-        return None
-    return _posts_to_list(posts, comments)
+            result = _posts_to_list(posts, comments, summary) if posts else None
+    tags = ["posts"]
+    if result:
+        tags.extend(f"post:{post['id']}" for post in result)
+    cache.responses.set(key, result, tags, generation)
+    return result
 
 
-def _posts_to_list(posts: Post, comments: bool=False):
+def iter_posts(
+        num: int=0,
+        page: int=1,
+        comments: bool=False,
+        after: str=None,
+        comments_limit: int=None,
+        summary: bool=False,
+        user: str=None
+):
+    """Iterate over the posts of a listing, same params as get_posts and get_posts_by_user.
+    The posts are loaded STREAM_BATCH at a time (with their comments if any), so the memory
+    used does not grow with the number of posts. The listing is not cached.
+    Yields post objects representet as a dict.
+    Raises ValueError if 'after' is not a valid cursor (when the iteration starts)."""
+    query = _posts_query(num=num, page=page, after=after, user=user, summary=summary)
+    if comments and not comments_limit:
+        query = query.options(selectinload(Post.comments))
+    with transaction.context():
+        result = db.session.execute(
+            query.execution_options(yield_per=STREAM_BATCH)
+        ).scalars()
+        for batch in result.partitions():
+            posts = _posts_to_list(batch, comments and not comments_limit, summary)
+            if comments and comments_limit:
+                _add_newest_comments(posts, comments_limit)
+            yield from posts
+
+
+def has_posts(num: int=0, page: int=1, after: str=None, user: str=None):
+    """Check if a listing has any post, same params as get_posts and get_posts_by_user.
+    Returns bool.
+    Raises ValueError if 'after' is not a valid cursor."""
+    query = _posts_query(num=num, page=page, after=after, user=user)
+    with transaction.context():
+        first = db.session.execute(
+            query.with_only_columns(Post.id).limit(1)
+        ).first()
+    return first is not None
+
+
+def _newest_comments_query(ids: list, limit: int):
+    """Helper to build the select of the newest 'limit' comments of each of the posts of
+    the given ids, ordered by post and oldest first within a post."""
+    ranked = (
+        select(
+            Comment,
+            func.row_number()
+            .over(partition_by=Comment.post_id, order_by=(Comment.date.desc(), Comment.id.desc()))
+            .label("rank"),
+        )
+        .where(Comment.post_id.in_(ids))
+        .subquery()
+    )
+    newest = aliased(Comment, ranked)
+    return (
+        select(newest)
+        .where(ranked.c.rank <= limit)
+        .order_by(ranked.c.post_id, ranked.c.date, ranked.c.id)
+    )
+
+
+def _set_newest_comments(posts: list, comments: dict, limit: int):
+    """Helper to set the loaded newest comments (dict of post id to list of comment dicts)
+    and the number of all the comments as 'comment_total' on a list of post dicts."""
+    for post in posts:
+        post["comments"] = comments.get(post["id"], [])
+        post["comment_total"] = post["comment_count"]
+        if post.fragment_key:
+            post.fragment_key += ("newest", limit)
+
+
+def _add_newest_comments(posts: list, limit: int):
+    """Helper to add the newest 'limit' comments of each post (oldest first) and the number
+    of all its comments as 'comment_total' (same as 'comment_count') to a list of post dicts,
+    with one query per COMMENTS_BATCH posts.
+    Must be called within an app context."""
+    comments = {}
+    for start in range(0, len(posts), COMMENTS_BATCH):
+        ids = [post["id"] for post in posts[start:start + COMMENTS_BATCH]]
+        rows = db.session.execute(_newest_comments_query(ids, limit)).scalars()
+        for comment in rows:
+            comments.setdefault(comment.post_id, []).append(comment.to_dict())
+    _set_newest_comments(posts, comments, limit)
+
+
+def _post_dict(post: Post, comments: bool=False, summary: bool=False):
+    """Helper to convert a Post object to a dict carrying the key of its encoded JSON, see the
+    serialize module. The key holds the modification time of the post along with its id and
+    version: SQLite reuses the id of a deleted post and a new post starts at version 1 again.
+    Returns a PostDict."""
+    return PostDict(post.to_dict(comments, summary), (post.id, post.version, post.modified, comments, summary))
+
+
+def _posts_to_list(posts: Post, comments: bool=False, summary: bool=False):
     """Helper to convert an iterable set of Post objects to a dict and collect them in a list.
+    The dicts carry the key of their encoded JSON, see _post_dict.
     Returns a list of dict, empty list if there are no Posts."""
-    result = []
-    for post in posts:
-        result.append(post.to_dict(comments))
-    return result
+    return [_post_dict(post, comments, summary) for post in posts]
 
 
 #TODO decision, body {{img}} tag handling in backed or frontend
-def get_post(id):
+def get_post(id, validators: tuple=None):
     """Get a single post from the db based on the id.
     When getting a specific post, the comments are loaded automatically.
-    Returns a dict or None if there is no post by the given id."""
-    with app.app_context():
+    validators: the validators of the post if already loaded (see get_post_validators).
+    Returns a dict or None if there is no post by the given id.
+    The result is cached, see the cache module and _cache_key."""
+    if validators is None:
+        validators = get_post_validators(id)
+    key = _cache_key(validators, "post", id)
+    found, result = cache.responses.get(key)
+    if found:
+        return result
+    generation = cache.responses.generation
+    with transaction.context():
         post = db.session.execute(
             select(Post)
-            .options(joinedload(Post.comments))
+            .options(selectinload(Post.comments))
             .where(Post.id == id)
         ).scalar()
-    if not post:
-        return None
-    return post.to_dict(comm=True)
+        result = _post_dict(post, comments=True) if post else None
+    cache.responses.set(key, result, [f"post:{id}"], generation)
+    return result
 
 
-def get_posts_by_user(user, num: int=0, page: int=1):
+def get_posts_by_user(
+        user,
+        num: int=0,
+        page: int=1,
+        after: str=None,
+        summary: bool=False,
+        validators: tuple=None
+):
     """Get all posts made by a specif user as a list.
     num: the desired number of post to retrieve (if 0, get all posts). (>=0)
     page: pagination for the set of posts (if num not 0). Gives the offset for the querry. (>=1)
-    Returns a list of post object representet as a dict or none if there are no posts."""
-    with app.app_context():
-        if not num:
-            posts = db.session.execute(
-                select(Post)
-                .where(Post.author == user)
-                .order_by(Post.date.desc()),
-                execution_options={"prebuffer_rows": True}
-            ).scalars()
-        else:
-            posts = db.session.execute(
-                select(Post)
-                .where(Post.author == user)
-                .order_by(Post.date.desc())
-                .limit(num)
-                .offset((page - 1) * num),
-                execution_options={"prebuffer_rows": True}
-            ).scalars()
-    if not posts:
+    after: cursor of the last post of the previous page, used instead of 'page' if given.
+    summary: if True the body of the posts is not loaded, their 'excerpt' is given instead.
+    validators: the validators of the posts if already loaded (see get_posts_validators).
+    Returns a list of post object representet as a dict or none if there are no posts.
+    The result is cached, see the cache module and _cache_key.
+    Raises ValueError if 'after' is not a valid cursor."""
+    if validators is None:
+        validators = get_posts_validators(num, page, after=after, user=user, summary=summary)
+    key = _cache_key(validators, "user", user, num, page, after, summary)
+    found, result = cache.responses.get(key)
+    if found:
+        return result
+    generation = cache.responses.generation
+    query = _posts_query(num=num, page=page, after=after, user=user, summary=summary)
+    with transaction.context():
+        posts = db.session.execute(
+            query,
+            execution_options={"prebuffer_rows": True}
+        ).scalars().all()
+        result = _posts_to_list(posts=posts, comments=False, summary=summary) if posts else None
+    tags = [f"user:{user}"]
+    if result:
+        tags.extend(f"post:{post['id']}" for post in result)
+    cache.responses.set(key, result, tags, generation)
+    return result
+
+
+def _validators(rows, *key, listing: bool=False):
+    """Helper to build the validators of a response from the (id, version, modified) rows
+    of the posts it is made of. The key is the rest of what the response depends on.
+    The modification time is part of the version of a post, the same as in the key of its
+    JSON fragment (see _post_dict): a new post may have the id and version of a deleted one.
+    listing: True for a listing, it has no last modified time: the posts moving in or out
+    of a page when an other post is created or deleted keep their modification time,
+    only the ETag tells the page has changed.
+    Returns a tuple of (etag, last modified time in UTC or None) or None if there are no rows."""
+    if not rows:
         return None
-    return _posts_to_list(posts=posts, comments=False)
+    versions = [(row.id, row.version, row.modified) for row in rows]
+    etag = hashlib.sha1(repr((key, versions)).encode()).hexdigest()
+    if listing:
+        return etag, None
+    last_modified = max(row.modified for row in rows)
+    return etag, last_modified.astimezone(datetime.timezone.utc).replace(microsecond=0)
+
+
+def get_posts_validators(
+        num: int=0,
+        page: int=1,
+        comments: bool=False,
+        after: str=None,
+        user: str=None,
+        comments_limit: int=None,
+        summary: bool=False,
+        cursor: bool=False
+):
+    """Get the validators of a listing of posts, same params as get_posts and
+    get_posts_by_user: the ETag only, see _validators. Only the id, version and
+    modification time of the posts are loaded.
+    cursor: True for a listing with cursor pagination, its response is not the plain list of
+    posts (the first page has no 'after', the same posts as the first page of the offset pagination).
+    Returns a tuple of (etag, None) or None if there are no posts.
+    Raises ValueError if 'after' is not a valid cursor."""
+    query = _posts_query(num=num, page=page, after=after, user=user)
+    with transaction.context():
+        rows = db.session.execute(
+            query.with_only_columns(Post.id, Post.version, Post.modified)
+        ).all()
+    return _validators(rows, "posts", cursor, comments, num, after, comments_limit, summary, listing=True)
+
+
+def get_post_validators(id):
+    """Get the validators (ETag and Last-Modified) of a single post, with its comments.
+    Returns a tuple of (etag, last modified time in UTC) or None if there is no post by the given id."""
+    with transaction.context():
+        rows = db.session.execute(
+            select(Post.id, Post.version, Post.modified)
+            .where(Post.id == id)
+        ).all()
+    return _validators(rows, "post")
+
+
+def _match_query(query: str):
+    """Helper to make an FTS5 query from the words of a search: every word must match,
+    the words are quoted so the FTS5 query syntax of the search is ignored.
+    Returns the query as a str.
+    Raises ValueError if the search has no words."""
+    words = WORD_RE.findall(query)
+    if not words:
+        raise ValueError("No words to search for.")
+    return " ".join(f'"{word}"' for word in words)
+
+
+def _search_query(query: str, num: int, page: int):
+    """Helper to build the full-text search of the posts, ranked with bm25.
+    Returns a tuple of (statement, params).
+    Raises ValueError if the search has no words."""
+    stmt = text(
+        "SELECT posts.id, posts.author, posts.title, posts.subtitle, posts.date, posts.img_url, "
+        "posts.comment_count, "
+        "snippet(posts_fts, -1, '<mark>', '</mark>', '…', 24) AS snippet "
+        "FROM posts_fts JOIN posts ON posts.id = posts_fts.rowid "
+        "WHERE posts_fts MATCH :match "
+        "ORDER BY bm25(posts_fts, 10.0, 5.0, 1.0) "
+        "LIMIT :limit OFFSET :offset"
+    ).columns(date=DateTime)
+    return stmt, {"match": _match_query(query), "limit": num, "offset": (page - 1) * num}
+
+
+def search_posts(query: str, num: int=10, page: int=1):
+    """Search the posts by title, subtitle and body, with the full-text index of the posts.
+    The results are ranked with bm25, a match in the title weighs more than one in the
+    subtitle, which weighs more than one in the body.
+    num: the desired number of results to retrieve. (>=1)
+    page: pagination for the results. Gives the offset for the querry. (>=1)
+    Returns a list of dict (the post without its body, with a 'snippet' of the matching text)
+    or None if there are no results.
+    Raises ValueError if the search has no words, OperationalError if the index is not available."""
+    stmt, params = _search_query(query, num, page)
+    with transaction.context():
+        rows = db.session.execute(stmt, params).mappings().all()
+    if not rows:
+        return None
+    return [dict(row) for row in rows]
 
 
-def send_contact_email(name, email, message):
-    """Send an email to according to the email config, with the given contents."""
+def get_cache_stats():
+    """Get the hit and miss counters of the response cache.
+    Returns a dict."""
+    return cache.responses.stats()
+
+
+def _contact_message(name, email, message):
+    """Helper to build the contact email with the given contents.
+    Returns an EmailMessage."""
     msg = EmailMessage()
     msg["Subject"] = "TEST Our Blog message"
     msg["From"] = "me"
@@ -184,12 +481,15 @@ you have received a mail from {name} {email} !
 "
 """
     )
+    return msg
 
-    # TODO the sending of the mail has been commented out, no email will be sent
-    # with smtplib.SMTP("smtp.gmail.com", port=587) as smtp:
-    #     smtp.starttls()
-    #     smtp.login(EMAIL, EMAIL_KEY)
-    #     smtp.sendmail(EMAIL, TO_EMAIL, msg.as_string())
+
+def send_contact_email(name, email, message):
+    """Queue an email to send according to the email config, with the given contents.
+    The email is sent in the background, see the mailer module.
+    Returns the id of the queued email."""
+    msg = _contact_message(name, email, message)
+    return mailer.enqueue(msg)
 
 
 def add_post(
@@ -201,17 +501,23 @@ def add_post(
 ):
     """Create a new record for a post in the db, with the given params.
     Date is determined by the time of execution."""
-    with app.app_context():
+    now = datetime.datetime.now()
+    with transaction.context():
         post = Post(
             author=author,
             title=title,
             subtitle=subtitle,
             body=body,
-            date=datetime.datetime.now(),
-            img_url=img_url
+            excerpt=make_excerpt(body),
+            date=now,
+            img_url=img_url,
+            version=1,
+            modified=now
         )
         db.session.add(post)
-        db.session.commit()
+        transaction.commit()
+        id = post.id
+    transaction.invalidate("posts", f"user:{author}", f"post:{id}")
 
 
 def update_post(
@@ -222,32 +528,75 @@ def update_post(
         img_url:str=None
 ):
     """Update an existing post with the given params based on the id.
-    Date is updated to the time of execution."""
+    Date is updated to the time of execution, the version of the post is bumped.
+    Returns True if the post has been updated, False if there is no post with the id."""
     if img_url:
         img_url = escape(img_url)
-    with app.app_context():
-        db.session.execute(
-            update(Post),[{
-                "id": id,
-                "title": escape(title),
-                "subtitle": escape(subtitle),
-                "body": escape(body),
-                "date":datetime.datetime.now(),
-                "img_url": img_url,
-            }]
-        )
-        db.session.commit()
+    with transaction.context():
+        now = datetime.datetime.now()
+        author = db.session.execute(
+            update(Post)
+            .where(Post.id == id)
+            .values(
+                title=escape(title),
+                subtitle=escape(subtitle),
+                body=escape(body),
+                excerpt=make_excerpt(escape(body)),
+                date=now,
+                img_url=img_url,
+                version=Post.version + 1,
+                modified=now,
+            )
+            .returning(Post.author)
+        ).scalar()
+        if author is None:
+            return False
+        transaction.commit()
+    transaction.invalidate("posts", f"user:{author}", f"post:{id}")
+    return True
 
 
 def delete_post(id):
-    """Delete a post from the db based on id."""
-    with app.app_context():
-        to_delete = db.session.execute(
-            select(Post)
+    """Delete a post from the db based on id, with a single statement.
+    The comments of the post are deleted by the db (ON DELETE CASCADE).
+    Returns True if the post has been deleted, False if there is no post with the id."""
+    with transaction.context():
+        author = db.session.execute(
+            delete(Post)
             .where(Post.id == id)
+            .returning(Post.author)
         ).scalar()
-        db.session.delete(to_delete)
-        db.session.commit()
+        transaction.commit()
+    if author is None:
+        return False
+    transaction.invalidate("posts", f"user:{author}", f"post:{id}")
+    return True
+
+
+def delete_posts(ids: list):
+    """Delete the posts with the given ids from the db in a single transaction,
+    DELETE_BATCH posts per statement. The comments of the posts are deleted by the db.
+    Returns the list of the ids of the deleted posts, ids without a post are left out."""
+    deleted = []
+    authors = set()
+    ids = list(dict.fromkeys(ids))
+    with transaction.context():
+        for start in range(0, len(ids), DELETE_BATCH):
+            rows = db.session.execute(
+                delete(Post)
+                .where(Post.id.in_(ids[start:start + DELETE_BATCH]))
+                .returning(Post.id, Post.author)
+            ).all()
+            deleted.extend(row.id for row in rows)
+            authors.update(row.author for row in rows)
+        transaction.commit()
+    if deleted:
+        transaction.invalidate(
+            "posts",
+            *(f"user:{author}" for author in authors),
+            *(f"post:{id}" for id in deleted)
+        )
+    return deleted
 
 
 def add_comment(
@@ -256,38 +605,152 @@ def add_comment(
         post_id:int
 ):
     """Create a new record for a comment in the db, with the given params.
-    Date is determined by the time of execution."""
-    with app.app_context():
+    Date is determined by the time of execution, the version of the post is bumped.
+    Returns True if the comment has been added, False if there is no post with the id."""
+    now = datetime.datetime.now()
+    with transaction.context():
+        touched = db.session.execute(_touch_post_query(post_id, now, comments=1)).rowcount
+        if not touched:
+            return False
         comment = Comment(
             post_id=post_id,
             author=escape(author),
             body=escape(body),
-            date=datetime.datetime.now()
+            date=now
         )
         db.session.add(comment)
-        db.session.commit()
+        transaction.commit()
+    transaction.invalidate(f"post:{post_id}")
+    return True
 
 
 def delete_comment(comment_id):
-    """Delete a comment from the db based on id."""
-    with app.app_context():
-        to_delete = db.session.execute(
-            select(Comment)
+    """Delete a comment from the db based on id with a single statement,
+    the version of the post is bumped.
+    Returns True if the comment has been deleted, False if there is no comment with the id."""
+    with transaction.context():
+        post_id = db.session.execute(
+            delete(Comment)
             .where(Comment.id == comment_id)
+            .returning(Comment.post_id)
         ).scalar()
-        db.session.delete(to_delete)
-        db.session.commit()
+        if post_id is None:
+            return False
+        _touch_post(post_id, datetime.datetime.now(), comments=-1)
+        transaction.commit()
+    transaction.invalidate(f"post:{post_id}")
+    return True
+
+
+def _uncount_comments_query(now: datetime.datetime):
+    """Helper to build the Core update of the posts losing comments, to execute with
+    one {"post_id", "removed"} parameter set per post: the number of comments is lowered
+    by "removed" and the version of the post is bumped."""
+    posts = Post.__table__
+    return (
+        update(posts)
+        .where(posts.c.id == bindparam("post_id"))
+        .values(
+            version=posts.c.version + 1,
+            modified=now,
+            comment_count=posts.c.comment_count - bindparam("removed")
+        )
+    )
+
+
+def delete_comments(comment_ids: list):
+    """Delete the comments with the given ids from the db in a single transaction,
+    DELETE_BATCH comments per statement. The versions and number of comments of
+    their posts are updated with one statement per batch.
+    Returns the list of the ids of the deleted comments, ids without a comment are left out."""
+    deleted = []
+    removed = {}
+    comment_ids = list(dict.fromkeys(comment_ids))
+    now = datetime.datetime.now()
+    with transaction.context():
+        for start in range(0, len(comment_ids), DELETE_BATCH):
+            rows = db.session.execute(
+                delete(Comment)
+                .where(Comment.id.in_(comment_ids[start:start + DELETE_BATCH]))
+                .returning(Comment.id, Comment.post_id)
+            ).all()
+            deleted.extend(row.id for row in rows)
+            for row in rows:
+                if row.post_id is not None:
+                    removed[row.post_id] = removed.get(row.post_id, 0) + 1
+        if removed:
+            # Core executemany, the ORM would take it for a bulk update by primary key.
+            db.session.connection().execute(
+                _uncount_comments_query(now),
+                [{"post_id": post_id, "removed": count} for post_id, count in removed.items()]
+            )
+        transaction.commit()
+    if removed:
+        transaction.invalidate(*(f"post:{post_id}" for post_id in removed))
+    return deleted
 
 
 def edit_comment(comment_id, body):
     """Update an existing comment with the given params based on the id.
-    Date is updated to the time of execution."""
+    Date is updated to the time of execution, the version of the post is bumped.
+    Returns True if the comment has been edited, False if there is no comment with the id."""
+    now = datetime.datetime.now()
+    with transaction.context():
+        post_id = db.session.execute(
+            update(Comment)
+            .where(Comment.id == comment_id)
+            .values(body=escape(body), date=now)
+            .returning(Comment.post_id)
+        ).scalar()
+        if post_id is None:
+            return False
+        _touch_post(post_id, now)
+        transaction.commit()
+    transaction.invalidate(f"post:{post_id}")
+    return True
+
+
+def _touch_post_query(post_id: int, now: datetime.datetime, comments: int=0):
+    """Helper to build the update bumping the version and setting the modification time of
+    a post, 'comments' is added to the number of comments of the post."""
+    return (
+        update(Post)
+        .where(Post.id == post_id)
+        .values(version=Post.version + 1, modified=now, comment_count=Post.comment_count + comments)
+    )
+
+
+def _touch_post(post_id: int, now: datetime.datetime, comments: int=0):
+    """Helper to bump the version and set the modification time of a post, when it or its
+    comments change. 'comments' is added to the number of comments of the post.
+    Must be called within the session of the change, before the commit."""
+    db.session.execute(_touch_post_query(post_id, now, comments))
+
+
+def rebuild_search_index():
+    """Rebuild the full-text index of the posts from the posts, creating it if missing.
+    Returns True if the index is available, False if SQLite is built without FTS5."""
     with app.app_context():
-        db.session.execute(
-            update(Comment),[{
-                "id": comment_id,
-                "body": escape(body),
-                "date":datetime.datetime.now()
-            }]
-        )
-        db.session.commit()
+        with db.engine.begin() as conn:
+            return migrations.rebuild_search_index(conn)
+
+
+def repair_comment_counts():
+    """Count the comments of every post again and fix the stored 'comment_count' where it
+    differs, the version and modification time of the fixed posts are updated.
+    Returns the number of posts fixed."""
+    now = datetime.datetime.now()
+    counts = (
+        select(func.count(Comment.id))
+        .where(Comment.post_id == Post.id)
+        .scalar_subquery()
+    )
+    with transaction.context():
+        fixed = db.session.execute(
+            update(Post)
+            .where(Post.comment_count != counts)
+            .values(comment_count=counts, version=Post.version + 1, modified=now)
+        ).rowcount
+        transaction.commit()
+    transaction.at_end(cache.responses.clear)
+    return fixed
@@ -0,0 +1,142 @@
+"""
+Module for the SQLite engine profile of the blog app.
+Every connection is set up with the pragmas of the profile (WAL journal, synchronous,
+cache and mmap sizes, busy timeout). The writes go through a single writer connection,
+so they are serialized by the pool instead of failing with "database is locked",
+while the GET requests read through a pool of read-only connections, which WAL lets
+run alongside the writer.
+The profile is configured with the 'SQLITE_*' keys of the app config, see DEFAULTS,
+'SQLITE_ENGINE_PROFILE' = False leaves the engine of Flask-SQLAlchemy as it is.
+"""
+from flask import has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+# Bind key of the engine of the read-only connections.
+READER = "reader"
+# Methods of the requests read through the reader engine.
+READ_METHODS = ("GET", "HEAD")
+
+DEFAULTS = {
+    "SQLITE_ENGINE_PROFILE": True,
+    "SQLITE_JOURNAL_MODE": "WAL",
+    # NORMAL is durable in WAL mode, except for the last commits on a power loss.
+    "SQLITE_SYNCHRONOUS": "NORMAL",
+    # Negative: size in KiB, per connection.
+    "SQLITE_CACHE_SIZE": -16000,
+    "SQLITE_MMAP_SIZE": 256 * 1024 * 1024,
+    # Milliseconds a connection waits for a lock of an other process before failing.
+    "SQLITE_BUSY_TIMEOUT": 5000,
+    # Read-only connections kept open, and opened on top of them when all are in use.
+    "SQLITE_POOL_SIZE": 8,
+    "SQLITE_MAX_OVERFLOW": 8,
+    # Seconds a request waits for a free connection, the writer included.
+    "SQLITE_POOL_TIMEOUT": 30,
+    "SQLITE_READERS": True,
+}
+
+
+class RoutingSession(Session):
+    """Session of the app, sends the queries of the GET requests to the read-only engine
+    while nothing has been changed in the session. Everything else (other requests,
+    CLI commands, background threads) uses the default engine, the writer."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and has_request_context()
+            and request.method in READ_METHODS
+            and not (self.new or self.dirty or self.deleted)
+        ):
+            reader = self._db.engines.get(READER)
+            if reader is not None:
+                return reader
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _is_memory(url):
+    """Helper to check if a db url is of an in-memory SQLite db.
+    Returns a bool."""
+    return url.database in (None, "", ":memory:") or url.query.get("mode") == "memory"
+
+
+def configure(app):
+    """Set the engine options of Flask-SQLAlchemy from the profile, must be called before
+    db.init_app(app). The missing 'SQLITE_*' keys of the config are set to the DEFAULTS.
+    The writer keeps a single connection, the reader engine is added as the READER bind
+    of the same db file opened read-only."""
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    if not app.config["SQLITE_ENGINE_PROFILE"]:
+        return
+    url = make_url(app.config["SQLALCHEMY_DATABASE_URI"])
+    if _is_memory(url):
+        return
+
+    options = app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {})
+    options.setdefault("pool_size", 1)
+    options.setdefault("max_overflow", 0)
+    options.setdefault("pool_timeout", app.config["SQLITE_POOL_TIMEOUT"])
+
+    if app.config["SQLITE_READERS"]:
+        database = url.database
+        if database.startswith("file:"):
+            database = database[len("file:"):]
+        reader = url.set(
+            database=f"file:{database}",
+            query={**url.query, "mode": "ro", "uri": "true"}
+        )
+        app.config.setdefault("SQLALCHEMY_BINDS", {})[READER] = {
+            "url": reader.render_as_string(hide_password=False),
+            "pool_size": app.config["SQLITE_POOL_SIZE"],
+            "max_overflow": app.config["SQLITE_MAX_OVERFLOW"],
+            "pool_timeout": app.config["SQLITE_POOL_TIMEOUT"],
+        }
+
+
+def _pragmas(app, writer: bool):
+    """Helper to make the connect listener setting the pragmas of the profile on
+    the new connections of an engine. The journal mode is only set by the writer.
+    Returns the listener."""
+    pragmas = [
+        f"PRAGMA synchronous = {app.config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA cache_size = {int(app.config['SQLITE_CACHE_SIZE'])}",
+        f"PRAGMA mmap_size = {int(app.config['SQLITE_MMAP_SIZE'])}",
+        f"PRAGMA busy_timeout = {int(app.config['SQLITE_BUSY_TIMEOUT'])}",
+    ]
+    if writer:
+        pragmas.insert(0, f"PRAGMA journal_mode = {app.config['SQLITE_JOURNAL_MODE']}")
+    else:
+        pragmas.append("PRAGMA query_only = ON")
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return set_pragmas
+
+
+def setup_engine(app, engine, writer: bool=True):
+    """Set the pragmas of the profile on the new connections of the given engine,
+    the sync_engine of an AsyncEngine included."""
+    if not app.config["SQLITE_ENGINE_PROFILE"]:
+        return
+    if engine.dialect.name != "sqlite" or _is_memory(engine.url):
+        return
+    event.listen(engine, "connect", _pragmas(app, writer))
+
+
+def setup(app, db):
+    """Set the pragmas of the profile on the connections of the engines of the db,
+    must be called after db.init_app(app), before the first connection."""
+    if not app.config["SQLITE_ENGINE_PROFILE"]:
+        return
+    with app.app_context():
+        for key, engine in db.engines.items():
+            setup_engine(app, engine, writer=key != READER)
+    print("<SERVER><LOG> SQLite engine profile set.")
@@ -0,0 +1,924 @@
+"""
+Module for the API endpoints of the blog app, shared by the WSGI app (routes module) and
+the ASGI app (async_routes module), so both serve the same requests and responses.
+Requires JSON format for every request, the response is sent in JSON format as well.
+The requests are validated with the schemas of the schemas module.
+
+Errors are represented in a list in JSON format as:
+{
+    "error": [<error message>]
+}
+
+The read endpoints (/get-posts, /get-post, /get-posts-by-user) send an ETag header and
+answer If-None-Match with 304 Not Modified. /get-post sends a Last-Modified header too and
+answers If-Modified-Since, the listings do not: creating or deleting a post moves other
+posts between the pages without changing them, only the ETag of a page tells.
+
+Every endpoint is a handler, registered with the endpoint decorator, called with the request
+and its JSON body (or NOT_JSON / INVALID_JSON). A handler does no I/O: it asks for the db work
+by yielding a Call of a function of the control module, run as is by the routes module, or
+awaited by the async_routes module as its variant of the async_control module. The
+result is sent back into the handler, or the error raised into it. A handler returns a Reply,
+or a Stream of posts, turned into a response by the app serving it.
+"""
+import inspect
+
+from requests.exceptions import MissingSchema
+from sqlalchemy.exc import IntegrityError, OperationalError, SQLAlchemyError
+
+from . import control
+from . import metrics
+from . import profiler
+from . import schemas
+
+
+# Size in characters of the chunks sent by the streamed listings.
+STREAM_CHUNK = 64 * 1024
+
+# Body of a request that is not JSON, or not valid JSON.
+NOT_JSON = object()
+INVALID_JSON = object()
+
+# The (rule, methods, handler) of every endpoint, in order of registration.
+ENDPOINTS = []
+
+
+class Call:
+    """Db work asked for by a handler: 'function' of the control module called with the given
+    arguments, or its variant of the async_control module (see async_control.VARIANTS)."""
+    __slots__ = ("function", "args", "kwargs")
+
+    def __init__(self, function, /, *args, **kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+
+
+class Reply:
+    """Response of a handler: 'body' sent as JSON, or as is if a str (with 'content_type'
+    if given), with the ETag and Last-Modified headers of 'validators' if given."""
+    __slots__ = ("body", "status", "validators", "content_type")
+
+    def __init__(self, body, status: int=200, validators: tuple=None, content_type: str=None):
+        self.body = body
+        self.status = status
+        self.validators = validators
+        self.content_type = content_type
+
+
+class Stream:
+    """Streamed response of a handler: the posts of an iterable (an async iterable for the
+    ASGI app) sent as a JSON array, or as NDJSON (one post per line), see StreamEncoder."""
+    __slots__ = ("posts", "ndjson")
+
+    def __init__(self, posts, ndjson: bool=False):
+        self.posts = posts
+        self.ndjson = ndjson
+
+    @property
+    def mimetype(self):
+        return "application/x-ndjson" if self.ndjson else "application/json"
+
+
+class StreamEncoder:
+    """Encoder of the posts of a Stream in chunks of about STREAM_CHUNK characters,
+    each post encoded with the given 'dumps' (the one of the JSON provider of the app)."""
+
+    def __init__(self, dumps, ndjson: bool=False):
+        self._dumps = dumps
+        self._ndjson = ndjson
+        self._parts = [] if ndjson else ["["]
+        self._size = 0
+        self._first = True
+
+    def add(self, post):
+        """Add a post.
+        Returns the chunk to send if one is full, None otherwise."""
+        part = self._dumps(post)
+        if self._ndjson:
+            part += "\n"
+        elif not self._first:
+            part = "," + part
+        self._first = False
+        self._parts.append(part)
+        self._size += len(part)
+        if self._size < STREAM_CHUNK:
+            return None
+        chunk = "".join(self._parts)
+        self._parts = []
+        self._size = 0
+        return chunk
+
+    def close(self):
+        """Returns the last chunk to send."""
+        if not self._ndjson:
+            self._parts.append("]")
+        return "".join(self._parts)
+
+
+def endpoint(rule: str, methods: list=None):
+    """Decorator registering a handler for the given url rule and methods (GET by default)."""
+    def register(handler):
+        ENDPOINTS.append((rule, methods or ["GET"], handler))
+        return handler
+    return register
+
+
+def run(handler, request, body):
+    """Run a handler, its calls are made with the functions of the control module.
+    Returns the Reply or Stream of the handler."""
+    steps = handler(request, body)
+    if not inspect.isgenerator(steps):
+        return steps
+    result, raised = None, None
+    while True:
+        try:
+            call = steps.throw(raised) if raised is not None else steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            result, raised = call.function(*call.args, **call.kwargs), None
+        except Exception as err:
+            result, raised = None, err
+
+
+async def run_async(handler, request, body, variants: dict):
+    """Run a handler, its calls are awaited with the coroutines of 'variants' by function of the
+    control module (async_control.VARIANTS), the ones returning an async iterable are called as is.
+    Returns the Reply or Stream of the handler."""
+    steps = handler(request, body)
+    if not inspect.isgenerator(steps):
+        return steps
+    result, raised = None, None
+    while True:
+        try:
+            call = steps.throw(raised) if raised is not None else steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            result, raised = variants[call.function](*call.args, **call.kwargs), None
+            if inspect.isawaitable(result):
+                result = await result
+        except Exception as err:
+            result, raised = None, err
+
+
+def error(message: str, status: int=400):
+    """Helper to make the Reply of an error.
+    Returns a Reply."""
+    return Reply({"error": [message]}, status)
+
+
+def load(schema, body, values: bool=True):
+    """Validate the JSON body of a request with the given schema, see the schemas module.
+    values: if False, only the presence and the types of the fields are checked, the handler
+    checks the values with schema.validate_values, along with checks of its own.
+    Returns a tuple of the validated request (a dict) and an error Reply, one of them is None."""
+    if body is NOT_JSON:
+        return None, error("Request must be in JSON format.")
+    if body is INVALID_JSON:
+        return None, error("Invalid JSON format.")
+    errors = schema.validate(body) if values else schema.validate_shape(body)
+    if errors:
+        return None, Reply({"error": errors}, 400)
+    return body, None
+
+
+def not_modified(request, validators):
+    """Check the If-None-Match and If-Modified-Since headers of the request against the
+    validators (etag, last modified time) of the response, for the conditional GETs.
+    If-Modified-Since is ignored if the response has no last modified time (the listings).
+    Returns a 304 Reply if the copy of the client is still valid, None otherwise."""
+    if not validators:
+        return None
+    etag, last_modified = validators
+    if request.if_none_match:
+        if not request.if_none_match.contains(etag):
+            return None
+    elif (
+        last_modified is None
+        or not request.if_modified_since
+        or request.if_modified_since < last_modified
+    ):
+        return None
+    return Reply("", 304, validators)
+
+
+@endpoint("/")
+def home(request, body):
+    return Reply("Home is where the heart is.")
+
+
+@endpoint("/get-posts", methods=["GET"])
+def get_posts(request, body):
+    """Get posts from the db.
+    GET Request:
+
+    {
+        "num": int (>=0), the desired number of post to retrieve (if 0, get all posts),
+        "page": int  (>=1), pagination for the set of posts (if num not 0). Gives the offset for the querry,
+        "comments": bool, determines if the comments should be loaded for the posts, as a list. Empty list if False.
+        "comments_limit": int (>=1), optional, only the newest comments_limit comments are loaded per post,
+            the number of all the comments of a post is added as "comment_total".
+        "summary": bool, optional, if true the posts have an "excerpt" (<= 300 characters) instead of the "body".
+        "stream": bool, optional, if true the posts are streamed with a flat memory use, for large listings ("num": 0).
+        "format": "json" or "ndjson", optional, format of the streamed posts, a JSON array or one post per line.
+    }
+
+    Cursor (keyset) pagination, "after" is given instead of "page":
+
+    {
+        "num": int (>=0), the desired number of post to retrieve (if 0, get all posts),
+        "after": str or null, the "next_cursor" of the previous response, null for the first page,
+        "comments": bool, determines if the comments should be loaded for the posts, as a list. Empty list if False.
+    }
+
+    Response:
+
+    [
+        {
+            "id": int,
+            "author": str,
+            "title": str,
+            "subtitle": str,
+            "body": str,
+            "date": datetime,
+            "img_url": str,
+            "comments": list of dict,
+            "comment_count": int,
+            "comment_total": int, same as "comment_count", only if "comments_limit" is given
+        },
+        {...},
+        {...},
+    ]
+
+    Cursor pagination response:
+
+    {
+        "posts": [{...}, {...}],
+        "next_cursor": str or null, cursor for the next page, null if there are no more posts.
+    }
+
+    Streamed responses are the plain list of posts (no "next_cursor"), or one post per line for "ndjson".
+    """
+    req, err = load(schemas.GET_POSTS, body)
+    if err:
+        return err
+    cursor_mode = "after" in req
+
+    if req["stream"]:
+        try:
+            found = yield Call(control.has_posts, num=req["num"], page=req["page"], after=req.get("after"))
+        except ValueError:
+            return error("'after' is not a valid cursor.")
+        if not found:
+            return error("There are no posts.", 404)
+        posts = yield Call(
+            control.iter_posts,
+            num=req["num"],
+            page=req["page"],
+            comments=req["comments"],
+            after=req.get("after"),
+            comments_limit=req["comments_limit"],
+            summary=req["summary"],
+        )
+        return Stream(posts, ndjson=req["format"] == "ndjson")
+
+    try:
+        validators = yield Call(
+            control.get_posts_validators,
+            num=req["num"],
+            page=req["page"],
+            comments=req["comments"],
+            after=req.get("after"),
+            comments_limit=req["comments_limit"],
+            summary=req["summary"],
+            cursor=cursor_mode,
+        )
+    except ValueError:
+        return error("'after' is not a valid cursor.")
+    unchanged = not_modified(request, validators)
+    if unchanged:
+        return unchanged
+
+    if cursor_mode:
+        posts = yield Call(
+            control.get_posts,
+            num=req["num"],
+            comments=req["comments"],
+            after=req["after"],
+            comments_limit=req["comments_limit"],
+            summary=req["summary"],
+            validators=validators,
+        )
+        if not posts:
+            return error("There are no more posts.", 404)
+        next_cursor = None
+        if req["num"] and len(posts) == req["num"]:
+            next_cursor = control.encode_cursor(posts[-1])
+        return Reply({"posts": posts, "next_cursor": next_cursor}, 200, validators)
+
+    posts = yield Call(
+        control.get_posts,
+        num=req["num"],
+        page=req["page"],
+        comments=req["comments"],
+        comments_limit=req["comments_limit"],
+        summary=req["summary"],
+        validators=validators,
+    )
+    if not posts:
+        if req["num"] != 0 and req["page"] != 1:
+            return error(f"There are no posts in the range of num: {req['num']}, page: {req['page']}", 404)
+        return error("There are no posts.", 404)
+    return Reply(posts, 200, validators)
+
+
+@endpoint("/get-post", methods=["GET"])
+def get_post(request, body):
+    """Get post from the db.
+    GET Request:
+
+    {
+        "id": int (>=1), the id of the desired post to retrieve.
+    }
+
+    Response:
+
+    {
+        "id": int,
+        "author": str,
+        "title": str,
+        "subtitle": str,
+        "body": str,
+        "date": datetime,
+        "img_url": str,
+        "comments": list of dict,
+        "comment_count": int
+    }
+    """
+    req, err = load(schemas.POST_ID, body)
+    if err:
+        return err
+    validators = yield Call(control.get_post_validators, req["id"])
+    unchanged = not_modified(request, validators)
+    if unchanged:
+        return unchanged
+    post = yield Call(control.get_post, req["id"], validators=validators)
+    if not post:
+        return error(f"There are no posts with the id of {req['id']}.", 404)
+    return Reply(post, 200, validators)
+
+
+@endpoint("/get-posts-by-user", methods=["GET"])
+def get_posts_by_user(request, body):
+    """Get post made by a user from the db.
+    GET Request:
+
+    {
+        "user": str, the author of posts to retrieve,
+        "num": int (>=0), the desired number of post to retrieve (if 0, get all posts),
+        "page": int  (>=1), pagination for the set of posts (if num not 0). Gives the offset for the querry,
+        "summary": bool, optional, if true the posts have an "excerpt" (<= 300 characters) instead of the "body".
+        "stream": bool, optional, if true the posts are streamed with a flat memory use, for large listings ("num": 0).
+        "format": "json" or "ndjson", optional, format of the streamed posts, a JSON array or one post per line.
+    }
+
+    Cursor (keyset) pagination, "after" is given instead of "page":
+
+    {
+        "user": str, the author of posts to retrieve,
+        "num": int (>=0), the desired number of post to retrieve (if 0, get all posts),
+        "after": str or null, the "next_cursor" of the previous response, null for the first page,
+    }
+
+    Response:
+
+    [
+        {
+            "id": int,
+            "author": str,
+            "title": str,
+            "subtitle": str,
+            "body": str,
+            "date": datetime,
+            "img_url": str,
+            "comments": list of dict,
+            "comment_count": int
+        },
+        {...},
+        {...},
+    ]
+
+    Cursor pagination response:
+
+    {
+        "posts": [{...}, {...}],
+        "next_cursor": str or null, cursor for the next page, null if there are no more posts.
+    }
+
+    Streamed responses are the plain list of posts (no "next_cursor"), or one post per line for "ndjson".
+    """
+    req, err = load(schemas.GET_POSTS_BY_USER, body)
+    if err:
+        return err
+    cursor_mode = "after" in req
+
+    if req["stream"]:
+        try:
+            found = yield Call(
+                control.has_posts, num=req["num"], page=req["page"], after=req.get("after"), user=req["user"]
+            )
+        except ValueError:
+            return error("'after' is not a valid cursor.")
+        if not found:
+            return error(f"There is no post made by {req['user']}.", 404)
+        posts = yield Call(
+            control.iter_posts,
+            num=req["num"], page=req["page"], after=req.get("after"), summary=req["summary"], user=req["user"]
+        )
+        return Stream(posts, ndjson=req["format"] == "ndjson")
+
+    try:
+        validators = yield Call(
+            control.get_posts_validators,
+            num=req["num"],
+            page=req["page"],
+            after=req.get("after"),
+            user=req["user"],
+            summary=req["summary"],
+            cursor=cursor_mode,
+        )
+    except ValueError:
+        return error("'after' is not a valid cursor.")
+    unchanged = not_modified(request, validators)
+    if unchanged:
+        return unchanged
+
+    if cursor_mode:
+        posts = yield Call(
+            control.get_posts_by_user,
+            user=req["user"],
+            num=req["num"],
+            after=req["after"],
+            summary=req["summary"],
+            validators=validators,
+        )
+        if not posts:
+            return error(f"There are no more posts made by {req['user']}.", 404)
+        next_cursor = None
+        if req["num"] and len(posts) == req["num"]:
+            next_cursor = control.encode_cursor(posts[-1])
+        return Reply({"posts": posts, "next_cursor": next_cursor}, 200, validators)
+
+    posts = yield Call(
+        control.get_posts_by_user,
+        user=req["user"],
+        num=req["num"],
+        page=req["page"],
+        summary=req["summary"],
+        validators=validators,
+    )
+    if not posts:
+        if req["num"] != 0 and req["page"] != 1:
+            return error(
+                f"There is no post made by {req['user']} in the range of num: {req['num']}, page: {req['page']}", 404
+            )
+        return error(f"There is no post made by {req['user']}.", 404)
+    return Reply(posts, 200, validators)
+
+
+@endpoint("/contact", methods=["POST"])
+def contact(request, body):
+    """Send a contact email according to the email config with the given contents.
+    POST Request:
+
+    {
+        "name": str (>=2), the author of posts to retrieve,
+        "email": str, valid email address,
+        "message": str (>=2), body of the message to be sent
+    }
+
+    Response:
+
+    {
+        "success": ["Email successfully queued."]
+    }
+
+    The email is sent in the background, the response is sent as soon as it is queued.
+    """
+    req, err = load(schemas.CONTACT, body)
+    if err:
+        return err
+    yield Call(control.send_contact_email, name=req["name"], email=req["email"], message=req["message"])
+    return Reply({"success": ["Email successfully queued."]}, 200)
+
+
+@endpoint("/search", methods=["GET"])
+def search(request, body):
+    """Full-text search of the posts, by title, subtitle and body, best matches first.
+    GET Request:
+
+    {
+        "query": str (>=2), the words to search for, every word must match,
+        "num": int (>=1), the desired number of results to retrieve,
+        "page": int (>=1), pagination for the results. Gives the offset for the querry.
+    }
+
+    Response:
+
+    [
+        {
+            "id": int,
+            "author": str,
+            "title": str,
+            "subtitle": str,
+            "date": datetime,
+            "img_url": str,
+            "comment_count": int,
+            "snippet": str, the matching text, the matches are marked with <mark></mark>
+        },
+        {...},
+        {...},
+    ]
+    """
+    req, err = load(schemas.SEARCH, body)
+    if err:
+        return err
+    try:
+        posts = yield Call(control.search_posts, req["query"], num=req["num"], page=req["page"])
+    except ValueError:
+        return error("'query' must contain at least one word.")
+    except OperationalError:
+        return error("Search is not available.", 503)
+    if not posts:
+        return error(f"There are no posts matching '{req['query']}'.", 404)
+    return Reply(posts, 200)
+
+
+@endpoint("/cache-stats", methods=["GET"])
+def cache_stats(request, body):
+    """Get the counters of the response cache, to size it.
+    Response:
+
+    {
+        "size": int, number of cached responses,
+        "maxsize": int, max number of cached responses,
+        "hits": int,
+        "misses": int,
+        "hit_ratio": float,
+        "invalidations": int, number of responses dropped by writes
+    }
+    """
+    return Reply(control.get_cache_stats(), 200)
+
+
+@endpoint("/metrics", methods=["GET"])
+def get_metrics(request, body):
+    """Get the metrics of the requests handled by the process, in the Prometheus text format
+    (not JSON), see the metrics module."""
+    return Reply(metrics.registry.render(), 200, content_type=metrics.CONTENT_TYPE)
+
+
+@endpoint("/debug/sql-profile", methods=["GET", "DELETE"])
+def sql_profile(request, body):
+    """Get the SQL profile of the process, or reset it with DELETE, see the profiler module.
+    Only served if the 'SQL_PROFILER' config is True.
+    Response:
+
+    {
+        "statements": [
+            {
+                "statement": str, SQL with the lists of parameters shortened to "?, ...",
+                "count": int,
+                "total_ms": float,
+                "avg_ms": float,
+                "max_ms": float,
+                "slow": int, number of runs slower than 'SQL_SLOW_MS'
+            }
+        ], the slowest statements by total time,
+        "slow": [
+            {
+                "statement": str,
+                "params": str,
+                "executemany": bool,
+                "ms": float,
+                "plan": [str], output of EXPLAIN QUERY PLAN,
+                "at": float, unix time
+            }
+        ], the last slow statements,
+        "n_plus_one": [
+            {
+                "endpoint": str,
+                "statement": str,
+                "requests": int, number of requests running it at least 'SQL_NPLUS1_THRESHOLD' times,
+                "max_count": int
+            }
+        ]
+    }
+    """
+    if not profiler.enabled():
+        return error("SQL profiler is not enabled.", 404)
+    if request.method == "DELETE":
+        profiler.profile.clear()
+        return Reply({"success": ["SQL profile reset."]}, 200)
+    return Reply(profiler.profile.report(), 200)
+
+
+@endpoint("/about")
+def about(request, body):
+    return Reply("about")
+
+
+def _check_img_url(img_url):
+    """Helper, check the img_url of a post, see control.validate_img_url.
+    Returns the list of the errors, yielded as a step of a handler."""
+    errors = []
+    try:
+        if not (yield Call(control.validate_img_url, img_url)):
+            errors.append("'img_url' is not a valid url for an image.")
+    except MissingSchema:
+        errors.append("'img_url' is not a valid url.")
+    return errors
+
+
+@endpoint("/create-post", methods=["POST"])
+def create_post(request, body):
+    """Create a post in the db.
+    POST Request:
+    {
+        "author": str (>=2), name of the user creating the post,
+        "title": str (>=5), title of the post,
+        "subtitle": str (>=5), subtitle of the post,
+        "body": str (>=5), body of the post, will be escaped, use {{img}} {{/img}} tag to insert images.
+        "img_url": str (>=2), url of an img to display as the backgroud/header for the post
+    }
+
+    Response:
+
+    {
+        "success": ["Post has been added sucessfully."]
+    }
+    """
+    req, err = load(schemas.CREATE_POST, body, values=False)
+    if err:
+        return err
+
+    errors = schemas.CREATE_POST.validate_values(req)
+    errors += yield from _check_img_url(req["img_url"])
+    if errors:
+        return Reply({"error": errors}, 400)
+
+    try:
+        yield Call(
+            control.add_post,
+            author=req["author"], title=req["title"], subtitle=req["subtitle"], body=req["body"], img_url=req["img_url"]
+        )
+    except IntegrityError as integrity_error:
+        return Reply({"error": integrity_error.args})
+
+    return Reply({"success": ["Post has been added sucessfully."]}, 200)
+
+
+@endpoint("/update-post", methods=["GET", "PATCH"])
+def update_post(request, body):
+    """Update a post in the db based on the id.
+    GET Request:
+
+    {
+        "id": int (>=1), the id of the desired post to retrieve.
+    }
+
+    Response:
+
+    {
+        "id": int,
+        "author": str,
+        "title": str,
+        "subtitle": str,
+        "body": str,
+        "date": datetime,
+        "img_url": str,
+        "comments": list of dict,
+        "comment_count": int
+    }
+
+
+    PATCH Request:
+
+    {
+        "id": int (>=1), id of the post to update,
+        "title": str (>=5), title of the post,
+        "subtitle": str (>=5), subtitle of the post,
+        "body": str (>=5), body of the post, will be escaped, use {{img}} {{/img}} tag to insert images.
+        "img_url": str (>=2), url of an img to display as the backgroud/header for the post
+    }
+
+    Response:
+
+    {
+        "success": ["Post has been updated sucessfully."]
+    }
+    """
+    if request.method == "GET":
+        req, err = load(schemas.POST_ID, body)
+        if err:
+            return err
+        post = yield Call(control.get_post, req["id"])
+        if not post:
+            return error(f"There are no posts with the id of {req['id']}.", 404)
+        return Reply(post, 200)
+
+    req, err = load(schemas.UPDATE_POST, body, values=False)
+    if err:
+        return err
+
+    errors = schemas.UPDATE_POST.validate_values(req)
+    if req["img_url"]:
+        errors += yield from _check_img_url(req["img_url"])
+    if errors:
+        return Reply({"error": errors}, 400)
+
+    try:
+        updated = yield Call(
+            control.update_post,
+            id=req["id"],
+            title=req["title"],
+            subtitle=req["subtitle"],
+            body=req["body"],
+            img_url=req["img_url"]
+        )
+    except IntegrityError as integrity_error:
+        return Reply({"error": integrity_error.args})
+    if not updated:
+        return error(f"There is no post with the 'id' of {req['id']}.", 404)
+
+    return Reply({"success": ["Post has been updated sucessfully."]}, 200)
+
+
+@endpoint("/delete-post", methods=["DELETE"])
+def delete_post(request, body):
+    """Delete a post based on id.
+    DELETE Request:
+
+    {
+        "id": int (>=1), the id of the desired post to delete.
+    }
+
+    Response:
+
+    {
+        "success": ["Post with id: <id> has been deleted sucessfully."]
+    }
+    """
+    req, err = load(schemas.POST_ID, body)
+    if err:
+        return err
+    if not (yield Call(control.delete_post, req["id"])):
+        return error(f"There is no post with the 'id' of {req['id']}.", 404)
+    return Reply({"success": [f"Post with id: {req['id']} has been deleted sucessfully."]}, 200)
+
+
+@endpoint("/delete-posts", methods=["DELETE"])
+def delete_posts(request, body):
+    """Delete many posts, with their comments, based on ids in a single transaction.
+    DELETE Request:
+
+    {
+        "ids": [int (>=1), ...], the ids of the posts to delete.
+    }
+
+    Response:
+
+    {
+        "success": ["<n> posts have been deleted sucessfully."],
+        "deleted": [int, ...], the ids of the deleted posts,
+        "missing": [int, ...], the ids without a post.
+    }
+    """
+    req, err = load(schemas.DELETE_POSTS, body)
+    if err:
+        return err
+    ids = req["ids"]
+    deleted = yield Call(control.delete_posts, ids)
+    found = set(deleted)
+    return Reply({
+        "success": [f"{len(deleted)} posts have been deleted sucessfully."],
+        "deleted": deleted,
+        "missing": [id for id in dict.fromkeys(ids) if id not in found]
+    }, 200)
+
+
+@endpoint("/add-comment", methods=["POST"])
+def add_comment(request, body):
+    """Add comment to a post.
+    POST Request:
+    {
+        "author": str (>=2), name of the user creating the comment,
+        "body": str (>=5), body of the post, will be escaped.
+        "post_id": int (>=1), the id of the post the comment belongs to
+    }
+
+    Response:
+
+    {
+        "success": ["Comment added successfully."]
+    }
+    """
+    req, err = load(schemas.ADD_COMMENT, body)
+    if err:
+        return err
+    try:
+        added = yield Call(control.add_comment, req["author"], req["body"], req["post_id"])
+    except SQLAlchemyError as db_error:
+        return Reply({"error": db_error.args})
+    if not added:
+        return error(f"There is no post with the 'post_id' of {req['post_id']}.", 404)
+    return Reply({"success": "Comment added successfully."}, 200)
+
+
+@endpoint("/delete-comment", methods=["DELETE"])
+def delete_comment(request, body):
+    """Delete a comment based on id.
+    DELETE Request:
+
+    {
+        "comment_id": int (>=1), the id of the desired comment to delete.
+    }
+
+    Response:
+
+    {
+        "success": ["Comment deleted successfully."]
+    }
+    """
+    req, err = load(schemas.COMMENT_ID, body)
+    if err:
+        return err
+    try:
+        deleted = yield Call(control.delete_comment, req["comment_id"])
+    except SQLAlchemyError as db_error:
+        return Reply({"error": db_error.args})
+    if not deleted:
+        return error(f"There is no comment with the 'comment_id' of {req['comment_id']}.", 404)
+    return Reply({"success": "Comment deleted successfully."}, 200)
+
+
+@endpoint("/delete-comments", methods=["DELETE"])
+def delete_comments(request, body):
+    """Delete many comments based on ids in a single transaction.
+    DELETE Request:
+
+    {
+        "comment_ids": [int (>=1), ...], the ids of the comments to delete.
+    }
+
+    Response:
+
+    {
+        "success": ["<n> comments have been deleted successfully."],
+        "deleted": [int, ...], the ids of the deleted comments,
+        "missing": [int, ...], the ids without a comment.
+    }
+    """
+    req, err = load(schemas.DELETE_COMMENTS, body)
+    if err:
+        return err
+    ids = req["comment_ids"]
+    try:
+        deleted = yield Call(control.delete_comments, ids)
+    except SQLAlchemyError as db_error:
+        return Reply({"error": db_error.args})
+    found = set(deleted)
+    return Reply({
+        "success": [f"{len(deleted)} comments have been deleted successfully."],
+        "deleted": deleted,
+        "missing": [id for id in dict.fromkeys(ids) if id not in found]
+    }, 200)
+
+
+@endpoint("/edit-comment", methods=["PATCH"])
+def edit_comment(request, body):
+    """Update a comment based on id.
+    PATCH Request:
+    {
+        "comment_id": int (>=1), id of the comment to update,
+        "body": str (>=5), body of the comment, will be escaped.
+    }
+
+    Response:
+
+    {
+        "success": ["Comment edited successfully."]
+    }
+    """
+    req, err = load(schemas.EDIT_COMMENT, body)
+    if err:
+        return err
+    try:
+        edited = yield Call(control.edit_comment, comment_id=req["comment_id"], body=req["body"])
+    except SQLAlchemyError as db_error:
+        return Reply({"error": db_error.args})
+    if not edited:
+        return error(f"There is no comment with the 'comment_id' of {req['comment_id']}.", 404)
+    return Reply({"success": "Comment edited successfully."}, 200)
@@ -0,0 +1,246 @@
+"""
+Module to check if a remote url points to an image for the blog app.
+Only the first bytes of the remote file are requested (Range header), which is enough to
+tell the type of the image from its magic bytes. The HTTP connections are pooled in a single
+session shared by the app: a connection only goes back to the pool once its response is read
+to the end, so the short responses are drained and only the connections of the servers sending
+a large file anyway are closed.
+
+The results of the checks are cached by normalized url, in memory and, if the
+'IMG_CACHE_PERSIST' config of the app is True, in the 'img_checks' table of the db.
+The stored results are read through the reader engine if any, so a check made by a request
+does not hold the writer connection during the download, and written within the unit of
+work if in one (see the transaction module).
+"""
+import datetime
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit
+
+import imghdr
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from . import app
+from . import db
+from . import metrics
+from . import transaction
+from .engine import READER
+from .models import ImgCheck
+
+
+# Number of bytes read from the start of the remote file to detect the image type.
+SNIFF_BYTES = 4096
+# Images larger than this (according to Content-Length) are rejected without reading them.
+MAX_IMG_BYTES = 10 * 1024 * 1024
+# Responses with at most this many bytes are read to the end, their connection is reused.
+DRAIN_BYTES = 64 * 1024
+# Headers of the requests of the checks: the first SNIFF_BYTES of the file, not compressed.
+SNIFF_HEADERS = {"Accept-Encoding": "identity", "Range": f"bytes=0-{SNIFF_BYTES - 1}"}
+# Timeouts in seconds, for connecting, between two reads and for the whole check.
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 5
+DEADLINE = 10
+# Size of the connection pool of the session, per host.
+POOL_SIZE = 10
+# Max number of urls kept in the memory cache, and how long (in seconds) an image
+# and a not image result is trusted.
+CACHE_SIZE = 4096
+CACHE_TTL = 24 * 60 * 60
+CACHE_NEGATIVE_TTL = 10 * 60
+
+
+def _new_session():
+    """Helper to create the pooled HTTP session used for the checks.
+    Returns a requests.Session."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+session = _new_session()
+
+
+def _file_size(response):
+    """Helper to get the size of the remote file from the headers of the response, the total
+    of the Content-Range of a partial response, else the Content-Length.
+    Returns an int or None if unknown."""
+    if response.status_code == 206:
+        total = response.headers.get("Content-Range", "").rpartition("/")[2]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get("Content-Length")
+    return int(length) if length and length.isdigit() else None
+
+
+def _is_small(response):
+    """Helper to check if the body of a response is small enough to be read to its end
+    (a Content-Length of at most DRAIN_BYTES).
+    Returns bool."""
+    length = response.headers.get("Content-Length")
+    return bool(length and length.isdigit() and int(length) <= DRAIN_BYTES)
+
+
+def _drain(response, deadline: float):
+    """Helper to read the rest of a small response to its end, so its connection goes back
+    to the pool of the session when it is closed, instead of being closed. Stops at the deadline."""
+    if not _is_small(response):
+        return
+    while time.monotonic() <= deadline and response.raw.read1(DRAIN_BYTES):
+        pass
+
+
+def sniff_img_type(img_url):
+    """Download the start of the file at the given url and detect the type of the image.
+    Only the first SNIFF_BYTES are requested (the servers ignoring the Range header send the
+    whole file, only SNIFF_BYTES of it are used). The download is limited to DEADLINE seconds
+    in total (checked between reads, a single read may take up to READ_TIMEOUT), files larger
+    than MAX_IMG_BYTES are not downloaded at all.
+    Returns the type of the image if any, None if not an image, too large, not reachable
+    or the deadline has been exceeded.
+    Raises MissingSchema if the given url is not a valid url format."""
+    deadline = time.monotonic() + DEADLINE
+    try:
+        with session.get(
+            img_url,
+            stream=True,
+            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+            headers=SNIFF_HEADERS,
+        ) as response:
+            if not response.ok:
+                _drain(response, deadline)
+                return None
+            size = _file_size(response)
+            if size is not None and size > MAX_IMG_BYTES:
+                return None
+            head = b""
+            while len(head) < SNIFF_BYTES:
+                if time.monotonic() > deadline:
+                    return None
+                # read1 returns what has arrived so far instead of waiting for the full amount.
+                chunk = response.raw.read1(SNIFF_BYTES - len(head))
+                if not chunk:
+                    break
+                head += chunk
+            _drain(response, deadline)
+    except requests.exceptions.MissingSchema:
+        raise
+    except requests.exceptions.RequestException:
+        return None
+    return imghdr.what("", head[:SNIFF_BYTES])
+
+
+def normalize_url(img_url):
+    """Normalize the given url for the cache: lowercase scheme and host, no default port
+    and no fragment.
+    Returns the url as a str."""
+    parts = urlsplit(img_url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, netloc.rpartition(":")[2]) in (("http", "80"), ("https", "443")):
+        netloc = netloc.rpartition(":")[0]
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+class ValidationCache:
+    """LRU cache of the results of the image url checks, with separate time to live for
+    images and for not images."""
+
+    def __init__(self, maxsize: int=CACHE_SIZE, ttl: int=CACHE_TTL, negative_ttl: int=CACHE_NEGATIVE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _ttl_of(self, img_type):
+        """Helper to get the time to live for a result."""
+        return self.ttl if img_type else self.negative_ttl
+
+    def get(self, url):
+        """Get the cached result for a normalized url, from memory or from the db.
+        Returns a tuple of (found, img_type)."""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry:
+                img_type, expires = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(url)
+                    return True, img_type
+                del self._entries[url]
+        if not app.config.get("IMG_CACHE_PERSIST", False):
+            return False, None
+        row = self._load(url)
+        if not row:
+            return False, None
+        age = (datetime.datetime.now() - row.checked).total_seconds()
+        img_type = row.img_type
+        if age >= self._ttl_of(img_type):
+            return False, None
+        self._remember(url, img_type, self._ttl_of(img_type) - age)
+        return True, img_type
+
+    def _load(self, url):
+        """Helper to read the stored result of a normalized url, through the reader engine
+        if any: the session of a unit of work would take the writer connection and hold it
+        until the end of the unit, the download of the image included.
+        Returns the (img_type, checked) row, None if not stored."""
+        query = select(ImgCheck.img_type, ImgCheck.checked).where(ImgCheck.url == url)
+        with transaction.context():
+            reader = db.engines.get(READER)
+            if reader is None:
+                return db.session.execute(query).first()
+            with reader.connect() as connection:
+                return connection.execute(query).first()
+
+    def set(self, url, img_type):
+        """Store the result of the check of a normalized url."""
+        self._remember(url, img_type, self._ttl_of(img_type))
+        if not app.config.get("IMG_CACHE_PERSIST", False):
+            return
+        with transaction.context():
+            values = {"url": url, "img_type": img_type, "checked": datetime.datetime.now()}
+            db.session.execute(
+                insert(ImgCheck)
+                .values(values)
+                .on_conflict_do_update(index_elements=[ImgCheck.url], set_=values)
+            )
+            transaction.commit()
+
+    def _remember(self, url, img_type, ttl):
+        """Helper to store a result in memory, evicting the least recently used one if full."""
+        with self._lock:
+            self._entries[url] = (img_type, time.monotonic() + ttl)
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every result kept in memory."""
+        with self._lock:
+            self._entries.clear()
+
+
+cache = ValidationCache()
+
+
+def check_img_url(img_url):
+    """Detect the type of the image at the given url, using the cached result if any.
+    A cached result costs no network traffic.
+    Returns the type of the image if any, None if not an image.
+    Raises MissingSchema if the given url is not a valid url format."""
+    url = normalize_url(img_url)
+    found, img_type = cache.get(url)
+    if found:
+        return img_type
+    start = time.perf_counter()
+    try:
+        img_type = sniff_img_type(img_url)
+    finally:
+        metrics.record_img_fetch(time.perf_counter() - start)
+    cache.set(url, img_type)
+    return img_type
@@ -0,0 +1,222 @@
+"""
+Module for sending the emails of the blog app in the background.
+Mails are stored in the 'outbox' table of the db when queued, so the request
+handlers never wait for the SMTP server. A background thread drains the outbox
+reusing one authenticated SMTP connection for many mails, failed mails are
+retried with an exponential backoff.
+
+The SMTP server is taken from the config of the app:
+MAIL_SERVER (default "smtp.gmail.com"), MAIL_PORT (default 587),
+MAIL_STARTTLS (default True) and MAIL_LOGIN (default True), set the last two to
+False to test against a local SMTP stand-in (e.g. aiosmtpd).
+
+The sender only runs in the processes serving requests, started by start(), so the CLI
+commands and the scripts queue their mails without sending them.
+"""
+import datetime
+import smtplib
+import threading
+import time
+
+from sqlalchemy import select, update
+
+from . import app
+from . import db
+from . import transaction
+from .config import get_email_config
+from .models import OutboxMail
+
+
+# Seconds between two looks at the outbox when nothing wakes the sender up.
+POLL_INTERVAL = 30
+# Number of mails claimed from the outbox at once.
+BATCH_SIZE = 50
+# A mail is given up after this many failed attempts.
+MAX_ATTEMPTS = 8
+# Backoff after the n-th failed attempt is BACKOFF_BASE * 2 ** (n - 1) seconds, capped.
+BACKOFF_BASE = 30
+BACKOFF_MAX = 6 * 60 * 60
+# Seconds a claimed mail is reserved for the sender claiming it.
+LEASE = 5 * 60
+# The SMTP connection is closed after being idle for this many seconds.
+IDLE_TIMEOUT = 60
+SMTP_TIMEOUT = 30
+
+
+def enqueue(msg):
+    """Store the given EmailMessage in the outbox and wake the sender up once it is committed,
+    with the unit of work if in one (see the transaction module).
+    Returns the id of the queued mail."""
+    now = datetime.datetime.now()
+    with transaction.context():
+        mail = OutboxMail(message=msg.as_string(), created=now, next_try=now, attempts=0)
+        db.session.add(mail)
+        transaction.commit()
+        mail_id = mail.id
+    transaction.at_end(sender.wake)
+    return mail_id
+
+
+def _backoff(attempts: int):
+    """Helper to get the delay before the next attempt after the given number of failures.
+    Returns a timedelta."""
+    return datetime.timedelta(seconds=min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX))
+
+
+class MailSender:
+    """Background sender draining the outbox, see the module docstring."""
+
+    def __init__(self):
+        self._smtp = None
+        self._last_used = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background thread, if not running yet."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="mail-sender", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float=None):
+        """Stop the background thread and close the SMTP connection."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._close()
+
+    def wake(self):
+        """Make the sender look at the outbox now."""
+        self._wake.set()
+
+    def _run(self):
+        """Helper, the loop of the background thread."""
+        while not self._stop.is_set():
+            try:
+                while self.drain():
+                    pass
+            except Exception as err:
+                print(f"<SERVER><LOG> Mail sender error: {err!r}")
+            self._wake.wait(min(POLL_INTERVAL, IDLE_TIMEOUT) if self._smtp else POLL_INTERVAL)
+            self._wake.clear()
+            if self._smtp and time.monotonic() - self._last_used > IDLE_TIMEOUT:
+                self._close()
+
+    def _claim(self):
+        """Helper to reserve the due mails for this sender, so concurrent senders (other
+        processes) do not send them twice.
+        Returns a list of (id, message, attempts)."""
+        now = datetime.datetime.now()
+        with app.app_context():
+            due = db.session.execute(
+                select(OutboxMail.id, OutboxMail.message, OutboxMail.attempts, OutboxMail.next_try)
+                .where(OutboxMail.sent.is_(None))
+                .where(OutboxMail.attempts < MAX_ATTEMPTS)
+                .where(OutboxMail.next_try <= now)
+                .order_by(OutboxMail.next_try)
+                .limit(BATCH_SIZE)
+            ).all()
+            claimed = []
+            for mail in due:
+                result = db.session.execute(
+                    update(OutboxMail)
+                    .where(OutboxMail.id == mail.id)
+                    .where(OutboxMail.next_try == mail.next_try)
+                    .values(next_try=now + datetime.timedelta(seconds=LEASE))
+                )
+                if result.rowcount == 1:
+                    claimed.append((mail.id, mail.message, mail.attempts))
+            db.session.commit()
+        return claimed
+
+    def drain(self):
+        """Send the mails due in the outbox, one batch.
+        Returns the number of mails claimed, 0 if the outbox had nothing due."""
+        claimed = self._claim()
+        down = None
+        for mail_id, message, attempts in claimed:
+            try:
+                if down:
+                    # The server could not be reached, do not try again for every mail.
+                    raise down
+                self._send(message)
+            except (smtplib.SMTPException, OSError) as err:
+                self._close()
+                # SMTPException is an OSError too, only the errors of the connection mean the server is down.
+                if isinstance(err, (smtplib.SMTPServerDisconnected, smtplib.SMTPAuthenticationError)) or (
+                    not isinstance(err, smtplib.SMTPException)
+                ):
+                    down = err
+                attempts += 1
+                values = {
+                    "attempts": attempts,
+                    "next_try": datetime.datetime.now() + _backoff(attempts),
+                    "error": repr(err)[:250],
+                }
+                if attempts >= MAX_ATTEMPTS:
+                    print(f"<SERVER><LOG> Mail {mail_id} given up after {attempts} attempts.")
+            else:
+                values = {"sent": datetime.datetime.now(), "error": None}
+            with app.app_context():
+                db.session.execute(
+                    update(OutboxMail)
+                    .where(OutboxMail.id == mail_id)
+                    .values(values)
+                )
+                db.session.commit()
+        return len(claimed)
+
+    def _connect(self):
+        """Helper to open and authenticate the SMTP connection, if not open yet.
+        Returns the smtplib.SMTP connection."""
+        if self._smtp is None:
+            smtp = smtplib.SMTP(
+                app.config.get("MAIL_SERVER", "smtp.gmail.com"),
+                port=app.config.get("MAIL_PORT", 587),
+                timeout=SMTP_TIMEOUT,
+            )
+            try:
+                if app.config.get("MAIL_STARTTLS", True):
+                    smtp.starttls()
+                if app.config.get("MAIL_LOGIN", True):
+                    email, email_key, _ = get_email_config()
+                    smtp.login(email, email_key)
+            except Exception:
+                smtp.close()
+                raise
+            self._smtp = smtp
+        return self._smtp
+
+    def _send(self, message):
+        """Helper to send a message on the shared connection, reconnecting once if the
+        server has dropped it."""
+        email, _, to_email = get_email_config()
+        try:
+            self._connect().sendmail(email, to_email, message)
+        except smtplib.SMTPServerDisconnected:
+            self._close()
+            self._connect().sendmail(email, to_email, message)
+        self._last_used = time.monotonic()
+
+    def _close(self):
+        """Helper to close the SMTP connection, if open."""
+        smtp, self._smtp = self._smtp, None
+        if smtp is not None:
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                smtp.close()
+
+
+sender = MailSender()
+
+
+def start():
+    """Start the background sender of the process, unless 'MAIL_SENDER' of the config of the app
+    is False. Called by the servers: main.py, the ASGI app and the workers of gunicorn."""
+    if app.config.get("MAIL_SENDER", True):
+        sender.start()
@@ -0,0 +1,222 @@
+"""
+Module for the metrics of the requests of the blog app, exposed at /metrics in the
+Prometheus text format.
+Every request of the routes blueprints is timed (see routes.py), and recorded per endpoint
+with its status code, the size of its response, the number of SQL statements it ran
+and the time they took, and the time spent fetching remote images. The image fetches
+are also timed one by one, requests or not.
+
+The SQL statements are counted by a listener of every engine (the async ones included),
+into the stats of the current request held by a context variable, so the statements
+run outside of a request (CLI, background threads) are not counted and cost a lookup.
+A request is recorded with a single lock, when its response is ready: the time to
+send a streamed body is not part of its duration, and its size is unknown.
+
+The metrics live in the memory of a process, with several worker processes every
+worker exposes its own, the same as the response cache.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Upper bounds of the buckets of the histograms.
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+STATEMENTS_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Prometheus histogram: count of the observed values per bucket, sum and count."""
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        # One count per bucket and one for the values above the last bound (+Inf).
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str, labels: str):
+        """Get the lines of the histogram, with cumulative buckets.
+        'labels' is the rendered labels of the histogram, without braces, may be empty.
+        Returns a list of str."""
+        prefix = labels + "," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {self.count}')
+        braces = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{braces} {self.sum}")
+        lines.append(f"{name}_count{braces} {self.count}")
+        return lines
+
+
+class RequestStats:
+    """What a request has spent so far, filled while it is handled."""
+    __slots__ = ("start", "statements", "db_time", "img_fetches", "img_time")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.statements = 0
+        self.db_time = 0.0
+        self.img_fetches = 0
+        self.img_time = 0.0
+
+
+class EndpointMetrics:
+    """Metrics of the requests of an endpoint."""
+    __slots__ = ("duration", "size", "statements", "db_time", "img_fetches", "img_time")
+
+    def __init__(self):
+        self.duration = Histogram(SECONDS_BUCKETS)
+        self.size = Histogram(BYTES_BUCKETS)
+        self.statements = Histogram(STATEMENTS_BUCKETS)
+        self.db_time = Histogram(SECONDS_BUCKETS)
+        self.img_fetches = 0
+        self.img_time = 0.0
+
+
+class Registry:
+    """Metrics of the process, per endpoint, and of the image fetches."""
+
+    def __init__(self):
+        self._endpoints = {}
+        # Number of requests by (endpoint, method, status).
+        self._requests = {}
+        self._img_fetches = Histogram(SECONDS_BUCKETS)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, method: str, status: int, size, stats: RequestStats):
+        """Record a request from its stats, 'size' is the length of the response body
+        or None if unknown (streamed)."""
+        duration = time.perf_counter() - stats.start
+        with self._lock:
+            metrics = self._endpoints.get(endpoint)
+            if metrics is None:
+                metrics = self._endpoints[endpoint] = EndpointMetrics()
+            key = (endpoint, method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            metrics.duration.observe(duration)
+            if size is not None:
+                metrics.size.observe(size)
+            metrics.statements.observe(stats.statements)
+            metrics.db_time.observe(stats.db_time)
+            metrics.img_fetches += stats.img_fetches
+            metrics.img_time += stats.img_time
+
+    def record_img_fetch(self, seconds: float):
+        """Record the time of a fetch of a remote image."""
+        with self._lock:
+            self._img_fetches.observe(seconds)
+
+    def clear(self):
+        """Drop every metric."""
+        with self._lock:
+            self._endpoints.clear()
+            self._requests.clear()
+            self._img_fetches = Histogram(SECONDS_BUCKETS)
+
+    def render(self):
+        """Get the metrics in the Prometheus text format.
+        Returns a str."""
+        with self._lock:
+            lines = [
+                "# HELP blog_http_requests_total Requests handled, by endpoint, method and status code.",
+                "# TYPE blog_http_requests_total counter",
+            ]
+            for (endpoint, method, status), count in sorted(self._requests.items()):
+                lines.append(
+                    f'blog_http_requests_total{{endpoint="{_escape(endpoint)}",method="{method}",status="{status}"}} {count}'
+                )
+            endpoints = sorted(self._endpoints.items())
+            for name, attr, kind, doc in (
+                ("blog_http_request_duration_seconds", "duration", "histogram",
+                 "Time to handle a request, until its response is ready."),
+                ("blog_http_response_size_bytes", "size", "histogram",
+                 "Size of the response bodies, streamed responses excluded."),
+                ("blog_db_statements_per_request", "statements", "histogram",
+                 "SQL statements run by a request."),
+                ("blog_db_duration_seconds", "db_time", "histogram",
+                 "Time a request spent running SQL statements."),
+                ("blog_img_fetches_total", "img_fetches", "counter",
+                 "Remote images fetched by the requests, cached checks excluded."),
+                ("blog_img_fetch_seconds_total", "img_time", "counter",
+                 "Time the requests spent fetching remote images."),
+            ):
+                lines.append(f"# HELP {name} {doc}")
+                lines.append(f"# TYPE {name} {kind}")
+                for endpoint, metrics in endpoints:
+                    labels = f'endpoint="{_escape(endpoint)}"'
+                    value = getattr(metrics, attr)
+                    if kind == "histogram":
+                        lines.extend(value.samples(name, labels))
+                    else:
+                        lines.append(f"{name}{{{labels}}} {value}")
+            lines.append("# HELP blog_img_fetch_duration_seconds Time of a fetch of a remote image.")
+            lines.append("# TYPE blog_img_fetch_duration_seconds histogram")
+            lines.extend(self._img_fetches.samples("blog_img_fetch_duration_seconds", ""))
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str):
+    """Helper to escape a label value of the text format."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
+# Stats of the request being handled, None outside of a request.
+_current = ContextVar("request_stats", default=None)
+
+
+def start_request():
+    """Start the stats of a request, call before handling it."""
+    _current.set(RequestStats())
+
+
+def end_request(endpoint: str, method: str, status: int, size):
+    """Record the request started by start_request, call once its response is ready."""
+    stats = _current.get()
+    if stats is None:
+        return
+    _current.set(None)
+    registry.record(endpoint, method, status, size, stats)
+
+
+def record_img_fetch(seconds: float):
+    """Record the time of a fetch of a remote image, for the current request if any."""
+    stats = _current.get()
+    if stats is not None:
+        stats.img_fetches += 1
+        stats.img_time += seconds
+    registry.record_img_fetch(seconds)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info["metrics_start"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    start = conn.info.pop("metrics_start", None)
+    if start is not None:
+        stats.db_time += time.perf_counter() - start
+        stats.statements += 1
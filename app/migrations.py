@@ -0,0 +1,175 @@
+"""
+Module for the schema migrations of the db of the blog app.
+db.create_all() only creates missing tables, it never changes an existing db,
+so every change to the schema of an existing table is added here as a migration.
+The schema version of the db is stored in the 'user_version' pragma of SQLite.
+Migrations are run in order, each one brings the schema to its version.
+Every migration must be idempotent, as they are run on freshly created dbs as well.
+init_app skips db.create_all() on a db already at SCHEMA_VERSION, so a new table must
+also be created by a migration (db.create_all() only covers the new dbs).
+"""
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from . import db
+from .models import make_excerpt
+
+
+def _columns(conn, table):
+    """Helper to get the names of the columns of a table.
+    Returns a set of str."""
+    return {row.name for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+
+
+def _v1_secondary_indexes(conn):
+    """Add the indexes for the post listings (ordered by date), the listings by author
+    and for loading the comments of a post."""
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_posts_date_id ON posts (date, id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_posts_author_date ON posts (author, date)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_comments_post_id_date ON comments (post_id, date)"))
+
+
+def _v2_post_versions(conn):
+    """Add the version and modification time of the posts, for the conditional GETs.
+    The modification time of existing posts is the date of their last change or comment."""
+    columns = _columns(conn, "posts")
+    if "version" not in columns:
+        conn.execute(text("ALTER TABLE posts ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+    if "modified" not in columns:
+        conn.execute(text("ALTER TABLE posts ADD COLUMN modified DATETIME"))
+    conn.execute(text(
+        "UPDATE posts SET modified = max(date, coalesce("
+        "(SELECT max(comments.date) FROM comments WHERE comments.post_id = posts.id), date)) "
+        "WHERE modified IS NULL"
+    ))
+
+
+def _v3_post_excerpts(conn):
+    """Add the excerpt of the posts, for the summary listings, made from the existing bodies."""
+    if "excerpt" not in _columns(conn, "posts"):
+        conn.execute(text("ALTER TABLE posts ADD COLUMN excerpt VARCHAR(300) NOT NULL DEFAULT ''"))
+    rows = conn.execute(text("SELECT id, body FROM posts WHERE excerpt = ''")).all()
+    if rows:
+        conn.execute(
+            text("UPDATE posts SET excerpt = :excerpt WHERE id = :id"),
+            [{"id": row.id, "excerpt": make_excerpt(row.body)} for row in rows],
+        )
+
+
+def _v4_comment_counts(conn):
+    """Add the number of comments of the posts, counted from the existing comments."""
+    if "comment_count" not in _columns(conn, "posts"):
+        conn.execute(text("ALTER TABLE posts ADD COLUMN comment_count INTEGER NOT NULL DEFAULT 0"))
+    conn.execute(text(
+        "UPDATE posts SET comment_count = "
+        "(SELECT count(*) FROM comments WHERE comments.post_id = posts.id)"
+    ))
+
+
+def create_search_index(conn):
+    """Create the FTS5 full-text index of the posts (title, subtitle and body), if missing,
+    with the triggers keeping it in sync with the 'posts' table on every insert, delete and
+    change of the indexed columns. The index is external content, it stores no copy of the posts.
+    Returns True if the index is available, False if SQLite is built without FTS5."""
+    try:
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5("
+            "title, subtitle, body, content='posts', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        ))
+    except OperationalError as err:
+        print(f"<SERVER><LOG> Full-text search is not available: {err.orig}")
+        return False
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN "
+        "INSERT INTO posts_fts(rowid, title, subtitle, body) "
+        "VALUES (new.id, new.title, new.subtitle, new.body); END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN "
+        "INSERT INTO posts_fts(posts_fts, rowid, title, subtitle, body) "
+        "VALUES ('delete', old.id, old.title, old.subtitle, old.body); END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS posts_fts_update AFTER UPDATE OF title, subtitle, body ON posts BEGIN "
+        "INSERT INTO posts_fts(posts_fts, rowid, title, subtitle, body) "
+        "VALUES ('delete', old.id, old.title, old.subtitle, old.body); "
+        "INSERT INTO posts_fts(rowid, title, subtitle, body) "
+        "VALUES (new.id, new.title, new.subtitle, new.body); END"
+    ))
+    return True
+
+
+def rebuild_search_index(conn):
+    """Rebuild the full-text index of the posts from the 'posts' table, creating it if missing.
+    Returns True if the index is available, False if SQLite is built without FTS5."""
+    if not create_search_index(conn):
+        return False
+    conn.execute(text("INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')"))
+    return True
+
+
+def _v5_search_index(conn):
+    """Add the full-text index of the posts, indexing the existing posts."""
+    rebuild_search_index(conn)
+
+
+def _v6_cascade_comments(conn):
+    """Make the comments deleted by the db with their post (ON DELETE CASCADE).
+    SQLite cannot change a foreign key, so the table is rebuilt, dropping the comments
+    of posts deleted before, which the constraint would reject."""
+    keys = conn.execute(text("PRAGMA foreign_key_list(comments)")).all()
+    if all(key.on_delete == "CASCADE" for key in keys if key.table == "posts"):
+        return
+    conn.execute(text(
+        "CREATE TABLE comments_new ("
+        "id INTEGER NOT NULL, "
+        "post_id INTEGER, "
+        "author VARCHAR(100) NOT NULL, "
+        "body VARCHAR(250) NOT NULL, "
+        "date DATETIME NOT NULL, "
+        "PRIMARY KEY (id), "
+        "UNIQUE (id), "
+        "FOREIGN KEY(post_id) REFERENCES posts (id) ON DELETE CASCADE)"
+    ))
+    conn.execute(text(
+        "INSERT INTO comments_new (id, post_id, author, body, date) "
+        "SELECT id, post_id, author, body, date FROM comments "
+        "WHERE post_id IS NULL OR post_id IN (SELECT id FROM posts)"
+    ))
+    conn.execute(text("DROP TABLE comments"))
+    conn.execute(text("ALTER TABLE comments_new RENAME TO comments"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_comments_post_id_date ON comments (post_id, date)"))
+
+
+# The migrations in order, the version of the schema after a migration is its position (from 1).
+MIGRATIONS = [
+    _v1_secondary_indexes,
+    _v2_post_versions,
+    _v3_post_excerpts,
+    _v4_comment_counts,
+    _v5_search_index,
+    _v6_cascade_comments,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(conn):
+    """Get the schema version of the db of the given connection.
+    Returns the version as an int, 0 if the db has never been migrated."""
+    return conn.execute(text("PRAGMA user_version")).scalar()
+
+
+def migrate():
+    """Run the migrations the db has not been migrated with yet, in order.
+    Must be called within an app context.
+    Returns the schema version of the db."""
+    with db.engine.begin() as conn:
+        version = get_schema_version(conn)
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(conn)
+            conn.execute(text(f"PRAGMA user_version = {number}"))
+            print(f"<SERVER><LOG> Db migrated to schema version {number}.")
+            version = number
+    return version
@@ -2,16 +2,59 @@
 Module for the db models of the blog app.
 Define the db tables and relations within to store the blog posts and comments.
 """
-from sqlalchemy import Integer, String, DateTime
+import datetime
+
+import sqlite3
+
+from sqlalchemy import Integer, String, Text, DateTime, Index, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import mapped_column, relationship
 from sqlalchemy.schema import ForeignKey
 
 from . import db
 
 
+# Max length of the excerpt of a post, returned instead of the body in summary listings.
+EXCERPT_LENGTH = 300
+
+
+@event.listens_for(Engine, "connect")
+def _enable_foreign_keys(dbapi_connection, connection_record):
+    """Turn on the foreign key constraints on every new SQLite connection, they are off
+    by default and the deletes of the comments of a post rely on the ON DELETE CASCADE."""
+    # sqlite3 connections, or the ones of aiosqlite as adapted by SQLAlchemy.
+    if (
+        isinstance(dbapi_connection, sqlite3.Connection)
+        or type(dbapi_connection).__module__.startswith("sqlalchemy.dialects.sqlite")
+    ):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys = ON")
+        cursor.close()
+
+
+def make_excerpt(body: str):
+    """Make the excerpt of a post body: whitespace collapsed and cut at a word boundary
+    to at most EXCERPT_LENGTH characters.
+    Returns the excerpt as a str."""
+    text = " ".join(body.split())
+    if len(text) <= EXCERPT_LENGTH:
+        return text
+    cut = text[:EXCERPT_LENGTH - 1].rsplit(" ", 1)[0]
+    return cut + "…"
+
+
+def _default_excerpt(context):
+    """Helper, default of the excerpt column made from the inserted body."""
+    return make_excerpt(context.get_current_parameters()["body"])
+
+
 class Post(db.Model):
     """Db table for posts. Defines the desired columns of the table and relations."""
     __tablename__ = "posts"
+    __table_args__ = (
+        Index("ix_posts_date_id", "date", "id"),
+        Index("ix_posts_author_date", "author", "date"),
+    )
 
     id = mapped_column(Integer, primary_key=True, unique=True)
 
@@ -21,48 +64,58 @@ class Post(db.Model):
     body = mapped_column(String(10000), nullable=False)
     date = mapped_column(DateTime(timezone=True), nullable=False)
     img_url = mapped_column(String(250), nullable=True)
+    excerpt = mapped_column(String(EXCERPT_LENGTH), nullable=False, default=_default_excerpt)
+    # Number of comments of the post, kept up to date by the writes of the comments.
+    comment_count = mapped_column(Integer, nullable=False, default=0)
+    # Bumped and set on every change of the post or its comments, for the conditional GETs.
+    version = mapped_column(Integer, nullable=False, default=1)
+    modified = mapped_column(DateTime, nullable=False, default=datetime.datetime.now)
 
-    comments = relationship("Comment", cascade="all, delete-orphan")
+    # The comments are deleted by the db with the post (ON DELETE CASCADE), never loaded for it.
+    comments = relationship(
+        "Comment",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        order_by="Comment.date"
+    )
 
 
-    def to_dict(self, comm: bool=False):
+    def to_dict(self, comm: bool=False, summary: bool=False):
         """Convert a Post object to a dict for representation.
         If 'comm' param is True the dict will contain all the comments
-        belonging to the post in a [{},{}] format."""
+        belonging to the post in a [{},{}] format.
+        If 'summary' param is True the dict will contain the 'excerpt' of the post
+        instead of the 'body', the body is not accessed so it may be left unloaded."""
+        comments = []
         if comm:
-            comments = []
             if self.comments:
                 for comment in self.comments:
                     comments.append(comment.to_dict())
-            result = {
-                "id": self.id,
-                "author": self.author,
-                "title": self.title,
-                "subtitle": self.subtitle,
-                "body": self.body,
-                "date": self.date,
-                "img_url": self.img_url,
-                "comments": comments,
-            }
+        result = {
+            "id": self.id,
+            "author": self.author,
+            "title": self.title,
+            "subtitle": self.subtitle,
+            "date": self.date,
+            "img_url": self.img_url,
+            "comments": comments,
+            "comment_count": self.comment_count,
+        }
+        if summary:
+            result["excerpt"] = self.excerpt
         else:
-            result = {
-                "id": self.id,
-                "author": self.author,
-                "title": self.title,
-                "subtitle": self.subtitle,
-                "body": self.body,
-                "date": self.date,
-                "img_url": self.img_url,
-                "comments": [],
-            }
+            result["body"] = self.body
         return result
 
 class Comment(db.Model):
     """Db table for comments. Defines the desired columns of the table and relations."""
     __tablename__ = "comments"
+    __table_args__ = (
+        Index("ix_comments_post_id_date", "post_id", "date"),
+    )
 
     id = mapped_column(Integer, primary_key=True, unique=True)
-    post_id = mapped_column(Integer, ForeignKey("posts.id"))
+    post_id = mapped_column(Integer, ForeignKey("posts.id", ondelete="CASCADE"))
 
     author = mapped_column(String(100), nullable=False)
     body = mapped_column(String(250), nullable=False)
@@ -79,3 +132,32 @@ class Comment(db.Model):
             "date": self.date,
         }
         return result
+
+
+class ImgCheck(db.Model):
+    """Db table for the results of the image url validation, see the images module.
+    'img_type' is None if the url was not an image."""
+    __tablename__ = "img_checks"
+
+    url = mapped_column(String(2048), primary_key=True)
+
+    img_type = mapped_column(String(10), nullable=True)
+    checked = mapped_column(DateTime, nullable=False)
+
+
+class OutboxMail(db.Model):
+    """Db table for the outgoing emails waiting to be sent, see the mailer module.
+    'sent' is None until the mail is sent, 'next_try' is when the next attempt is due."""
+    __tablename__ = "outbox"
+    __table_args__ = (
+        Index("ix_outbox_sent_next_try", "sent", "next_try"),
+    )
+
+    id = mapped_column(Integer, primary_key=True, unique=True)
+
+    message = mapped_column(Text, nullable=False)
+    created = mapped_column(DateTime, nullable=False)
+    next_try = mapped_column(DateTime, nullable=False)
+    attempts = mapped_column(Integer, nullable=False, default=0)
+    sent = mapped_column(DateTime, nullable=True)
+    error = mapped_column(String(250), nullable=True)
@@ -0,0 +1,263 @@
+"""
+Module for the opt-in SQL profiler of the blog app, to find the slow queries of the
+control module. Off by default, turned on by the 'SQL_PROFILER' config of the app, see DEFAULTS.
+
+When on, every statement run by the engines of the db (the async ones included) is timed
+and aggregated by statement, the values of the parameters apart. A statement slower than
+'SQL_SLOW_MS' is logged with its parameters and its plan (EXPLAIN QUERY PLAN), and kept
+with the last SLOW_KEEP slow ones. A request running the same statement at least
+'SQL_NPLUS1_THRESHOLD' times is reported as a N+1 pattern (a query per item of a list,
+instead of one query for the whole list).
+
+The aggregated profile is served by GET /debug/sql-profile (and reset by DELETE), and
+dumped as JSON to 'SQL_PROFILE_FILE' when the process exits, if set. The profile lives in
+the memory of a process, with several worker processes put "{pid}" in the file name to
+get a file per worker.
+"""
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+
+DEFAULTS = {
+    "SQL_PROFILER": False,
+    "SQL_SLOW_MS": 100,
+    # Get the plan of the slow statements.
+    "SQL_EXPLAIN": True,
+    # Same statement run this many times by a request: N+1 pattern.
+    "SQL_NPLUS1_THRESHOLD": 10,
+    "SQL_PROFILE_FILE": None,
+}
+
+# Number of slow statements kept, the older ones are dropped.
+SLOW_KEEP = 100
+# Number of statements listed in the report, by total time.
+REPORT_TOP = 50
+# Max length of the parameters of a statement in the log and the report.
+PARAMS_LENGTH = 500
+# Statements with a query plan.
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+# Lists of parameters ("?, ?, ?" of IN lists and multi-row VALUES) of any length are the same statement.
+_PARAMS_LIST_RE = re.compile(r"\?(?:\s*,\s*\?)+")
+_ROWS_LIST_RE = re.compile(r"\((\?, \.\.\.|\?)\)(?:\s*,\s*\(\1\))+")
+
+
+def normalize(statement: str):
+    """Normalize a statement to aggregate it: whitespace collapsed and lists of parameters
+    of any length made the same.
+    Returns a str."""
+    statement = " ".join(statement.split())
+    statement = _PARAMS_LIST_RE.sub("?, ...", statement)
+    return _ROWS_LIST_RE.sub(r"(\1), ...", statement)
+
+
+class Profile:
+    """Aggregated profile of the statements of the process."""
+
+    def __init__(self):
+        # Normalized statement: [count, total seconds, max seconds, slow count].
+        self._statements = {}
+        self._slow = deque(maxlen=SLOW_KEEP)
+        # (endpoint, normalized statement): [requests, max count in a request].
+        self._nplus1 = {}
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, seconds: float, slow: bool):
+        """Record a run of a (normalized) statement."""
+        with self._lock:
+            stats = self._statements.get(statement)
+            if stats is None:
+                stats = self._statements[statement] = [0, 0.0, 0.0, 0]
+            stats[0] += 1
+            stats[1] += seconds
+            if seconds > stats[2]:
+                stats[2] = seconds
+            if slow:
+                stats[3] += 1
+
+    def record_slow(self, entry: dict):
+        """Keep a slow statement, see _slow_entry."""
+        with self._lock:
+            self._slow.append(entry)
+
+    def record_nplus1(self, endpoint: str, statement: str, count: int):
+        """Record a request running the same statement 'count' times."""
+        with self._lock:
+            stats = self._nplus1.get((endpoint, statement))
+            if stats is None:
+                stats = self._nplus1[(endpoint, statement)] = [0, 0]
+            stats[0] += 1
+            stats[1] = max(stats[1], count)
+
+    def clear(self):
+        """Drop the whole profile."""
+        with self._lock:
+            self._statements.clear()
+            self._slow.clear()
+            self._nplus1.clear()
+
+    def report(self, top: int=REPORT_TOP):
+        """Get the profile: the 'top' statements by total time, the last slow statements
+        and the N+1 patterns.
+        Returns a dict."""
+        with self._lock:
+            statements = sorted(self._statements.items(), key=lambda item: item[1][1], reverse=True)
+            return {
+                "statements": [
+                    {
+                        "statement": statement,
+                        "count": count,
+                        "total_ms": round(total * 1000, 3),
+                        "avg_ms": round(total / count * 1000, 3),
+                        "max_ms": round(longest * 1000, 3),
+                        "slow": slow,
+                    }
+                    for statement, (count, total, longest, slow) in statements[:top]
+                ],
+                "slow": list(self._slow),
+                "n_plus_one": [
+                    {"endpoint": endpoint, "statement": statement, "requests": requests, "max_count": count}
+                    for (endpoint, statement), (requests, count) in sorted(
+                        self._nplus1.items(), key=lambda item: item[1][0], reverse=True
+                    )
+                ],
+            }
+
+    def dump(self, path: str):
+        """Write the report of the profile to the given file, as JSON.
+        "{pid}" in the path is replaced by the id of the process."""
+        path = path.replace("{pid}", str(os.getpid()))
+        with open(path, "w") as f:
+            json.dump(self.report(top=len(self._statements)), f, indent=2)
+
+
+profile = Profile()
+_enabled = False
+_nplus1_threshold = DEFAULTS["SQL_NPLUS1_THRESHOLD"]
+# Count of the runs of each normalized statement by the request being handled,
+# None outside of a request or when the profiler is off.
+_current = ContextVar("sql_profile", default=None)
+
+
+def enabled():
+    """Check if the profiler is on.
+    Returns a bool."""
+    return _enabled
+
+
+def start_request():
+    """Start counting the statements of a request, call before handling it."""
+    if _enabled:
+        _current.set({})
+
+
+def end_request(endpoint: str):
+    """Report the N+1 patterns of the request started by start_request."""
+    counts = _current.get()
+    if counts is None:
+        return
+    _current.set(None)
+    for statement, count in counts.items():
+        if count >= _nplus1_threshold:
+            profile.record_nplus1(endpoint, statement, count)
+            print(f"<SERVER><LOG> N+1 queries: {endpoint} ran {count} times: {statement}")
+
+
+def _explain(conn, statement: str, parameters):
+    """Helper to get the plan of a statement, with a new cursor of the same connection
+    (the cursor of the statement still holds its rows).
+    Returns a list of str, one per step, indented by depth."""
+    words = statement.split(None, 1)
+    if not words or words[0].upper() not in EXPLAINABLE:
+        return []
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    depths = {0: -1}
+    plan = []
+    for id, parent, _, detail in rows:
+        depths[id] = depths.get(parent, -1) + 1
+        plan.append("  " * depths[id] + detail)
+    return plan
+
+
+def _slow_entry(conn, statement: str, parameters, executemany: bool, seconds: float, explain: bool):
+    """Helper to describe a slow statement, with its plan if 'explain'.
+    Returns a dict."""
+    if executemany:
+        parameters = parameters[0] if parameters else ()
+    plan = []
+    if explain:
+        try:
+            plan = _explain(conn, statement, parameters)
+        except Exception as err:
+            plan = [f"EXPLAIN failed: {err!r}"]
+    return {
+        "statement": " ".join(statement.split()),
+        "params": repr(parameters)[:PARAMS_LENGTH],
+        "executemany": executemany,
+        "ms": round(seconds * 1000, 3),
+        "plan": plan,
+        "at": time.time(),
+    }
+
+
+def setup_engine(app, engine):
+    """Time the statements of the given engine, the sync_engine of an AsyncEngine included,
+    if the profiler is on."""
+    if not app.config.get("SQL_PROFILER", False):
+        return
+    slow = app.config["SQL_SLOW_MS"] / 1000
+    explain = app.config["SQL_EXPLAIN"]
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info["profiler_start"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info.pop("profiler_start", None)
+        if start is None:
+            return
+        seconds = time.perf_counter() - start
+        normalized = normalize(statement)
+        is_slow = seconds > slow
+        profile.record(normalized, seconds, is_slow)
+        counts = _current.get()
+        if counts is not None:
+            counts[normalized] = counts.get(normalized, 0) + 1
+        if is_slow:
+            entry = _slow_entry(conn, statement, parameters, executemany, seconds, explain)
+            profile.record_slow(entry)
+            plan = "".join(f"\n    {step}" for step in entry["plan"])
+            print(f"<SERVER><LOG> Slow query ({entry['ms']} ms): {entry['statement']} params: {entry['params']}{plan}")
+
+
+def setup(app, db):
+    """Turn the profiler on for the engines of the db if the 'SQL_PROFILER' config is True,
+    must be called after db.init_app(app). The missing 'SQL_*' keys of the config are set
+    to the DEFAULTS."""
+    global _enabled, _nplus1_threshold
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    if not app.config["SQL_PROFILER"]:
+        return
+    with app.app_context():
+        for engine in db.engines.values():
+            setup_engine(app, engine)
+    _enabled = True
+    _nplus1_threshold = app.config["SQL_NPLUS1_THRESHOLD"]
+    if app.config["SQL_PROFILE_FILE"]:
+        atexit.register(profile.dump, app.config["SQL_PROFILE_FILE"])
+    print(f"<SERVER><LOG> SQL profiler on, slow queries over {app.config['SQL_SLOW_MS']} ms.")
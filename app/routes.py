@@ -1,650 +1,179 @@
 """
-Module for the API endpoints for the post app.
-Requires JSON format for every request, the response is sent in JSON format as well.
-Contains the implementation of the API endpoints and data validation.
-
-Errors are represented in a list in JSON format as:
-{
-    "error": [<error message>]
-}
+Module for the API endpoints of the blog app served over WSGI. The endpoints are the
+handlers of the handlers module (shared with the ASGI app, see the async_routes module),
+their db work is done with the control module. The bulk /import-posts and /export-posts
+are only served here.
+
+The requests are timed and counted per endpoint, and exposed at /metrics (Prometheus text
+format, not JSON), see the metrics module.
+
+Every request is a unit of work: its changes are committed at once when its response is
+ready, or rolled back if the response is an error (status 400 and over), see the transaction module.
 """
-from flask import Blueprint, request, jsonify, make_response
+from flask import Blueprint, Response, current_app, request, jsonify, make_response, json, stream_with_context
 from werkzeug.exceptions import BadRequest
-from requests.exceptions import MissingSchema
-from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-from sqlalchemy.orm.exc import UnmappedInstanceError
+from sqlalchemy.exc import IntegrityError
 
-from . import control
+from . import bulk
+from . import handlers
+from . import metrics
+from . import profiler
+from . import schemas
+from . import transaction
 
 routes = Blueprint("routes", __name__)
 
 
-@routes.route("/")
-def home():
-    return "Home is where the heart is."
+@routes.before_request
+def _start_metrics():
+    """Start the metrics and the SQL profile of the request, see the metrics and profiler modules."""
+    metrics.start_request()
+    profiler.start_request()
 
 
-@routes.route("/get-posts", methods=["GET"])
-def get_posts():
-    """Get posts from the db.
-    GET Request:
+@routes.after_request
+def _record_metrics(response):
+    """Record the metrics and the SQL profile of the request once its response is ready,
+    see the metrics and profiler modules."""
+    endpoint = request.url_rule.rule if request.url_rule else request.path
+    metrics.end_request(endpoint, request.method, response.status_code, response.content_length)
+    profiler.end_request(endpoint)
+    return response
 
-    {
-        "num": int (>=0), the desired number of post to retrieve (if 0, get all posts),
-        "page": int  (>=1), pagination for the set of posts (if num not 0). Gives the offset for the querry,
-        "comments": bool, determines if the comments should be loaded for the posts, as a list. Empty list if False.
-    }
 
-    Response:
+@routes.before_request
+def _begin_unit():
+    """Make the request a unit of work, see the transaction module."""
+    transaction.begin()
 
-    [
-        {
-            "id": int,
-            "author": str,
-            "title": str,
-            "subtitle": str,
-            "body": str,
-            "date": datetime,
-            "img_url": str,
-            "comments": list of dict
-        },
-        {...},
-        {...},
-    ]
-    """
-    necessary = ["num", "page", "comments"]
-    errors = []
-
-    if not request.is_json:
-        return make_response(jsonify({"error": ["Request must be in JSON format."]}), 400)
-    try:
-        req = request.get_json()
-    except BadRequest:
-        return make_response(jsonify({"error": ["Invalid JSON format."]}), 400)
-    for param in necessary:
-        if param not in req.keys():
-            errors.append(f"Missing param: '{param}'")
-    if errors:
-        return make_response(jsonify({"error": errors}), 400)
-
-    if not isinstance(req["comments"], bool):
-        errors.append("'comments' must be boolean.")
-    if not isinstance(req["num"], int):
-        errors.append("'num' must be int.")
-    if not isinstance(req["page"], int):
-        errors.append("'page' must be int.")
-    if errors:
-        return make_response(jsonify({"error": errors}), 400)
-
-    if not req["num"] >= 0:
-        errors.append("'num' must be >= 0")
-    if not req["page"] >= 1:
-        errors.append("'page' must be >= 1")
-    if errors:
-        return make_response(jsonify({"error": errors}), 400)
-
-    posts = control.get_posts(num=req["num"], page=req["page"], comments=req["comments"])
-    if not posts:
-        if req["num"] != 0 and req["page"] != 1:
-            return make_response(
-                jsonify({"error": [f"There are no posts in the range of num: {req['num']}, page: {req['page']}"]}), 404
-            )
-        return make_response(jsonify({"error": ["There are no posts."]}), 404)
-    return make_response(jsonify(posts), 200)
-
-
-@routes.route("/get-post", methods=["GET"])
-def get_post():
-    """Get post from the db.
-    GET Request:
-
-    {
-        "id": int (>=1), the id of the desired post to retrieve.
-    }
-
-    Response:
-
-    {
-        "id": int,
-        "author": str,
-        "title": str,
-        "subtitle": str,
-        "body": str,
-        "date": datetime,
-        "img_url": str,
-        "comments": list of dict
-    }
-    """
-    if not request.is_json:
-        return make_response(jsonify({"error": ["Request must be in JSON format."]}), 400)
-    try:
-        req = request.get_json()
-    except BadRequest:
-        return make_response(jsonify({"error": ["Invalid JSON format."]}), 400)
-    if "id" not in req.keys():
-        return make_response(jsonify({"error": ["Missing param: 'id'"]}), 400)
-    if not isinstance(req["id"], int):
-        return make_response(jsonify({"error": ["'id' must be int."]}), 400)
-    post = control.get_post(req["id"])
-    if not post:
-        return make_response(jsonify({"error": [f"There are no posts with the id of {req['id']}."]}), 404)
-    return make_response(jsonify(post), 200)
-
-
-@routes.route("/get-posts-by-user", methods=["GET"])
-def get_posts_by_user():
-    """Get post made by a user from the db.
-    GET Request:
 
-    {
-        "user": str, the author of posts to retrieve,
-        "num": int (>=0), the desired number of post to retrieve (if 0, get all posts),
-        "page": int  (>=1), pagination for the set of posts (if num not 0). Gives the offset for the querry,
-    }
+@routes.after_request
+def _end_unit(response):
+    """Commit the unit of work of the request once its response is ready (before the metrics
+    are recorded, the commit is part of the request), roll it back if the response is an error."""
+    transaction.end(commit=response.status_code < 400)
+    return response
 
-    Response:
 
-    [
-        {
-            "id": int,
-            "author": str,
-            "title": str,
-            "subtitle": str,
-            "body": str,
-            "date": datetime,
-            "img_url": str,
-            "comments": list of dict
-        },
-        {...},
-        {...},
-    ]
-    """
+@routes.teardown_request
+def _abort_unit(error=None):
+    """Roll back the unit of work of the request if it has not ended, when no response was made."""
+    transaction.end(commit=False)
 
-    necessary = ["user", "num", "page"]
-    errors = []
 
+def _body():
+    """Helper to get the JSON body of the request.
+    Returns the body, or handlers.NOT_JSON / handlers.INVALID_JSON."""
     if not request.is_json:
-        return make_response(jsonify({"error": ["Request must be in JSON format."]}), 400)
+        return handlers.NOT_JSON
     try:
-        req = request.get_json()
+        return request.get_json()
     except BadRequest:
-        return make_response(jsonify({"error": ["Invalid JSON format."]}), 400)
-    for param in necessary:
-        if param not in req.keys():
-            errors.append(f"Missing param: '{param}'")
-    if errors:
-        return make_response(jsonify({"error": errors}), 400)
-
-    if not isinstance(req["user"], str):
-        errors.append("'user' must be str.")
-    if not isinstance(req["num"], int):
-        errors.append("'num' must be int.")
-    if not isinstance(req["page"], int):
-        errors.append("'page' must be int.")
-    if errors:
-        return make_response(jsonify({"error": errors}), 400)
-
-    req["user"] = req["user"].strip()
-    if not len(req["user"]) >= 2:
-        errors.append("'user' must be at least 2 characters.")
-    if not req["num"] >= 0:
-        errors.append("'num' must be >= 0")
-    if not req["page"] >= 1:
-        errors.append("'page' must be >= 1")
-    if errors:
-        return make_response(jsonify({"error": errors}), 400)
-
-    posts = control.get_posts_by_user(user=req["user"], num=req["num"], page=req["page"])
-    if not posts:
-        if req["num"] != 0 and req["page"] != 1:
-            return make_response(
-                jsonify(
-                    {
-                        "error": [
-                            f"There is no post made by {req['user']} in the range of num: {req['num']}, page: {req['page']}"
-                        ]
-                    }
-                ),
-                404,
-            )
-        return make_response(jsonify({"error": [f"There is no post made by {req['user']}."]}), 404)
-    return make_response(jsonify(posts), 200)
-
-
-@routes.route("/contact", methods=["POST"])
-def contact():
-    """Send a contact email according to the email config with the given contents.
-    POST Request:
-
-    {
-        "name": str (>=2), the author of posts to retrieve,
-        "email": str, valid email address,
-        "message": str (>=2), body of the message to be sent
-    }
+        return handlers.INVALID_JSON
+
+
+def _respond(reply):
+    """Helper to make the response of a Reply or Stream of a handler, see the handlers module.
+    Returns a Response."""
+    if isinstance(reply, handlers.Stream):
+        encoder = handlers.StreamEncoder(current_app.json.dumps, reply.ndjson)
+
+        def generate():
+            for post in reply.posts:
+                chunk = encoder.add(post)
+                if chunk:
+                    yield chunk
+            yield encoder.close()
+
+        return Response(stream_with_context(generate()), status=200, mimetype=reply.mimetype)
+
+    if isinstance(reply.body, str):
+        response = make_response(reply.body, reply.status)
+        if reply.content_type:
+            response.content_type = reply.content_type
+    else:
+        response = make_response(jsonify(reply.body), reply.status)
+    if reply.validators:
+        etag, last_modified = reply.validators
+        response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+    return response
+
+
+def _view(handler):
+    """Helper to make the view function of a handler, its db work done with the control module.
+    Returns a function."""
+    def view():
+        return _respond(handlers.run(handler, request, _body()))
+    view.__name__ = handler.__name__
+    view.__doc__ = handler.__doc__
+    return view
+
+
+for _rule, _methods, _handler in handlers.ENDPOINTS:
+    routes.add_url_rule(_rule, view_func=_view(_handler), methods=_methods)
+
+
+@routes.route("/import-posts", methods=["POST"])
+def import_posts():
+    """Import posts with their comments in bulk, in a single transaction.
+    The img_url of the posts is not validated and the texts are not escaped.
+    POST Request, either JSON:
+
+    {
+        "posts": [
+            {
+                "id": int, optional,
+                "author": str,
+                "title": str,
+                "subtitle": str,
+                "body": str,
+                "date": str, optional, ISO 8601,
+                "img_url": str or null, optional,
+                "comments": [{"author": str, "body": str, "date": str optional}], optional
+            },
+            {...},
+        ]
+    }
+
+    or NDJSON (Content-Type: application/x-ndjson), one post per line, as exported by /export-posts.
 
     Response:
 
     {
-        "success": ["Email successfully sent."]
+        "success": ["<n> posts and <n> comments have been imported."]
     }
     """
-    necessary = ["name", "email", "message"]
-    errors = []
-
-    if not request.is_json:
-        return make_response(jsonify({"error": ["Request must be in JSON format."]}), 400)
-    try:
-        req = request.get_json()
-    except BadRequest:
-        return make_response(jsonify({"error": ["Invalid JSON format."]}), 400)
-    for param in necessary:
-        if param not in req.keys():
-            errors.append(f"Missing param: '{param}'")
-    if errors:
-        return make_response(jsonify({"error": errors}), 400)
-
-    if not isinstance(req["name"], str):
-        errors.append("'name' must be str.")
-    if not isinstance(req["email"], str):
-        errors.append("'email' must be str.")
-    if not isinstance(req["message"], str):
-        errors.append("'message' must be str.")
-    if errors:
-        return make_response(jsonify({"error": errors}), 400)
-
-    req["name"] = req["name"].strip()
-    req["email"] = req["email"].strip()
-    req["message"] = req["message"].strip()
-
-    if not len(req["name"]) >= 2:
-        errors.append("'name' must be at least 2 characters.")
-    if not len(req["message"]) >= 2:
-        errors.append("'message' must be at least 2 characters.")
-    email = control.validate_email(req["email"].strip())
-    if not email:
-        errors.append("'email' is not a valid email address.")
-    if errors:
-        return make_response(jsonify({"error": errors}), 400)
-    control.send_contact_email(name=req["name"], email=email, message=req["message"])
-
-    return make_response({"success": ["Email successfully sent."]}, 200)
-
-
-@routes.route("/about")
-def about():
-    return "about"
-
-
-@routes.route("/create-post", methods=["POST"])
-def create_post():
-    """Create a post in the db.
-    POST Request:
-    {
-        "author": str (>=2), name of the user creating the post,
-        "title": str (>=5), title of the post,
-        "subtitle": str (>=5), subtitle of the post,
-        "body": str (>=5), body of the post, will be escaped, use {{img}} {{/img}} tag to insert images.
-        "img_url": str (>=2), url of an img to display as the backgroud/header for the post
-    }
-
-    Response:
-
-    {
-        "success": ["Post has been added sucessfully."]
-    }
-    """
-    necessary = ["author", "title", "subtitle", "body", "img_url"]
-    errors = []
-
-    if not request.is_json:
-        return make_response(jsonify({"error": ["Request must be in JSON format."]}), 400)
-    try:
-        req = request.get_json()
-    except BadRequest:
-        return make_response(jsonify({"error": ["Invalid JSON format."]}), 400)
-    for param in necessary:
-        if param not in req.keys():
-            errors.append(f"Missing param: '{param}'")
-    if errors:
-        return make_response(jsonify({"error": errors}), 400)
-
-    if not isinstance(req["author"], str):
-        errors.append("'author' must be str.")
-    if not isinstance(req["title"], str):
-        errors.append("'title' must be str.")
-    if not isinstance(req["subtitle"], str):
-        errors.append("'subtitle' must be str.")
-    if not isinstance(req["body"], str):
-        errors.append("'body' must be str.")
-    if not isinstance(req["img_url"], str):
-        errors.append("'img_url' must be str.")
-    if errors:
-        return make_response(jsonify({"error": errors}), 400)
-
-    req["author"] = req["author"].strip()
-    req["title"] = req["title"].strip()
-    req["subtitle"] = req["subtitle"].strip()
-    req["body"] = req["body"].strip()
-    req["img_url"] = req["img_url"].strip()
-
-    if not len(req["author"]) >= 2:
-        errors.append("'author' must be at least 2 characters.")
-    if not len(req["title"]) >= 5:
-        errors.append("'title' must be at least 5 characters.")
-    if not len(req["subtitle"]) >= 5:
-        errors.append("'subtitle' must be at least 5 characters.")
-    if not len(req["body"]) >= 5:
-        errors.append("'body' must be at least 5 characters.")
-    if not len(req["img_url"]) >= 2:
-        errors.append("'img_url' must be at least 2 characters.")
-    try:
-        if not control.validate_img_url(req["img_url"]):
-            errors.append("'img_url' is not a valid url for an image.")
-    except MissingSchema:
-        errors.append("'img_url' is not a valid url.")
-
-    if errors:
-        return make_response(jsonify({"error": errors}), 400)
-
-    try:
-        control.add_post(
-            author=req["author"], title=req["title"], subtitle=req["subtitle"], body=req["body"], img_url=req["img_url"]
-        )
-    except IntegrityError as err:
-        return make_response(jsonify({"error": err.args}))
-
-    return make_response(jsonify({"success": ["Post has been added sucessfully."]}), 200)
-
-
-@routes.route("/update-post", methods=["GET", "PATCH"])
-def update_post():
-    """Update a post in the db based on the id.
-    GET Request:
-
-    {
-        "id": int (>=1), the id of the desired post to retrieve.
-    }
-
-    Response:
-
-    {
-        "id": int,
-        "author": str,
-        "title": str,
-        "subtitle": str,
-        "body": str,
-        "date": datetime,
-        "img_url": str,
-        "comments": list of dict
-    }
-
-
-    PATCH Request:
-
-    {
-        "id": int (>=1), id of the post to update,
-        "title": str (>=5), title of the post,
-        "subtitle": str (>=5), subtitle of the post,
-        "body": str (>=5), body of the post, will be escaped, use {{img}} {{/img}} tag to insert images.
-        "img_url": str (>=2), url of an img to display as the backgroud/header for the post
-    }
-
-    Response:
-
-    {
-        "success": ["Post has been updated sucessfully."]
-    }
-    """
-    if request.method == "GET":
-        if not request.is_json:
-            return make_response(jsonify({"error": ["Request must be in JSON format."]}), 400)
+    if request.mimetype == "application/x-ndjson":
         try:
-            req = request.get_json()
-        except BadRequest:
-            return make_response(jsonify({"error": ["Invalid JSON format."]}), 400)
-        if "id" not in req.keys():
-            return make_response(jsonify({"error": ["Missing param: 'id'"]}), 400)
-        if not isinstance(req["id"], int):
-            return make_response(jsonify({"error": ["'id' must be int."]}), 400)
-        post = control.get_post(req["id"])
-        if not post:
-            return make_response(jsonify({"error": [f"There are no posts with the id of {req['id']}."]}), 404)
-        return make_response(jsonify(post), 200)
-
-    if request.method == "PATCH":
-        necessary = ["id", "title", "subtitle", "body", "img_url"]
-        errors = []
-
-        if not request.is_json:
-            return make_response(jsonify({"error": ["Request must be in JSON format."]}), 400)
-        try:
-            req = request.get_json()
-        except BadRequest:
-            return make_response(jsonify({"error": ["Invalid JSON format."]}), 400)
-        for param in necessary:
-            if param not in req.keys():
-                errors.append(f"Missing param: '{param}'")
-        if errors:
-            return make_response(jsonify({"error": errors}), 400)
-
-        if not isinstance(req["id"], int):
-            errors.append("'id' must be int.")
-        if not isinstance(req["title"], str):
-            errors.append("'title' must be str.")
-        if not isinstance(req["subtitle"], str):
-            errors.append("'subtitle' must be str.")
-        if not isinstance(req["body"], str):
-            errors.append("'body' must be str.")
-        if req["img_url"]:
-            if not isinstance(req["img_url"], str):
-                errors.append("'img_url' must be str.")
-        if errors:
-            return make_response(jsonify({"error": errors}), 400)
-
-        req["title"] = req["title"].strip()
-        req["subtitle"] = req["subtitle"].strip()
-        req["body"] = req["body"].strip()
-
-        if not len(req["title"]) >= 5:
-            errors.append("'title' must be at least 5 characters.")
-        if not len(req["subtitle"]) >= 5:
-            errors.append("'subtitle' must be at least 5 characters.")
-        if not len(req["body"]) >= 5:
-            errors.append("'body' must be at least 5 characters.")
-        if req["img_url"]:
-            req["img_url"] = req["img_url"].strip()
-            if not len(req["img_url"]) >= 2:
-                errors.append("'img_url' must be at least 2 characters.")
-            try:
-                if not control.validate_img_url(req["img_url"]):
-                    errors.append("'img_url' is not a valid url for an image.")
-            except MissingSchema:
-                errors.append("'img_url' is not a valid url.")
-
-        if errors:
-            return make_response(jsonify({"error": errors}), 400)
-
-        try:
-            control.update_post(
-                id=req["id"],
-                title=req["title"],
-                subtitle=req["subtitle"],
-                body=req["body"],
-                img_url=req["img_url"]
-            )
-        except IntegrityError as err:
-            return make_response(jsonify({"error": err.args}))
-
-        return make_response(jsonify({"success": ["Post has been updated sucessfully."]}), 200)
-
-
-@routes.route("/delete-post", methods=["DELETE"])
-def delete_post():
-    """Delete a post based on id.
-    DELETE Request:
-
-    {
-        "id": int (>=1), the id of the desired post to delete.
-    }
-
-    Response:
-
-    {
-        "success": ["Post with id: <id> has been deleted sucessfully."]
-    }
-    """
-    if not request.is_json:
-        return make_response(jsonify({"error": ["Request must be in JSON format."]}), 400)
-    try:
-        req = request.get_json()
-    except BadRequest:
-        return make_response(jsonify({"error": ["Invalid JSON format."]}), 400)
-    if "id" not in req.keys():
-        return make_response(jsonify({"error": ["Missing param: 'id'"]}), 400)
-    if not isinstance(req["id"], int):
-        return make_response(jsonify({"error": ["'id' must be int."]}), 400)
-    try:
-        control.delete_post(req["id"])
-    except UnmappedInstanceError:
-        return make_response(jsonify({"error":[f"There is no post with the 'id' of {req['id']}."]}), 404)
-    return make_response(jsonify({"success": [f"Post with id: {req['id']} has been deleted sucessfully."]}), 200)
-
-
-@routes.route("/add-comment", methods=["POST"])
-def add_comment():
-    """Add comment to a post.
-    POST Request:
-    {
-        "author": str (>=2), name of the user creating the comment,
-        "body": str (>=5), body of the post, will be escaped.
-        "post_id": int (>=1), the id of the post the comment belongs to
-    }
-
-    Response:
-
-    {
-        "success": ["Comment added successfully."]
-    }
-    """
-    necessary = ["author", "body", "post_id"]
-    errors = []
+            records = [json.loads(line) for line in request.get_data().splitlines() if line.strip()]
+        except ValueError:
+            return make_response(jsonify({"error": ["Invalid NDJSON format."]}), 400)
+    else:
+        req, error = handlers.load(schemas.IMPORT_POSTS, _body())
+        if error:
+            return _respond(error)
+        records = req["posts"]
 
-    if not request.is_json:
-        return make_response(jsonify({"error": ["Request must be in JSON format."]}), 400)
-    try:
-        req = request.get_json()
-    except BadRequest:
-        return make_response(jsonify({"error": ["Invalid JSON format."]}), 400)
-    for param in necessary:
-        if param not in req.keys():
-            errors.append(f"Missing param: '{param}'")
-    if errors:
-        return make_response(jsonify({"error": errors}), 400)
-
-    if not isinstance(req["author"], str):
-        errors.append("'author' must be str.")
-    if not isinstance(req["body"], str):
-        errors.append("'body' must be str.")
-    if not isinstance(req["post_id"], int):
-        errors.append("'post_id' must be int.")
-    if errors:
-        return make_response(jsonify({"error": errors}), 400)
-
-    req["author"] = req["author"].strip()
-    req["body"] = req["body"].strip()
-
-    if not len(req["author"]) >= 2:
-        errors.append("'author' must be at least 2 characters.")
-    if not len(req["body"]) >= 1:
-        errors.append("'body' must be at least 1 characters.")
-    if errors:
-        return make_response(jsonify({"error": errors}), 400)
-    try:
-        control.add_comment(req["author"], req["body"], req["post_id"])
-    except SQLAlchemyError as err:
-        return make_response(jsonify({"error": err.args}))
-    return make_response(jsonify({"success": "Comment added successfully."}), 200)
-
-
-@routes.route("/delete-comment", methods=["DELETE"])
-def delete_comment():
-    """Delete a comment based on id.
-    DELETE Request:
-
-    {
-        "comment_id": int (>=1), the id of the desired comment to delete.
-    }
-
-    Response:
-
-    {
-        "success": ["Comment deleted successfully."]
-    }
-    """
-    if not request.is_json:
-        return make_response(jsonify({"error": ["Request must be in JSON format."]}), 400)
     try:
-        req = request.get_json()
-    except BadRequest:
-        return make_response(jsonify({"error": ["Invalid JSON format."]}), 400)
-    if "comment_id" not in req.keys():
-        return make_response(jsonify({"error": ["Missing param: 'comment_id'"]}), 400)
-
-    if not isinstance(req["comment_id"], int):
-        return make_response(jsonify({"error": "'comment_id' must be int."}), 400)
-    try:
-        control.delete_comment(req["comment_id"])
-    except SQLAlchemyError as err:
-        return make_response(jsonify({"error": err.args}))
-    return make_response(jsonify({"success": "Comment deleted successfully."}), 200)
-
-
-@routes.route("/edit-comment", methods=["PATCH"])
-def edit_comment():
-    """Update a comment based on id.
-    PATCH Request:
-    {
-        "comment_id": int (>=1), id of the comment to update,
-        "body": str (>=5), body of the comment, will be escaped.
-    }
+        posts, comments = bulk.import_posts(records)
+    except ValueError as err:
+        return make_response(jsonify({"error": [str(err)]}), 400)
+    except IntegrityError as err:
+        return make_response(jsonify({"error": [f"Nothing imported, duplicate post: {err.orig}"]}), 400)
+    return make_response(
+        jsonify({"success": [f"{posts} posts and {comments} comments have been imported."]}), 200
+    )
 
-    Response:
 
-    {
-        "success": ["Comment edited successfully."]
-    }
+@routes.route("/export-posts", methods=["GET"])
+def export_posts():
+    """Export every post with its comments, streamed as NDJSON (one post per line).
+    The posts have the format of the /import-posts request, the dates in ISO 8601.
     """
-    necessary = ["comment_id", "body"]
-    errors = []
-
-    if not request.is_json:
-        return make_response(jsonify({"error": ["Request must be in JSON format."]}), 400)
-    try:
-        req = request.get_json()
-    except BadRequest:
-        return make_response(jsonify({"error": ["Invalid JSON format."]}), 400)
-    for param in necessary:
-        if param not in req.keys():
-            errors.append(f"Missing param: '{param}'")
-    if errors:
-        return make_response(jsonify({"error": errors}), 400)
-
-    if not isinstance(req["comment_id"], int):
-        errors.append("'comment_id' must be int.")
-    if not isinstance(req["body"], str):
-        errors.append("'body' must be str.")
-    if errors:
-        return make_response(jsonify({"error": errors}), 400)
-
-    req["body"] = req["body"].strip()
-
-    if not len(req["body"]) >= 1:
-        errors.append("'body' must be at least 1 characters.")
-    if errors:
-        return make_response(jsonify({"error": errors}), 400)
+    def generate():
+        for record in bulk.export_posts():
+            yield json.dumps(record) + "\n"
 
-    try:
-        control.edit_comment(comment_id=req["comment_id"], body=req["body"])
-    except SQLAlchemyError as err:
-        return make_response(jsonify({"error": err.args}), 404)
-    return make_response(jsonify({"success": "Comment edited successfully."}), 200)
+    return Response(stream_with_context(generate()), status=200, mimetype="application/x-ndjson")
@@ -0,0 +1,371 @@
+"""
+Module for the validation of the JSON requests of the blog app.
+Every endpoint declares the fields of its request once, as a Schema. When the module is
+imported each schema is compiled to the source of a single validation function
+(one straight block of checks, no loop over the fields and no lookup of the rules),
+so validating a request costs about the same as the checks written by hand.
+
+A schema checks a request in three steps, each one stops the validation if it fails:
+    1. every required field is present: "Missing param: '<name>'",
+    2. every field has the right type: "'<name>' must be int." ...
+       (the optional fields missing from the request are set to their default first),
+    3. the values: the strings are stripped, then their length and the bounds of the ints
+       are checked: "'<name>' must be at least <n> characters.", "'<name>' must be >= <n>" ...
+Schema.validate returns the list of the errors of the failing step, in the order the fields
+are declared, and normalizes the request in place (defaults set, strings stripped).
+The endpoints with checks of their own (the image of a post) run the steps apart, to report
+the errors of their checks along with the ones of the values, see Schema.
+"""
+from .control import validate_email
+
+
+class Field:
+    """Base of the fields of a schema.
+    required: the field must be in the request, else it is set to 'default' if missing.
+    nullable: null is accepted as well.
+    blank: the value is only checked if it is truthy (null, "" and 0 are accepted as is).
+    type_error: message of a wrong type, instead of the one of the field."""
+    type_name = None
+
+    def __init__(self, required: bool=True, default=None, nullable: bool=False, blank: bool=False, type_error: str=None):
+        self.required = required
+        self.default = default
+        self.nullable = nullable
+        self.blank = blank
+        self.type_error = type_error
+        self.name = None
+
+    def type_test(self, value: str):
+        """Get the source of the expression true if 'value' (source) has the right type,
+        or None if the type is not checked."""
+        return None
+
+    def value_checks(self, value: str):
+        """Get the checks of the value, as a list of (source of the failing condition, error)."""
+        return []
+
+    def normalize(self, value: str):
+        """Get the source of the expression normalizing 'value' (source), or None."""
+        return None
+
+    def type_message(self):
+        """Get the error of a wrong type."""
+        if self.type_error:
+            return self.type_error
+        return f"'{self.name}' must be {self.type_name}."
+
+
+class Int(Field):
+    """Int field, 'min' is the lowest value accepted."""
+    type_name = "int"
+
+    def __init__(self, min: int=None, **kwargs):
+        super().__init__(**kwargs)
+        self.min = min
+
+    def type_test(self, value):
+        return f"isinstance({value}, int)"
+
+    def value_checks(self, value):
+        if self.min is None:
+            return []
+        return [(f"not {value} >= {self.min!r}", f"'{self.name}' must be >= {self.min}")]
+
+
+class Bool(Field):
+    """Boolean field."""
+    type_name = "boolean"
+
+    def type_test(self, value):
+        return f"isinstance({value}, bool)"
+
+
+class Str(Field):
+    """String field, stripped unless 'strip' is False, 'min_len' is the lowest length accepted."""
+    type_name = "str"
+
+    def __init__(self, min_len: int=None, strip: bool=True, **kwargs):
+        super().__init__(**kwargs)
+        self.min_len = min_len
+        self.strip = strip
+
+    def type_test(self, value):
+        return f"isinstance({value}, str)"
+
+    def type_message(self):
+        if not self.type_error and self.nullable:
+            return f"'{self.name}' must be str or null."
+        return super().type_message()
+
+    def normalize(self, value):
+        return f"{value}.strip()" if self.strip else None
+
+    def value_checks(self, value):
+        if self.min_len is None:
+            return []
+        return [(f"not len({value}) >= {self.min_len!r}", f"'{self.name}' must be at least {self.min_len} characters.")]
+
+
+class Email(Str):
+    """String field holding a valid email address, see control.validate_email."""
+
+    def value_checks(self, value):
+        return super().value_checks(value) + [
+            (f"not validate_email({value})", f"'{self.name}' is not a valid email address.")
+        ]
+
+
+class OneOf(Field):
+    """Field taking one of the given values."""
+
+    def __init__(self, *choices, **kwargs):
+        super().__init__(**kwargs)
+        self.choices = choices
+
+    def type_test(self, value):
+        return f"{value} in {self.choices!r}"
+
+    def type_message(self):
+        if self.type_error:
+            return self.type_error
+        return f"'{self.name}' must be " + " or ".join(repr(choice) for choice in self.choices) + "."
+
+
+class List(Field):
+    """List field, of ints if 'of_int', not empty if 'not_empty'."""
+
+    def __init__(self, of_int: bool=False, not_empty: bool=False, **kwargs):
+        super().__init__(**kwargs)
+        self.of_int = of_int
+        self.not_empty = not_empty
+
+    def type_test(self, value):
+        if self.of_int:
+            return f"isinstance({value}, list) and all(isinstance(item, int) for item in {value})"
+        return f"isinstance({value}, list)"
+
+    def type_message(self):
+        if self.type_error:
+            return self.type_error
+        return f"'{self.name}' must be a list of int." if self.of_int else f"'{self.name}' must be a list."
+
+    def value_checks(self, value):
+        if not self.not_empty:
+            return []
+        return [(f"not {value}", f"'{self.name}' must not be empty.")]
+
+
+class Const(Field):
+    """Field always set to the given value, whatever the request holds."""
+
+    def __init__(self, value):
+        super().__init__(required=False, default=value)
+
+
+def _compile(name: str, source: str):
+    """Helper to compile the source of validation functions.
+    Returns the namespace the functions are defined in."""
+    namespace = {"validate_email": validate_email}
+    exec(compile(source, f"<schema {name}>", "exec"), namespace)
+    return namespace
+
+
+# Lines of source of the first check of every validation function.
+_OBJECT_CHECK = [
+    "if not isinstance(req, dict):",
+    "    return ['Request must be a JSON object.']",
+]
+
+
+def _indent(lines: list, indent: str="    "):
+    """Helper to indent lines of source.
+    Returns a list of str."""
+    return [indent + line for line in lines]
+
+
+class Schema:
+    """The fields of a request, compiled to a single validation function, see the module docstring.
+    The steps are also compiled apart: validate_shape (presence and types, the request is then
+    normalized with its defaults) and validate_values (the values, after validate_shape), for the
+    endpoints adding checks of their own to the errors of the values.
+    The fields are checked in the order they are declared, presence_order and value_order give
+    the order of the first and the last steps if it differs (the names given come first)."""
+
+    def __init__(self, name: str, /, *, presence_order: tuple=(), value_order: tuple=(), **fields):
+        self.name = name
+        self.fields = fields
+        for field_name, field in fields.items():
+            field.name = field_name
+        self.presence_order = self._ordered(presence_order)
+        self.value_order = self._ordered(value_order)
+        self.source = "\n".join(
+            ["def validate(req):"] + _indent(_OBJECT_CHECK + self._lines())
+            + ["def validate_shape(req):"] + _indent(_OBJECT_CHECK + self._shape_lines() + ["return errors"])
+            + ["def validate_values(req):"] + _indent(["errors = []"] + self._value_lines())
+        ) + "\n"
+        namespace = _compile(name, self.source)
+        self.validate = namespace["validate"]
+        self.validate_shape = namespace["validate_shape"]
+        self.validate_values = namespace["validate_values"]
+
+    def _ordered(self, names: tuple):
+        """Helper to order the fields for a step, the given names first, then the other fields
+        in the order they are declared.
+        Returns a list of (name, field)."""
+        names = list(names) + [name for name in self.fields if name not in names]
+        return [(name, self.fields[name]) for name in names]
+
+    def _lines(self):
+        """Helper to generate the checks of every step of a dict request.
+        Returns a list of str (lines of source)."""
+        return self._shape_lines() + self._value_lines()
+
+    def _shape_lines(self):
+        """Helper to generate the checks of the presence and of the types of the fields of a dict
+        request, returning the errors of the failing step, with 'errors' left empty if they pass.
+        Returns a list of str (lines of source)."""
+        lines = ["errors = []"]
+        for name, field in self.presence_order:
+            if isinstance(field, Const):
+                lines.append(f"req[{name!r}] = {field.default!r}")
+            elif field.required:
+                lines.append(f"if {name!r} not in req:")
+                lines.append(f"    errors.append({f'Missing param: {name!r}'!r})")
+            else:
+                lines.append(f"req.setdefault({name!r}, {field.default!r})")
+        lines.append("if errors:")
+        lines.append("    return errors")
+
+        for name, field in self.fields.items():
+            test = field.type_test(f"req[{name!r}]")
+            if test is None:
+                continue
+            skip = []
+            if field.nullable:
+                skip.append(f"req[{name!r}] is not None")
+            if field.blank:
+                skip.append(f"req[{name!r}]")
+            condition = f"not ({test})"
+            if skip:
+                condition = " and ".join(skip + [condition])
+            lines.append(f"if {condition}:")
+            lines.append(f"    errors.append({field.type_message()!r})")
+        lines.append("if errors:")
+        lines.append("    return errors")
+        return lines
+
+    def _value_lines(self):
+        """Helper to generate the normalization and the checks of the values of the fields,
+        returning the errors.
+        Returns a list of str (lines of source)."""
+        lines = []
+        for name, field in self.value_order:
+            normalize = field.normalize(f"req[{name!r}]")
+            checks = field.value_checks(f"req[{name!r}]")
+            if not normalize and not checks:
+                continue
+            indent = ""
+            if field.blank:
+                lines.append(f"if req[{name!r}]:")
+                indent = "    "
+            elif field.nullable:
+                lines.append(f"if req[{name!r}] is not None:")
+                indent = "    "
+            if normalize:
+                lines.append(f"{indent}req[{name!r}] = {normalize}")
+            for condition, error in checks:
+                lines.append(f"{indent}if {condition}:")
+                lines.append(f"{indent}    errors.append({error!r})")
+        lines.append("return errors")
+        return lines
+
+
+class Switch:
+    """Pick the schema of a request by the presence of a key: 'with_key' if the request has it,
+    'without_key' otherwise. Validates like a Schema, the two schemas are compiled to a
+    single function testing the key inline."""
+
+    def __init__(self, key: str, with_key: Schema, without_key: Schema):
+        self.key = key
+        self.with_key = with_key
+        self.without_key = without_key
+        self.source = "\n".join(
+            ["def validate(req):"]
+            + _indent(_OBJECT_CHECK + [f"if {key!r} in req:"])
+            + _indent(with_key._lines(), "        ")
+            + _indent(without_key._lines())
+        ) + "\n"
+        self.validate = _compile(f"{with_key.name} {key}", self.source)["validate"]
+
+
+def _listing(cursor: bool, **fields):
+    """Helper to make the fields of a listing of posts, paginated by 'page' or by the 'after' cursor
+    (the page is then always 1).
+    Returns a dict of fields."""
+    listing = dict(fields)
+    listing["num"] = Int(min=0)
+    if cursor:
+        listing["page"] = Const(1)
+        listing["after"] = Str(nullable=True, strip=False)
+    else:
+        listing["page"] = Int(min=1)
+    return listing
+
+
+def _posts_listing(cursor: bool):
+    """Helper to make the schema of /get-posts, in the order of the checks written by hand before
+    the schemas: the types of 'comments' first, the presence of 'num' and 'page' first."""
+    fields = _listing(cursor, comments=Bool())
+    fields.update(
+        comments_limit=Int(min=1, required=False, nullable=True),
+        summary=Bool(required=False, default=False),
+        stream=Bool(required=False, default=False),
+        format=OneOf("json", "ndjson", required=False, default="json"),
+    )
+    return Schema("get-posts", presence_order=("num", "page", "comments"), **fields)
+
+
+def _user_listing(cursor: bool):
+    """Helper to make the schema of /get-posts-by-user."""
+    fields = _listing(cursor, user=Str(min_len=2))
+    fields.update(
+        summary=Bool(required=False, default=False),
+        stream=Bool(required=False, default=False),
+        format=OneOf("json", "ndjson", required=False, default="json"),
+    )
+    return Schema("get-posts-by-user", **fields)
+
+
+GET_POSTS = Switch("after", _posts_listing(cursor=True), _posts_listing(cursor=False))
+GET_POSTS_BY_USER = Switch("after", _user_listing(cursor=True), _user_listing(cursor=False))
+POST_ID = Schema("post-id", id=Int())
+CONTACT = Schema(
+    "contact",
+    value_order=("name", "message", "email"),
+    name=Str(min_len=2),
+    email=Email(),
+    message=Str(min_len=2),
+)
+SEARCH = Schema("search", query=Str(min_len=2), num=Int(min=1), page=Int(min=1))
+IMPORT_POSTS = Schema("import-posts", posts=List())
+CREATE_POST = Schema(
+    "create-post",
+    author=Str(min_len=2),
+    title=Str(min_len=5),
+    subtitle=Str(min_len=5),
+    body=Str(min_len=5),
+    img_url=Str(min_len=2),
+)
+UPDATE_POST = Schema(
+    "update-post",
+    id=Int(),
+    title=Str(min_len=5),
+    subtitle=Str(min_len=5),
+    body=Str(min_len=5),
+    img_url=Str(min_len=2, blank=True),
+)
+DELETE_POSTS = Schema("delete-posts", ids=List(of_int=True, not_empty=True))
+ADD_COMMENT = Schema("add-comment", author=Str(min_len=2), body=Str(min_len=1), post_id=Int())
+COMMENT_ID = Schema("comment-id", comment_id=Int())
+DELETE_COMMENTS = Schema("delete-comments", comment_ids=List(of_int=True, not_empty=True))
+EDIT_COMMENT = Schema("edit-comment", comment_id=Int(), body=Str(min_len=1))
@@ -0,0 +1,250 @@
+"""
+Module for the generation of synthetic posts and comments of the blog app, to fill a db
+at the scale of production (see the "seed" command of the cli module).
+
+The data is made by a seeded random generator, the same arguments give the same data:
+authors posting with a long tail (a few authors write most of the posts), titles, subtitles
+and bodies of varying length made of paragraphs of random sentences, and comments following an
+exponential distribution per post (most posts have a few comments, some have many),
+dated after their post. The posts are dated in order of their ids, over the last YEARS years.
+
+The posts are made in chunks of SEED_BATCH posts, each by a function of its number only, so
+the chunks can be made by several processes. The rows are made as the tuples of the values
+stored in the db (dates formatted as by SQLAlchemy), so a chunk is written with plain
+executemany inserts of the driver, and committed on its own: a large transaction per chunk.
+The full-text index is dropped during the load and rebuilt once at the end, unless told
+otherwise, updating it on every insert is the slowest part of a load.
+"""
+import datetime
+import multiprocessing
+import random
+
+from sqlalchemy import func, select, text
+
+from . import app
+from . import db
+from . import cache
+from . import migrations
+from .models import Post, Comment, make_excerpt
+
+
+# Number of posts made and written at once.
+SEED_BATCH = 5000
+# The posts are dated over this many years, up to now.
+YEARS = 5
+# Columns of the rows made by make_chunk, in order.
+POST_COLUMNS = (
+    "id", "author", "title", "subtitle", "body", "excerpt", "date", "img_url", "version", "modified",
+    "comment_count",
+)
+COMMENT_COLUMNS = ("post_id", "author", "body", "date")
+# Number of different sentences the bodies of the posts of a chunk are made of.
+SENTENCES = 2000
+
+_FIRST_NAMES = (
+    "Ada", "Alan", "Alice", "Amir", "Anna", "Ben", "Carla", "Chen", "Dana", "David", "Elena", "Emma",
+    "Farid", "Grace", "Hana", "Hugo", "Ines", "Ivan", "Jade", "Jonas", "Kai", "Lea", "Liam", "Lucia",
+    "Mara", "Mateo", "Mei", "Nadia", "Noah", "Olga", "Omar", "Paula", "Quentin", "Rosa", "Sami",
+    "Sofia", "Tariq", "Tom", "Uma", "Victor", "Wen", "Yara", "Yusuf", "Zoe",
+)
+_LAST_NAMES = (
+    "Adams", "Bauer", "Costa", "Dubois", "Evans", "Fischer", "Garcia", "Hansen", "Ito", "Jensen",
+    "Kowalski", "Lopez", "Martin", "Nakamura", "Novak", "Okafor", "Petrov", "Quinn", "Rossi", "Silva",
+    "Smith", "Tanaka", "Urban", "Varga", "Wang", "Weber", "Xu", "Young", "Zhang",
+)
+_TOPICS = (
+    "Python", "SQLite", "Flask", "caching", "databases", "testing", "deployment", "coffee", "travel",
+    "photography", "gardening", "cooking", "running", "music", "books", "startups", "security",
+    "design", "open source", "remote work", "the command line", "typography", "cycling", "chess",
+)
+_TITLES = (
+    "A practical guide to {}", "What I learned about {}", "Notes on {}", "Getting started with {}",
+    "Why {} matters", "The trouble with {}", "Ten tips for {}", "Rethinking {}", "A year of {}",
+    "{} in practice", "Beyond the basics of {}", "How I use {}", "Common mistakes with {}",
+)
+_SUBTITLES = (
+    "Lessons from the field", "A short introduction", "Things I wish I knew earlier",
+    "An opinionated take", "From zero to production", "Some numbers and a few surprises",
+    "A look under the hood", "What worked and what did not", "A beginner's perspective",
+)
+_WORDS = (
+    "the of and to in is that it for as with was on be by this are from at or an have not but "
+    "which one all were we when there can more if will about so what out up into some them time "
+    "only new would other then these two may first any like now such make over our even most "
+    "after also did many before must through back where much way well down should because each "
+    "just those people how too little state good very world still own see men work long get here "
+    "between both life being under never day same another know while last might great old year "
+    "off come since against go came right used take three system data query index cache server "
+    "request response table row column page post comment author user code test build deploy "
+    "latency throughput memory disk network thread process worker lock transaction commit read "
+    "write update delete insert select join order limit offset cursor batch stream file config"
+).split()
+_COMMENTS = (
+    "Great post, thanks!", "Very helpful, bookmarked.", "I disagree with the second part.",
+    "Could you write more about this?", "This saved me hours.", "Nice write-up.",
+    "Interesting, I had the opposite experience.", "Any benchmarks to back this up?",
+    "Clear and to the point.", "Thanks for sharing.", "What about the edge cases?",
+    "I tried this and it worked.", "Typo in the third paragraph.", "Looking forward to part two.",
+)
+
+
+def _names(rnd: random.Random, number: int, prefix: str=""):
+    """Helper to make 'number' distinct names of people.
+    Returns a list of str."""
+    names = []
+    seen = set()
+    for index in range(number):
+        name = f"{rnd.choice(_FIRST_NAMES)} {rnd.choice(_LAST_NAMES)}"
+        if name in seen:
+            name = f"{name} {index}"
+        seen.add(name)
+        names.append(prefix + name)
+    return names
+
+
+def _date(timestamp: float):
+    """Helper to format a timestamp as a date stored by the DateTime columns of SQLite.
+    Returns a str."""
+    return datetime.datetime.fromtimestamp(timestamp).isoformat(" ", "microseconds")
+
+
+def _insert(table: str, columns: tuple):
+    """Helper to make the INSERT statement of rows of the values of 'columns'.
+    Returns a str."""
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+
+def _sentences(rnd: random.Random, number: int):
+    """Helper to make 'number' sentences of 6 to 20 words, the bodies are made of them.
+    Returns a list of str."""
+    sentences = []
+    for _ in range(number):
+        sentence = " ".join(rnd.choices(_WORDS, k=rnd.randint(6, 20)))
+        sentences.append(sentence[0].upper() + sentence[1:] + ".")
+    return sentences
+
+
+def _text(rnd: random.Random, sentences: list, number: int):
+    """Helper to make a text of 'number' sentences picked from 'sentences', in paragraphs
+    of 2 to 6 sentences.
+    Returns a str."""
+    picked = rnd.choices(sentences, k=number)
+    paragraphs = []
+    start = 0
+    while start < number:
+        end = start + rnd.randint(2, 6)
+        paragraphs.append(" ".join(picked[start:end]))
+        start = end
+    return "\n\n".join(paragraphs)
+
+
+def make_chunk(seed: int, chunk: int, first_id: int, posts: int, position: int, total: int,
+               authors: int, comments: float, start: float, span: float):
+    """Make the rows of the posts 'first_id' to 'first_id' + 'posts' - 1 and of their comments,
+    the posts from 'position' of a load of 'total' posts by 'authors' authors, with 'comments'
+    comments per post on average, dated from 'start' (timestamp) over 'span' seconds.
+    Only depends on its arguments, can run in an other process.
+    Returns a tuple of (post rows, comment rows), the rows are tuples of the values of
+    POST_COLUMNS and COMMENT_COLUMNS."""
+    rnd = random.Random(f"{seed}-{chunk}")
+    names = _names(random.Random(seed), authors)
+    commenters = _names(random.Random(f"{seed}-commenters"), max(authors * 4, 1))
+    # Zipf-like weights, the first authors post the most.
+    weights = [1 / rank for rank in range(1, authors + 1)]
+    post_authors = rnd.choices(names, weights=weights, k=posts)
+    sentences = _sentences(rnd, SENTENCES)
+    now = start + span
+    post_rows = []
+    comment_rows = []
+    for offset in range(posts):
+        post_id = first_id + offset
+        topic = rnd.choice(_TOPICS)
+        body = _text(rnd, sentences, rnd.randint(6, 30))
+        timestamp = start + span * (position + offset) / total
+        count = int(rnd.expovariate(1 / comments)) if comments > 0 else 0
+        modified = timestamp
+        for _ in range(count):
+            comment_timestamp = rnd.uniform(timestamp, now)
+            modified = max(modified, comment_timestamp)
+            comment_rows.append(
+                (post_id, rnd.choice(commenters), rnd.choice(_COMMENTS), _date(comment_timestamp))
+            )
+        post_rows.append((
+            post_id,
+            post_authors[offset],
+            f"{rnd.choice(_TITLES).format(topic)} #{post_id}",
+            rnd.choice(_SUBTITLES),
+            body,
+            make_excerpt(body),
+            _date(timestamp),
+            f"https://picsum.photos/seed/{post_id}/1200/600",
+            1,
+            _date(modified),
+            count,
+        ))
+    return post_rows, comment_rows
+
+
+def _make_chunk(args):
+    """Helper to call make_chunk with a tuple of arguments, for Pool.imap."""
+    return make_chunk(*args)
+
+
+def seed(posts: int, comments: float=5, authors: int=1000, processes: int=1, seed: int=0,
+         rebuild_fts: bool=True, progress=None):
+    """Add 'posts' synthetic posts with 'comments' comments per post on average, by 'authors'
+    authors, after the existing posts. The chunks are made by 'processes' processes (1: in
+    this process), and written in this one as they come, in order. 'progress' is called with
+    the numbers of posts and comments written so far after every chunk, if given.
+    Returns a tuple of (number of posts, number of comments) added."""
+    chunks = []
+    with app.app_context():
+        first_id = (db.session.execute(select(func.max(Post.id))).scalar() or 0) + 1
+        db.session.remove()
+    now = datetime.datetime.now().timestamp()
+    span = YEARS * 365 * 24 * 60 * 60
+    for chunk, offset in enumerate(range(0, posts, SEED_BATCH)):
+        size = min(SEED_BATCH, posts - offset)
+        chunks.append((seed, chunk, first_id + offset, size, offset, posts, authors, comments, now - span, span))
+
+    pool = None
+    if processes > 1 and len(chunks) > 1:
+        pool = multiprocessing.Pool(processes)
+        made = pool.imap(_make_chunk, chunks)
+    else:
+        made = map(_make_chunk, chunks)
+
+    added_posts = 0
+    added_comments = 0
+    fts = False
+    try:
+        with app.app_context():
+            with db.engine.connect() as conn:
+                if rebuild_fts:
+                    fts = conn.execute(text(
+                        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'posts_fts_insert'"
+                    )).first() is not None
+                    if fts:
+                        conn.execute(text("DROP TRIGGER posts_fts_insert"))
+                        conn.commit()
+                insert_post = _insert(Post.__tablename__, POST_COLUMNS)
+                insert_comment = _insert(Comment.__tablename__, COMMENT_COLUMNS)
+                for post_rows, comment_rows in made:
+                    conn.exec_driver_sql(insert_post, post_rows)
+                    if comment_rows:
+                        conn.exec_driver_sql(insert_comment, comment_rows)
+                    conn.commit()
+                    added_posts += len(post_rows)
+                    added_comments += len(comment_rows)
+                    if progress:
+                        progress(added_posts, added_comments)
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if fts:
+            # Adds the trigger back, and indexes the posts added so far.
+            with app.app_context():
+                with db.engine.begin() as conn:
+                    migrations.rebuild_search_index(conn)
+        cache.responses.clear()
+    return added_posts, added_comments
@@ -0,0 +1,186 @@
+"""
+Module for the JSON serialization of the responses of the blog app.
+The app uses FastJSONProvider, which encodes with orjson if it is installed
+(falls back to the json module of the standard library otherwise).
+
+The JSON of every post is encoded once and cached as a fragment of bytes by
+(id, version, modification time, variant), a listing is assembled from the cached fragments, so the
+posts that have not changed are not encoded again. Post dicts carry the key of
+their fragment, see PostDict.
+
+Dates are encoded as HTTP dates, the same as the default provider of Flask.
+If the 'JSON_DATETIME_ISO' config of the app is True, they are encoded as
+ISO 8601 instead, natively by orjson (faster).
+"""
+import json
+import threading
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from flask.json.provider import DefaultJSONProvider
+
+
+# Max number of encoded posts kept in the fragment cache.
+FRAGMENTS_SIZE = 8192
+
+
+class PostDict(dict):
+    """Dict of a post (see Post.to_dict), with the key of its cached JSON fragment.
+    The key must change whenever the content of the dict changes, and never be the one of
+    an other post: it is made of the id, version and modification time of the post (the id
+    of a deleted post is reused by SQLite) and of what is in the dict (comments, summary...)."""
+    __slots__ = ("fragment_key",)
+
+    def __init__(self, post: dict, fragment_key: tuple=None):
+        super().__init__(post)
+        self.fragment_key = fragment_key
+
+
+class FragmentCache:
+    """LRU cache of the encoded JSON of the posts."""
+
+    def __init__(self, maxsize: int=FRAGMENTS_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Get the encoded JSON of the given key.
+        Returns bytes or None if not cached."""
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return fragment
+
+    def set(self, key, fragment: bytes):
+        """Store the encoded JSON of the given key."""
+        with self._lock:
+            self._entries[key] = fragment
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every fragment."""
+        with self._lock:
+            self._entries.clear()
+
+
+fragments = FragmentCache()
+
+
+def _has_posts(obj):
+    """Helper to check if a list or dict (one level deep) contains PostDicts."""
+    if isinstance(obj, list):
+        return bool(obj) and isinstance(obj[0], PostDict)
+    if isinstance(obj, dict) and not isinstance(obj, PostDict):
+        return any(_has_posts(value) for value in obj.values() if isinstance(value, list))
+    return False
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider of the app, see the module docstring.
+    The output is always compact and the keys sorted. With orjson non ASCII characters
+    are sent as UTF-8 instead of escape sequences."""
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.datetime_iso = app.config.get("JSON_DATETIME_ISO", False)
+        if orjson is not None:
+            self._options = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+            if not self.datetime_iso:
+                self._options |= orjson.OPT_PASSTHROUGH_DATETIME
+
+    def _default(self, obj):
+        """Helper, encode the types JSON does not know."""
+        if self.datetime_iso and hasattr(obj, "isoformat"):
+            return obj.isoformat()
+        return self.default(obj)
+
+    def _encode_value(self, obj):
+        """Helper to encode a value without fragments.
+        Returns bytes."""
+        if orjson is not None:
+            return orjson.dumps(obj, default=self._default, option=self._options)
+        return json.dumps(
+            obj,
+            default=self._default,
+            ensure_ascii=self.ensure_ascii,
+            sort_keys=True,
+            separators=(",", ":"),
+        ).encode()
+
+    def encode(self, obj):
+        """Encode a value, the posts (PostDict) are taken from or added to the fragment cache.
+        Returns bytes."""
+        if isinstance(obj, PostDict) and obj.fragment_key is not None:
+            fragment = fragments.get(obj.fragment_key)
+            if fragment is None:
+                fragment = self._encode_value(obj)
+                fragments.set(obj.fragment_key, fragment)
+            return fragment
+        if not _has_posts(obj):
+            return self._encode_value(obj)
+        if isinstance(obj, list):
+            return b"[" + b",".join(self.encode(item) for item in obj) + b"]"
+        items = sorted(obj.items())
+        return b"{" + b",".join(self._encode_value(key) + b":" + self.encode(value) for key, value in items) + b"}"
+
+    def _options_of(self, kwargs: dict):
+        """Helper to map the keyword arguments of json.dumps to orjson: 'default', 'sort_keys',
+        'indent' (2 or None), 'separators' (compact only) and 'ensure_ascii' (False only).
+        Returns a tuple of (orjson options, default).
+        Raises TypeError for an argument, or a value, orjson does not support."""
+        kwargs = dict(kwargs)
+        options = self._options
+        default = kwargs.pop("default", self._default)
+        if not kwargs.pop("sort_keys", True):
+            options &= ~orjson.OPT_SORT_KEYS
+        indent = kwargs.pop("indent", None)
+        if indent == 2:
+            options |= orjson.OPT_INDENT_2
+        elif indent is not None:
+            raise TypeError("'indent' must be 2 or None, orjson only indents by 2 spaces.")
+        if kwargs.pop("separators", None) not in (None, (",", ":")):
+            raise TypeError("'separators' must be (',', ':') or None, orjson only writes compact JSON.")
+        if kwargs.pop("ensure_ascii", False):
+            raise TypeError("'ensure_ascii' must be False, orjson writes non ASCII characters as UTF-8.")
+        if kwargs:
+            raise TypeError(f"Unsupported keyword arguments: {', '.join(sorted(kwargs))}.")
+        return options, default
+
+    def dumps(self, obj, **kwargs):
+        """Serialize data as JSON to a string. Without keyword arguments the posts are taken
+        from the fragment cache (see encode), with them the data is encoded as a whole, see
+        _options_of for the arguments supported with orjson, all the ones of json.dumps without.
+        Returns a str.
+        Raises TypeError for an argument orjson does not support."""
+        if not kwargs:
+            return self.encode(obj).decode()
+        if orjson is None:
+            kwargs.setdefault("default", self._default)
+            return json.dumps(obj, **kwargs)
+        options, default = self._options_of(kwargs)
+        return orjson.dumps(obj, default=default, option=options).decode()
+
+    def loads(self, s, **kwargs):
+        """Deserialize data as JSON from a string or bytes."""
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        """Serialize the given arguments as JSON to a compact JSON response.
+        Returns a Response."""
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.encode(obj) + b"\n", mimetype=self.mimetype)
@@ -0,0 +1,51 @@
+"""
+Module for running the blog app under a pre-forking server (gunicorn, see gunicorn.conf.py).
+The app is created once in the master process (preload), before the workers are forked,
+so the imports, the config and the migrations of the db are done only once.
+Everything a worker must not share with the master or the other workers is set up
+after the fork: the connections of the engines, the HTTP session of the image checks,
+the response caches and the background mail sender. The image checks already made by
+the master are kept, they are as valid in every worker.
+"""
+from sqlalchemy import text
+
+from . import app, db, init_app
+from . import cache
+from . import images
+from . import mailer
+from .serialize import fragments
+
+
+def create_app():
+    """Create the app in the master process: init the app, the mail sender is started by the
+    workers (threads do not survive the fork), and close the connections opened by the migrations.
+    Returns the app."""
+    init_app()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    return app
+
+
+def post_fork():
+    """Set up the state of a freshly forked worker, and warm up its connections.
+    Connections inherited from the master are dropped without being closed,
+    they still belong to the master."""
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+        for engine in db.engines.values():
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+    images.session = images._new_session()
+    cache.responses.clear()
+    fragments.clear()
+    mailer.start()
+
+
+def worker_exit():
+    """Stop the mail sender and close the connections of a worker on its way out."""
+    mailer.sender.stop(timeout=mailer.SMTP_TIMEOUT)
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
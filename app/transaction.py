@@ -0,0 +1,129 @@
+"""
+Module for the units of work of the blog app: the changes made by the control functions
+called within a unit share one session and one transaction, committed once at its end.
+
+Every request of the routes blueprint is a unit of work (see begin and end, called by the
+hooks of the routes module): the control functions it calls use the session of its app
+context, their changes are flushed as they are made and committed after the response is
+made, or rolled back if the response is an error. The batch context manager makes a unit
+of the control calls of a block, out of a request (CLI commands, scripts).
+Out of a unit, every control function pushes its own app context and commits on its own.
+
+The response cache is invalidated as soon as a change is made, so the rest of the unit
+reads its own changes, and again at the end of the unit: the entries cached meanwhile
+(by other threads, from the data before the commit, or by the unit itself, from a change
+rolled back) are dropped. The other work waiting for the commit (waking the mail sender
+up) is run at the end of the unit too, see at_end.
+
+The helpers writing to the db out of the control module (the image checks cached in the db
+by the images module, the imports of the bulk module) join the unit the same way: the writer
+engine has a single connection, held by the session of the unit once it has changed something,
+so a session of their own would wait for it until the pool timeout.
+"""
+from contextlib import contextmanager, nullcontext
+
+from flask import g, has_app_context
+
+from . import app
+from . import db
+from . import cache
+
+
+def _unit():
+    """Helper to get the unit of work of the current app context.
+    Returns the list of the (function, args) to call at its end, None if not in a unit."""
+    if not has_app_context():
+        return None
+    return g.get("unit_of_work")
+
+
+def context():
+    """Get the context the control functions work in: nothing to push within a unit of work,
+    its session is used, a new app context otherwise.
+    Returns a context manager."""
+    if _unit() is not None:
+        return nullcontext()
+    return app.app_context()
+
+
+def commit():
+    """Commit the session of the current app context, or only flush it within a unit of work:
+    it is committed at the end of the unit."""
+    if _unit() is not None:
+        db.session.flush()
+    else:
+        db.session.commit()
+
+
+def rollback():
+    """Roll the session of the current app context back, out of a unit of work only: within
+    a unit, its changes are rolled back with the unit, at its end."""
+    if _unit() is None:
+        db.session.rollback()
+
+
+def at_end(function, *args):
+    """Call function(*args) at the end of the unit of work, after its commit or rollback,
+    right now if not in a unit."""
+    unit = _unit()
+    if unit is None:
+        function(*args)
+    else:
+        unit.append((function, args))
+
+
+def invalidate(*tags):
+    """Invalidate the responses of the cache with any of the given tags, now and again at
+    the end of the unit of work if in one, see the module docstring."""
+    cache.responses.invalidate(*tags)
+    if _unit() is not None:
+        at_end(cache.responses.invalidate, *tags)
+
+
+def begin():
+    """Open a unit of work in the current app context, the one of a request."""
+    g.unit_of_work = []
+
+
+def end(commit: bool=True):
+    """Close the unit of work of the current app context, if any: commit its session, or
+    roll it back if not 'commit', if a flush of the unit failed (an IntegrityError turned into
+    a response by a route) or if the commit fails, then call the functions of at_end.
+    Raises the error of the commit, if any."""
+    unit = g.pop("unit_of_work", None) if has_app_context() else None
+    if unit is None:
+        return
+    try:
+        if commit and db.session.is_active:
+            db.session.commit()
+        else:
+            db.session.rollback()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        for function, args in unit:
+            function(*args)
+
+
+@contextmanager
+def batch():
+    """Make a unit of work of the control calls of the block, in an app context of its own:
+    their changes are committed together at the end of the block, or rolled back if it raises.
+    Within a unit (a request or an other batch), the block joins it.
+
+        with transaction.batch():
+            control.add_comment("Ada", "First!", post_id)
+            control.delete_comment(comment_id)
+    """
+    if _unit() is not None:
+        yield
+        return
+    with app.app_context():
+        begin()
+        try:
+            yield
+        except BaseException:
+            end(commit=False)
+            raise
+        end()
@@ -0,0 +1,11 @@
+"""
+ASGI entry point of the blog app, same API as the WSGI app with async endpoints:
+
+    hypercorn asgi:app --workers 2
+
+See app/asgi.py. wsgi.py serves the WSGI app with gunicorn, main.py runs the development server.
+"""
+from app.asgi import create_app
+
+
+app = create_app()
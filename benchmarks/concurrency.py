@@ -0,0 +1,150 @@
+"""
+Concurrency benchmark of the SQLite engine profile (see app/engine.py).
+Readers list posts through GET /get-posts while writers add comments through POST /add-comment,
+for a fixed time, once with the default engine of Flask-SQLAlchemy and once with the profile
+(WAL, read-only readers and a single serialized writer).
+Every run is made in a fresh process, with its own db in a temporary directory.
+
+Usage, from the root of the repo:
+
+    python benchmarks/concurrency.py [--readers 8] [--writers 2] [--seconds 10] [--posts 2000]
+"""
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Posts per page of the readers, which go through the first MAX_PAGES pages at most.
+PAGE_SIZE = 20
+MAX_PAGES = 50
+
+
+def _prepare(workdir):
+    """Write the config files the app loads from the working directory."""
+    config = os.path.join(workdir, "app", ".config")
+    os.makedirs(config)
+    with open(os.path.join(config, "app.key"), "w") as f:
+        f.write("benchmark\n")
+    with open(os.path.join(config, "db.key"), "w") as f:
+        f.write(os.path.join(workdir, "blog.db") + "\n")
+    with open(os.path.join(config, "email.key"), "w") as f:
+        f.write("bench@localhost\nkey\nbench@localhost\n")
+
+
+def run(profile: bool, readers: int, writers: int, seconds: float, posts: int):
+    """Run the benchmark in the current process.
+    Returns a dict of the results."""
+    workdir = tempfile.mkdtemp(prefix="blog-bench-")
+    _prepare(workdir)
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+
+    from app import app, init_app, bulk
+
+    app.config.update(MAIL_SENDER=False, SQLITE_ENGINE_PROFILE=profile)
+    init_app()
+    bulk.import_posts(
+        {
+            "author": f"author{i % 50}",
+            "title": f"Benchmark post {i}",
+            "subtitle": "subtitle",
+            "body": "lorem ipsum dolor sit amet " * 40,
+            "comments": [{"author": "reader", "body": "first"}],
+        }
+        for i in range(posts)
+    )
+
+    # Only the pages holding posts, past the last one a read is a 404, not a failure.
+    pages = min(MAX_PAGES, max(1, math.ceil(posts / PAGE_SIZE)))
+    counts = {"read": 0, "write": 0, "errors": 0}
+    lock = threading.Lock()
+    stop = time.monotonic() + seconds
+
+    def worker(write: bool, number: int):
+        client = app.test_client()
+        done = errors = 0
+        i = number
+        while time.monotonic() < stop:
+            i += 1
+            if write:
+                response = client.post(
+                    "/add-comment",
+                    json={"author": "writer", "body": f"comment {i}", "post_id": i % posts + 1}
+                )
+                failed = response.status_code != 200 or "error" in response.json
+            else:
+                response = client.get(
+                    "/get-posts",
+                    json={"num": PAGE_SIZE, "page": i % pages + 1, "comments": True}
+                )
+                failed = response.status_code != 200
+            if failed:
+                errors += 1
+            else:
+                done += 1
+        with lock:
+            counts["write" if write else "read"] += done
+            counts["errors"] += errors
+
+    threads = [threading.Thread(target=worker, args=(False, n)) for n in range(readers)]
+    threads += [threading.Thread(target=worker, args=(True, n * 7919)) for n in range(writers)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    return {
+        "profile": profile,
+        "reads_per_s": round(counts["read"] / elapsed, 1),
+        "writes_per_s": round(counts["write"] / elapsed, 1),
+        "errors": counts["errors"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--profile", choices=["on", "off"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.profile:
+        result = run(args.profile == "on", args.readers, args.writers, args.seconds, args.posts)
+        print(json.dumps(result))
+        return
+
+    results = {}
+    for profile in ("off", "on"):
+        output = subprocess.run(
+            [
+                sys.executable, os.path.abspath(__file__), "--profile", profile,
+                "--readers", str(args.readers), "--writers", str(args.writers),
+                "--seconds", str(args.seconds), "--posts", str(args.posts),
+            ],
+            capture_output=True, text=True, check=True
+        ).stdout
+        results[profile] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"{'profile':<10}{'reads/s':>12}{'writes/s':>12}{'errors':>10}")
+    for profile, result in results.items():
+        print(f"{profile:<10}{result['reads_per_s']:>12}{result['writes_per_s']:>12}{result['errors']:>10}")
+    off, on = results["off"], results["on"]
+    if off["reads_per_s"]:
+        print(f"read throughput: x{on['reads_per_s'] / off['reads_per_s']:.2f}")
+    if off["writes_per_s"]:
+        print(f"write throughput: x{on['writes_per_s'] / off['writes_per_s']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
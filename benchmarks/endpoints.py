@@ -0,0 +1,333 @@
+"""
+Benchmark of the endpoints of the blog app, at several sizes of the db.
+For every size a fresh db is seeded with posts and comments, then every scenario (list,
+get, by-user, create, update, comment, delete) sends the same requests, chosen by a seeded
+random generator, through:
+    - client: the Flask test client, one request at a time, in a fresh process,
+    - server: a real gunicorn server (gunicorn.conf.py) with several workers, by concurrent clients.
+The latency percentiles (p50, p95, p99) and the throughput of every scenario are printed
+and saved as JSON, a previous result file can be given to compare with.
+
+The images of the posts are served by a local HTTP server, so only the first check of the
+image hits the network, the same as a cached image in production.
+
+Usage, from the root of the repo:
+
+    python benchmarks/endpoints.py [--sizes 1000,10000] [--comments 5] [--requests 300]
+        [--modes client,server] [--workers 4] [--concurrency 8] [--output results.json]
+        [--compare previous.json]
+"""
+import argparse
+import datetime
+import http.server
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from concurrency import ROOT, _prepare
+
+
+SCENARIOS = ("list", "get", "by-user", "create", "update", "comment", "delete")
+# Number of authors of the seeded posts.
+AUTHORS = 50
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(256)
+
+
+class _ImageHandler(http.server.BaseHTTPRequestHandler):
+    """Serve the same small PNG for every path."""
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(PNG)))
+        self.end_headers()
+        self.wfile.write(PNG)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_image_server():
+    """Start the local HTTP server of the images in a thread.
+    Returns the url of the image."""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _ImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/img.png"
+
+
+def _free_port():
+    """Helper to get a free TCP port of localhost."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def seed(posts: int, comments: int):
+    """Seed the db of the working directory with 'posts' posts of AUTHORS authors,
+    with 'comments' comments each."""
+    sys.path.insert(0, ROOT)
+    from app import app, init_app, bulk
+
+    app.config["MAIL_SENDER"] = False
+    init_app()
+    bulk.import_posts(
+        {
+            "author": f"author{i % AUTHORS}",
+            "title": f"Benchmark post {i}",
+            "subtitle": "A post of the benchmark",
+            "body": "lorem ipsum dolor sit amet " * 40,
+            "comments": [{"author": f"reader{j}", "body": f"comment {j}"} for j in range(comments)],
+        }
+        for i in range(posts)
+    )
+
+
+def requests_of(scenario: str, posts: int, number: int, img_url: str, seed: int=0):
+    """Make the requests of a scenario, the same for every run with the same arguments.
+    The deletes take the ids 1 to 'number', the other scenarios random ids of the seeded posts.
+    Returns a list of (method, path, JSON body)."""
+    rnd = random.Random(f"{scenario}-{seed}")
+    pages = max(posts // 10, 1)
+    made = []
+    for i in range(number):
+        post_id = rnd.randint(number + 1, posts) if posts > number else rnd.randint(1, posts)
+        if scenario == "list":
+            made.append(("GET", "/get-posts", {"num": 10, "page": rnd.randint(1, pages), "comments": True}))
+        elif scenario == "get":
+            made.append(("GET", "/get-post", {"id": post_id}))
+        elif scenario == "by-user":
+            made.append(("GET", "/get-posts-by-user", {
+                "user": f"author{rnd.randrange(AUTHORS)}", "num": 10, "page": rnd.randint(1, max(pages // AUTHORS, 1)),
+            }))
+        elif scenario == "create":
+            made.append(("POST", "/create-post", {
+                "author": f"author{rnd.randrange(AUTHORS)}", "title": f"New post {i}",
+                "subtitle": "A new post", "body": "lorem ipsum dolor sit amet " * 40, "img_url": img_url,
+            }))
+        elif scenario == "update":
+            made.append(("PATCH", "/update-post", {
+                "id": post_id, "title": f"Updated post {i}", "subtitle": "An updated post",
+                "body": "dolor sit amet lorem ipsum " * 40, "img_url": img_url,
+            }))
+        elif scenario == "comment":
+            made.append(("POST", "/add-comment", {"author": "bench", "body": f"comment {i}", "post_id": post_id}))
+        elif scenario == "delete":
+            made.append(("DELETE", "/delete-post", {"id": i + 1}))
+    return made
+
+
+def summarize(latencies: list, errors: int, elapsed: float):
+    """Get the stats of the latencies (seconds) of a scenario.
+    Returns a dict, latencies in milliseconds."""
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "p50_ms": round(cuts[49] * 1000, 3),
+        "p95_ms": round(cuts[94] * 1000, 3),
+        "p99_ms": round(cuts[98] * 1000, 3),
+    }
+
+
+def run_client(posts: int, number: int):
+    """Run the scenarios through the Flask test client, in the current process.
+    Returns a dict of the stats of every scenario."""
+    sys.path.insert(0, ROOT)
+    from app import app, init_app
+
+    img_url = _start_image_server()
+    app.config["MAIL_SENDER"] = False
+    init_app()
+    client = app.test_client()
+    results = {}
+    for scenario in SCENARIOS:
+        latencies = []
+        errors = 0
+        start = time.perf_counter()
+        for method, path, body in requests_of(scenario, posts, number, img_url):
+            sent = time.perf_counter()
+            response = client.open(path, method=method, json=body)
+            response.get_data()
+            latencies.append(time.perf_counter() - sent)
+            if response.status_code != 200:
+                errors += 1
+        results[scenario] = summarize(latencies, errors, time.perf_counter() - start)
+    return results
+
+
+def run_server(workdir: str, posts: int, number: int, workers: int, concurrency: int):
+    """Run the scenarios against a gunicorn server of the db of 'workdir', 'concurrency'
+    clients sending the requests of a scenario at once.
+    Returns a dict of the stats of every scenario."""
+    import requests
+
+    img_url = _start_image_server()
+    port = _free_port()
+    env = dict(
+        os.environ,
+        BLOG_BIND=f"127.0.0.1:{port}",
+        BLOG_WORKERS=str(workers),
+        PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"), "wsgi:app"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                requests.get(base + "/", timeout=1)
+                break
+            except requests.exceptions.ConnectionError:
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("The gunicorn server did not start.")
+                time.sleep(0.2)
+
+        results = {}
+        for scenario in SCENARIOS:
+            # Popped from the end, in the order they were made.
+            pending = requests_of(scenario, posts, number, img_url)[::-1]
+            latencies = []
+            errors = [0]
+            lock = threading.Lock()
+
+            def client():
+                session = requests.Session()
+                while True:
+                    with lock:
+                        if not pending:
+                            return
+                        method, path, body = pending.pop()
+                    sent = time.perf_counter()
+                    try:
+                        response = session.request(method, base + path, json=body, timeout=60)
+                        failed = response.status_code != 200
+                    except requests.exceptions.RequestException:
+                        failed = True
+                    latency = time.perf_counter() - sent
+                    with lock:
+                        latencies.append(latency)
+                        errors[0] += failed
+
+            threads = [threading.Thread(target=client) for _ in range(concurrency)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            results[scenario] = summarize(latencies, errors[0], time.perf_counter() - start)
+        return results
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+
+def _git_commit():
+    """Helper to get the commit of the repo, None if not known."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print(results: dict, previous: dict=None):
+    """Print the results as a table, with the ratio of the p50 and throughput to the
+    previous results if any."""
+    header = f"{'size':>8} {'mode':<7} {'scenario':<9}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+    if previous:
+        header += f"{'p50 x':>8}{'req/s x':>9}"
+    print(header)
+    for size, modes in results["runs"].items():
+        for mode, scenarios in modes.items():
+            for scenario, stats in scenarios.items():
+                line = (
+                    f"{size:>8} {mode:<7} {scenario:<9}{stats['throughput']:>10}{stats['p50_ms']:>10}"
+                    f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['errors']:>8}"
+                )
+                old = (previous or {}).get("runs", {}).get(size, {}).get(mode, {}).get(scenario)
+                if old and old["p50_ms"] and old["throughput"]:
+                    line += f"{stats['p50_ms'] / old['p50_ms']:>8.2f}{stats['throughput'] / old['throughput']:>9.2f}"
+                print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000", help="comma separated numbers of posts")
+    parser.add_argument("--comments", type=int, default=5, help="comments per post")
+    parser.add_argument("--requests", type=int, default=300, help="requests per scenario")
+    parser.add_argument("--modes", default="client,server", help="comma separated: client, server")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients of the server")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="previous result file")
+    parser.add_argument("--child", choices=["seed", "client"], help=argparse.SUPPRESS)
+    parser.add_argument("--posts", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == "seed":
+        seed(args.posts, args.comments)
+        return
+    if args.child == "client":
+        print(json.dumps(run_client(args.posts, args.requests)))
+        return
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    modes = [mode.strip() for mode in args.modes.split(",")]
+    results = {
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "comments": args.comments, "requests": args.requests,
+            "workers": args.workers, "concurrency": args.concurrency,
+        },
+        "runs": {},
+    }
+    for size in sizes:
+        runs = results["runs"][str(size)] = {}
+        for mode in modes:
+            # A fresh db per run, the writes of a run would change the next one.
+            workdir = tempfile.mkdtemp(prefix="blog-bench-")
+            _prepare(workdir)
+            common = ["--posts", size, "--comments", args.comments, "--requests", args.requests]
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", "seed", *map(str, common)],
+                cwd=workdir, capture_output=True, check=True,
+            )
+            print(f"{size} posts seeded for the {mode} run.", file=sys.stderr)
+            if mode == "client":
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", "client", *map(str, common)],
+                    cwd=workdir, capture_output=True, text=True, check=True,
+                ).stdout
+                runs[mode] = json.loads(output.strip().splitlines()[-1])
+            elif mode == "server":
+                runs[mode] = run_server(workdir, size, args.requests, args.workers, args.concurrency)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    _print(results, previous)
+    print(f"Results saved to {args.output}.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Import-time and startup-time budget check of the blog app.
+Every measure is made in a fresh Python process, the median of the runs is checked:
+    - import: time to import the app package, in an empty directory with no config at all,
+      the import must succeed and print nothing (no config read, no side effect),
+    - startup: time of init_app() on a db already at the current schema version,
+      the config given by the environment (the first run, creating the db, is not counted).
+Exits with status 1 if a median is over its budget, so it can run in CI.
+
+Usage, from the root of the repo:
+
+    python benchmarks/startup.py [--runs 5] [--import-budget 1.0] [--startup-budget 0.5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from concurrency import ROOT
+
+
+_IMPORT = """
+import json, time
+start = time.perf_counter()
+import app
+print(json.dumps({"seconds": time.perf_counter() - start}))
+"""
+
+_STARTUP = """
+import json, time
+import app
+app.app.config["MAIL_SENDER"] = False
+start = time.perf_counter()
+app.init_app()
+print(json.dumps({"seconds": time.perf_counter() - start}))
+"""
+
+
+def _measure(code: str, cwd: str, env: dict):
+    """Helper to run the given code in a fresh process.
+    Returns a tuple of (seconds measured by the code, what it printed before)."""
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=cwd, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    lines = output.strip().splitlines()
+    return json.loads(lines[-1])["seconds"], lines[:-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget", type=float, default=1.0, help="seconds")
+    parser.add_argument("--startup-budget", type=float, default=0.5, help="seconds")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="blog-startup-")
+    env = {
+        name: value for name, value in os.environ.items()
+        if not name.startswith("BLOG_")
+    }
+    env["PYTHONPATH"] = ROOT + os.pathsep + os.environ.get("PYTHONPATH", "")
+    env["BLOG_CONFIG_FILE"] = os.path.join(workdir, "missing.env")
+
+    failed = False
+    imports = []
+    for _ in range(args.runs):
+        seconds, printed = _measure(_IMPORT, workdir, env)
+        imports.append(seconds)
+        if printed:
+            print(f"FAIL import has side effects, printed: {printed}")
+            failed = True
+
+    env.update(
+        BLOG_SECRET_KEY="startup-check",
+        BLOG_DB=os.path.join(workdir, "blog.db"),
+        BLOG_EMAIL="check@localhost",
+        BLOG_EMAIL_KEY="",
+        BLOG_TO_EMAIL="check@localhost",
+    )
+    first, _ = _measure(_STARTUP, workdir, env)
+    startups = [_measure(_STARTUP, workdir, env)[0] for _ in range(args.runs)]
+
+    for name, times, budget in (
+        ("import", imports, args.import_budget),
+        ("startup", startups, args.startup_budget),
+    ):
+        median = statistics.median(times)
+        ok = median <= budget
+        failed = failed or not ok
+        print(
+            f"{'OK  ' if ok else 'FAIL'} {name}: median {median * 1000:.0f} ms "
+            f"(min {min(times) * 1000:.0f} ms, max {max(times) * 1000:.0f} ms), budget {budget * 1000:.0f} ms"
+        )
+    print(f"     first startup, creating the db: {first * 1000:.0f} ms")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Microbenchmark of the validation of the requests (see app/schemas.py).
+Times the checks written by hand in the routes before the schemas (copied below, without
+the responses) against the compiled validators of the schemas, for valid and invalid
+requests of /get-posts, /create-post and /contact. Only the validation is timed,
+not the JSON parsing nor the request handling.
+
+Usage, from the root of the repo:
+
+    python benchmarks/validation.py [--number 200000]
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _old_validate_email(email):
+    """Copy of control.validate_email before the schemas, the regex is compiled on every call."""
+    exp = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,7}\b')
+    email = re.fullmatch(exp, email)
+    if not email:
+        return None
+    return email.string
+
+
+def old_get_posts(req):
+    """Checks of /get-posts before the schemas."""
+    necessary = ["num", "page", "comments"]
+    errors = []
+    cursor_mode = "after" in req.keys()
+    if cursor_mode:
+        necessary.remove("page")
+        req["page"] = 1
+    for param in necessary:
+        if param not in req.keys():
+            errors.append(f"Missing param: '{param}'")
+    if errors:
+        return errors
+
+    if not isinstance(req["comments"], bool):
+        errors.append("'comments' must be boolean.")
+    if not isinstance(req["num"], int):
+        errors.append("'num' must be int.")
+    if not isinstance(req["page"], int):
+        errors.append("'page' must be int.")
+    if cursor_mode and not isinstance(req["after"], (str, type(None))):
+        errors.append("'after' must be str or null.")
+    req.setdefault("comments_limit", None)
+    if req["comments_limit"] is not None and not isinstance(req["comments_limit"], int):
+        errors.append("'comments_limit' must be int.")
+    req.setdefault("summary", False)
+    if not isinstance(req["summary"], bool):
+        errors.append("'summary' must be boolean.")
+    req.setdefault("stream", False)
+    if not isinstance(req["stream"], bool):
+        errors.append("'stream' must be boolean.")
+    req.setdefault("format", "json")
+    if req["format"] not in ("json", "ndjson"):
+        errors.append("'format' must be 'json' or 'ndjson'.")
+    if errors:
+        return errors
+
+    if not req["num"] >= 0:
+        errors.append("'num' must be >= 0")
+    if not req["page"] >= 1:
+        errors.append("'page' must be >= 1")
+    if req["comments_limit"] is not None and not req["comments_limit"] >= 1:
+        errors.append("'comments_limit' must be >= 1")
+    return errors
+
+
+def old_create_post(req):
+    """Checks of /create-post before the schemas (the check of the image excluded)."""
+    necessary = ["author", "title", "subtitle", "body", "img_url"]
+    errors = []
+    for param in necessary:
+        if param not in req.keys():
+            errors.append(f"Missing param: '{param}'")
+    if errors:
+        return errors
+
+    if not isinstance(req["author"], str):
+        errors.append("'author' must be str.")
+    if not isinstance(req["title"], str):
+        errors.append("'title' must be str.")
+    if not isinstance(req["subtitle"], str):
+        errors.append("'subtitle' must be str.")
+    if not isinstance(req["body"], str):
+        errors.append("'body' must be str.")
+    if not isinstance(req["img_url"], str):
+        errors.append("'img_url' must be str.")
+    if errors:
+        return errors
+
+    req["author"] = req["author"].strip()
+    req["title"] = req["title"].strip()
+    req["subtitle"] = req["subtitle"].strip()
+    req["body"] = req["body"].strip()
+    req["img_url"] = req["img_url"].strip()
+
+    if not len(req["author"]) >= 2:
+        errors.append("'author' must be at least 2 characters.")
+    if not len(req["title"]) >= 5:
+        errors.append("'title' must be at least 5 characters.")
+    if not len(req["subtitle"]) >= 5:
+        errors.append("'subtitle' must be at least 5 characters.")
+    if not len(req["body"]) >= 5:
+        errors.append("'body' must be at least 5 characters.")
+    if not len(req["img_url"]) >= 2:
+        errors.append("'img_url' must be at least 2 characters.")
+    return errors
+
+
+def old_contact(req):
+    """Checks of /contact before the schemas."""
+    necessary = ["name", "email", "message"]
+    errors = []
+    for param in necessary:
+        if param not in req.keys():
+            errors.append(f"Missing param: '{param}'")
+    if errors:
+        return errors
+
+    if not isinstance(req["name"], str):
+        errors.append("'name' must be str.")
+    if not isinstance(req["email"], str):
+        errors.append("'email' must be str.")
+    if not isinstance(req["message"], str):
+        errors.append("'message' must be str.")
+    if errors:
+        return errors
+
+    req["name"] = req["name"].strip()
+    req["email"] = req["email"].strip()
+    req["message"] = req["message"].strip()
+
+    if not len(req["name"]) >= 2:
+        errors.append("'name' must be at least 2 characters.")
+    if not len(req["message"]) >= 2:
+        errors.append("'message' must be at least 2 characters.")
+    if not _old_validate_email(req["email"]):
+        errors.append("'email' is not a valid email address.")
+    return errors
+
+
+CASES = [
+    ("get-posts", "valid", {"num": 10, "page": 2, "comments": True, "comments_limit": 3}),
+    ("get-posts", "cursor", {"num": 10, "after": "2024-01-01T00:00:00|42", "comments": False}),
+    ("get-posts", "invalid", {"num": "10", "page": 0, "comments": True}),
+    ("create-post", "valid", {
+        "author": "  Ada  ", "title": "A title", "subtitle": "A subtitle",
+        "body": "Some body " * 50, "img_url": "https://example.com/img.png",
+    }),
+    ("create-post", "invalid", {"author": "A", "title": "t", "subtitle": "s", "body": "b", "img_url": "x"}),
+    ("contact", "valid", {"name": "Ada", "email": "ada@example.com", "message": "Hello there"}),
+    ("contact", "invalid", {"name": "A", "email": "not an email", "message": "?"}),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=200000, help="validations timed per case")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from app import schemas
+    old = {"get-posts": old_get_posts, "create-post": old_create_post, "contact": old_contact}
+    new = {
+        "get-posts": schemas.GET_POSTS.validate,
+        "create-post": schemas.CREATE_POST.validate,
+        "contact": schemas.CONTACT.validate,
+    }
+
+    print(f"{'endpoint':<12} {'request':<8} {'before (us)':>12} {'after (us)':>11} {'speedup':>8}")
+    for endpoint, kind, req in CASES:
+        assert old[endpoint](dict(req)) == new[endpoint](dict(req)), (endpoint, kind)
+        # A copy of the request per validation, both validate and normalize it in place.
+        times = []
+        for validate in (old[endpoint], new[endpoint]):
+            timer = timeit.Timer(lambda: validate(dict(req)))
+            best = min(timer.repeat(repeat=5, number=args.number))
+            times.append(best / args.number * 1e6)
+        before, after = times
+        print(f"{endpoint:<12} {kind:<8} {before:>12.2f} {after:>11.2f} {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Gunicorn config of the blog app, loaded by gunicorn from the working directory:
+
+    gunicorn wsgi:app
+
+Settings are read from the environment:
+    BLOG_BIND             address to listen on (default 127.0.0.1:8000)
+    BLOG_WORKERS          number of worker processes (default number of CPUs)
+    BLOG_THREADS          threads per worker (default 4)
+    BLOG_KEEPALIVE        seconds an idle keep-alive connection is kept open (default 5)
+    BLOG_TIMEOUT          seconds a silent worker is killed and restarted after (default 30)
+    BLOG_GRACEFUL_TIMEOUT seconds the workers get to finish their requests on a reload or stop (default 30)
+    BLOG_MAX_REQUESTS     requests after which a worker is replaced, 0 never (default 0)
+
+The app is preloaded in the master, see app/server.py for what is set up per worker.
+Graceful reload: `kill -HUP <master pid>` starts new workers with the reloaded config and
+stops the old ones once they have finished their requests. The code of the app is
+loaded by the master once, to deploy new code replace the master without dropping
+connections: `kill -USR2 <master pid>`, then `kill -QUIT <old master pid>`.
+"""
+import multiprocessing
+import os
+
+
+def _env_int(name, default):
+    """Helper to get an int setting from the environment."""
+    return int(os.environ.get(name, default))
+
+
+bind = os.environ.get("BLOG_BIND", "127.0.0.1:8000")
+workers = _env_int("BLOG_WORKERS", multiprocessing.cpu_count())
+threads = _env_int("BLOG_THREADS", 4)
+worker_class = "gthread"
+keepalive = _env_int("BLOG_KEEPALIVE", 5)
+timeout = _env_int("BLOG_TIMEOUT", 30)
+graceful_timeout = _env_int("BLOG_GRACEFUL_TIMEOUT", 30)
+max_requests = _env_int("BLOG_MAX_REQUESTS", 0)
+max_requests_jitter = max_requests // 10
+preload_app = True
+# The heartbeat of the workers, in memory rather than on a possibly slow disk.
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+
+def post_fork(server, worker):
+    from app import server as app_server
+    app_server.post_fork()
+    server.log.info("Worker %s set up.", worker.pid)
+
+
+def worker_exit(server, worker):
+    from app import server as app_server
+    app_server.worker_exit()
@@ -1,6 +1,11 @@
-from app import init_app
+import os
+
+from app import init_app, mailer
 
 
 if __name__ == "__main__":
     app = init_app()
+    # The reloader of the debug server runs this script twice, only its child process serves.
+    if os.environ.get("WERKZEUG_RUN_MAIN"):
+        mailer.start()
     app.run(debug=True)
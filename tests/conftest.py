@@ -0,0 +1,86 @@
+"""
+Fixtures shared by the tests.
+"""
+import itertools
+from contextlib import contextmanager
+
+import pytest
+
+
+# Numbers of the default titles of make_post, unique for the whole run like the titles in the db.
+_titles = itertools.count(1)
+
+
+@pytest.fixture(scope="session")
+def blog_app(tmp_path_factory):
+    """The app initialized once for the whole run, on a new db in a temporary directory,
+    without the background mail sender.
+    Returns the app."""
+    settings = {
+        "BLOG_SECRET_KEY": "test",
+        "BLOG_DB": str(tmp_path_factory.mktemp("db") / "blog.db"),
+        "BLOG_EMAIL": "blog@example.com",
+        "BLOG_EMAIL_KEY": "secret",
+        "BLOG_TO_EMAIL": "admin@example.com",
+    }
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        for name, value in settings.items():
+            monkeypatch.setenv(name, value)
+        from app import app, init_app
+        app.config["MAIL_SENDER"] = False
+        init_app()
+        yield app
+
+
+@pytest.fixture
+def client(blog_app):
+    """Returns a test client of the app."""
+    return blog_app.test_client()
+
+
+@pytest.fixture
+def make_post(blog_app):
+    """Returns a function adding a post of the given author, with the given comments,
+    and returning the id of the post. Titles are unique, the default one is numbered."""
+    from sqlalchemy import func, select
+    from app import control, db, transaction
+    from app.models import Post
+
+    def make_post(author="Ada", title=None, comments=(), **fields):
+        title = title or f"A title {next(_titles)}"
+        with transaction.batch():
+            control.add_post(
+                author=author, title=title, subtitle=fields.pop("subtitle", "A subtitle"),
+                body=fields.pop("body", "The body of the post."), **fields
+            )
+            post_id = db.session.execute(select(func.max(Post.id))).scalar()
+            for comment in comments:
+                control.add_comment(author="Bob", body=comment, post_id=post_id)
+        return post_id
+
+    return make_post
+
+
+@pytest.fixture
+def statements(blog_app):
+    """Returns a context manager counting the statements run by the writer engine, the one used
+    out of the requests, it gives the list the statements are added to."""
+    from sqlalchemy import event
+    from app import db
+
+    @contextmanager
+    def statements():
+        run = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            run.append(statement)
+
+        with blog_app.app_context():
+            engine = db.engine
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            yield run
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+
+    return statements
@@ -0,0 +1,106 @@
+"""
+Tests of the ASGI app (see app/asgi.py and app/async_routes.py): the same responses as the
+WSGI app for the same requests, and the variants of the async_control module.
+
+Run from the root of the repo:
+
+    python -m pytest tests
+"""
+import ast
+import asyncio
+import inspect
+
+import pytest
+
+from app import async_control, control, handlers
+
+
+@pytest.fixture(scope="module")
+def asgi_app(blog_app):
+    """Returns the Quart app, on the app of the tests."""
+    from app.asgi import create_app
+    return create_app()
+
+
+def _serve(asgi_app, requests):
+    """Send the (method, url, body) requests to the ASGI app, in order.
+    Returns the list of the (status, body, headers) of the responses."""
+    async def send():
+        responses = []
+        async with asgi_app.test_app() as test_app:
+            client = test_app.test_client()
+            for method, url, body in requests:
+                response = await getattr(client, method)(url, json=body)
+                responses.append((response.status_code, await response.get_data(), response.headers))
+        return responses
+    return asyncio.run(send())
+
+
+def test_every_call_has_a_variant():
+    called = {
+        node.args[0].attr
+        for node in ast.walk(ast.parse(inspect.getsource(handlers)))
+        if isinstance(node, ast.Call) and getattr(node.func, "id", None) == "Call"
+    }
+    assert called
+    for name in called:
+        function = getattr(control, name)
+        assert async_control.VARIANTS[function].__name__ == name
+        assert async_control._parameters(async_control.VARIANTS[function]) == async_control._parameters(function)
+
+
+def test_variant_with_other_parameters():
+    async def get_post(post_id):
+        pass
+    with pytest.raises(TypeError):
+        async_control._variant_of(control.get_post)(get_post)
+
+
+def test_same_responses_as_the_wsgi_app(blog_app, asgi_app, client, make_post):
+    post_id = make_post(author="Parity", comments=["First", "Second"])
+    make_post(author="Parity", body="Searchable words in the body.")
+    requests = [
+        ("get", "/get-posts", {"num": 5, "page": 1, "comments": True}),
+        ("get", "/get-posts", {"num": 2, "page": 1, "comments": True, "comments_limit": 1, "summary": True}),
+        ("get", "/get-posts", {"num": 2, "after": None, "comments": False}),
+        ("get", "/get-posts", {"num": 2, "after": "not a cursor", "comments": False}),
+        ("get", "/get-posts", {"num": "x", "page": 0}),
+        ("get", "/get-posts", {"num": 0, "page": 1, "comments": True, "stream": True, "format": "ndjson"}),
+        ("get", "/get-posts", {"num": 5, "page": 1, "comments": True, "stream": True}),
+        ("get", "/get-post", {"id": post_id}),
+        ("get", "/get-post", {"id": 10 ** 9}),
+        ("get", "/get-posts-by-user", {"user": "Parity", "num": 2, "page": 1}),
+        ("get", "/search", {"query": "searchable words", "num": 3, "page": 1}),
+        ("get", "/update-post", {"id": post_id}),
+        ("post", "/contact", {"name": "Al", "email": "bad", "message": "hi"}),
+        ("delete", "/delete-post", {"id": 10 ** 9}),
+        ("patch", "/edit-comment", {"comment_id": 10 ** 9, "body": "Edited"}),
+        ("patch", "/edit-comment", {"comment_id": 1}),
+    ]
+    for (method, url, body), (status, data, headers) in zip(requests, _serve(asgi_app, requests)):
+        response = getattr(client, method)(url, json=body)
+        assert (response.status_code, response.get_data()) == (status, data), (method, url, body)
+        assert response.headers.get("ETag") == headers.get("ETag")
+
+
+def test_writes(blog_app, asgi_app, client, make_post):
+    post_id = make_post(author="Async")
+    etag = client.get("/get-post", json={"id": post_id}).headers["ETag"]
+    (status, _, _), = _serve(asgi_app, [("post", "/add-comment", {"author": "Bob", "body": "Hello", "post_id": post_id})])
+    assert status == 200
+
+    post = client.get("/get-post", json={"id": post_id}).get_json()
+    assert [comment["body"] for comment in post["comments"]] == ["Hello"]
+    assert post["comment_count"] == 1
+    comment_id = post["comments"][0]["id"]
+
+    responses = _serve(asgi_app, [
+        ("get", "/get-post", {"id": post_id}),
+        ("patch", "/edit-comment", {"comment_id": comment_id, "body": "Edited"}),
+        ("delete", "/delete-comments", {"comment_ids": [comment_id, 10 ** 9]}),
+        ("delete", "/delete-post", {"id": post_id}),
+        ("delete", "/delete-post", {"id": post_id}),
+    ])
+    assert [status for status, _, _ in responses] == [200, 200, 200, 200, 404]
+    assert responses[0][2]["ETag"] != etag
+    assert client.get("/get-post", json={"id": post_id}).status_code == 404
@@ -0,0 +1,102 @@
+"""
+Tests of the bulk import and export of the posts (see app/bulk.py), by the endpoints and the
+CLI commands: an export imported again gives the same posts, a failed import imports nothing.
+
+Run from the root of the repo:
+
+    python -m pytest tests
+"""
+import json
+
+import pytest
+
+from app import bulk
+
+
+def _exported(client, author):
+    """Returns the exported records of the posts of the given author."""
+    response = client.get("/export-posts")
+    assert response.mimetype == "application/x-ndjson"
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    return [record for record in records if record["author"] == author]
+
+
+def _record(title, author="Imported", comments=()):
+    return {
+        "author": author, "title": title, "subtitle": "A subtitle", "body": "A body",
+        "date": "2021-05-04T03:02:01", "img_url": None,
+        "comments": [{"author": "Bob", "body": body, "date": "2021-05-05T00:00:00"} for body in comments],
+    }
+
+
+def test_round_trip(client, make_post):
+    ids = [make_post(author="Exported", comments=["First", "Second"][:i]) for i in range(3)]
+    exported = _exported(client, "Exported")
+    assert [record["id"] for record in exported] == ids
+    assert [len(record["comments"]) for record in exported] == [0, 1, 2]
+
+    client.delete("/delete-posts", json={"ids": ids})
+    assert _exported(client, "Exported") == []
+    response = client.post(
+        "/import-posts",
+        data="".join(json.dumps(record) + "\n" for record in exported),
+        content_type="application/x-ndjson"
+    )
+    assert response.get_json() == {"success": ["3 posts and 3 comments have been imported."]}
+    assert _exported(client, "Exported") == exported
+
+    post = client.get("/get-post", json={"id": ids[2]}).get_json()
+    assert post["comment_count"] == 2
+    assert [comment["body"] for comment in post["comments"]] == ["First", "Second"]
+
+
+def test_import_json(client):
+    response = client.post("/import-posts", json={"posts": [
+        _record("Imported one", comments=["a", "b"]), _record("Imported two")
+    ]})
+    assert response.status_code == 200
+    titles = [post["title"] for post in client.get(
+        "/get-posts-by-user", json={"user": "Imported", "num": 0, "page": 1}
+    ).get_json()]
+    assert sorted(titles) == ["Imported one", "Imported two"]
+
+
+@pytest.mark.parametrize("records, message", [
+    ([_record("Invalid one"), {"author": "Imported", "title": "Invalid two"}], "Post 2: Missing param: 'subtitle'"),
+    ([_record("Invalid three"), {**_record("Invalid four"), "date": "yesterday"}],
+     "Post 2: 'date' is not a valid ISO 8601 date."),
+    ([_record("Invalid five", comments=["a"]), _record("Invalid five")], "Nothing imported, duplicate post:"),
+])
+def test_failed_import_rolled_back(client, monkeypatch, records, message):
+    # One post per batch: the posts before the failed one have been inserted.
+    monkeypatch.setattr(bulk, "IMPORT_BATCH", 1)
+    before = client.get("/export-posts").get_data()
+    response = client.post("/import-posts", json={"posts": records})
+    assert response.status_code == 400
+    assert response.get_json()["error"][0].startswith(message)
+    assert client.get("/export-posts").get_data() == before
+
+
+def test_invalid_ndjson(client):
+    response = client.post("/import-posts", data='{"author": \n', content_type="application/x-ndjson")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": ["Invalid NDJSON format."]}
+
+
+def test_cli_round_trip(blog_app, client, make_post, tmp_path):
+    runner = blog_app.test_cli_runner()
+    post_id = make_post(author="Exported by the CLI", comments=["Hé"])
+    path = tmp_path / "posts.ndjson"
+    assert runner.invoke(args=["export-posts", str(path)]).exit_code == 0
+    lines = [line for line in path.read_text(encoding="utf-8").splitlines() if f'"id": {post_id},' in line]
+    assert len(lines) == 1 and "Hé" in lines[0]
+
+    client.delete("/delete-post", json={"id": post_id})
+    path.write_text(lines[0] + "\n", encoding="utf-8")
+    result = runner.invoke(args=["import-posts", str(path)])
+    assert result.output == "Imported 1 post(s) and 1 comment(s).\n"
+    assert client.get("/get-post", json={"id": post_id}).get_json()["comments"][0]["body"] == "Hé"
+
+    result = runner.invoke(args=["import-posts", str(path)])
+    assert result.exit_code != 0
+    assert "Nothing imported, duplicate post" in result.output
@@ -0,0 +1,120 @@
+"""
+Tests of the response cache (see app/cache.py): the LRU and its tags, and the responses
+of the endpoints after the writes invalidating them.
+
+Run from the root of the repo:
+
+    python -m pytest tests
+"""
+from sqlalchemy import update
+
+from app import cache
+
+
+def test_lru_eviction():
+    responses = cache.ResponseCache(maxsize=2)
+    for key in "abc":
+        responses.set(key, key.upper(), [], responses.generation)
+        if key == "b":
+            assert responses.get("a") == (True, "A")
+    assert responses.get("b") == (False, None)
+    assert responses.get("a") == (True, "A")
+    assert responses.get("c") == (True, "C")
+
+
+def test_ttl(monkeypatch):
+    responses = cache.ResponseCache(ttl=10)
+    now = 1000.0
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now)
+    responses.set("key", "value", [], responses.generation)
+    now += 9
+    assert responses.get("key") == (True, "value")
+    now += 2
+    assert responses.get("key") == (False, None)
+    assert responses.stats()["size"] == 0
+
+
+def test_invalidate_by_tag():
+    responses = cache.ResponseCache()
+    responses.set("listing", [1, 2], ["posts", "post:1", "post:2"], responses.generation)
+    responses.set("post 1", 1, ["post:1"], responses.generation)
+    responses.set("post 3", 3, ["post:3"], responses.generation)
+    responses.invalidate("post:1")
+    assert responses.get("listing") == (False, None)
+    assert responses.get("post 1") == (False, None)
+    assert responses.get("post 3") == (True, 3)
+    assert responses.stats()["invalidations"] == 2
+
+
+def test_value_computed_before_an_invalidation_not_stored():
+    responses = cache.ResponseCache()
+    generation = responses.generation
+    responses.invalidate("posts")
+    responses.set("listing", [1], ["posts"], generation)
+    assert responses.get("listing") == (False, None)
+
+
+def test_repeated_read_is_a_hit(client, make_post):
+    post_id = make_post()
+    client.get("/get-post", json={"id": post_id})
+    hits = cache.responses.hits
+    client.get("/get-post", json={"id": post_id})
+    assert cache.responses.hits == hits + 1
+
+
+def test_post_after_its_writes(client, make_post):
+    post_id = make_post(author="Cached")
+    assert client.get("/get-post", json={"id": post_id}).get_json()["comments"] == []
+
+    client.post("/add-comment", json={"author": "Bob", "body": "Hello", "post_id": post_id})
+    post = client.get("/get-post", json={"id": post_id}).get_json()
+    assert [comment["body"] for comment in post["comments"]] == ["Hello"]
+
+    client.patch("/edit-comment", json={"comment_id": post["comments"][0]["id"], "body": "Edited"})
+    post = client.get("/get-post", json={"id": post_id}).get_json()
+    assert [comment["body"] for comment in post["comments"]] == ["Edited"]
+
+    client.delete("/delete-post", json={"id": post_id})
+    assert client.get("/get-post", json={"id": post_id}).status_code == 404
+
+
+def test_listings_after_their_writes(client, make_post):
+    listing = {"user": "Listed", "num": 0, "page": 1}
+    post_id = make_post(author="Listed")
+    assert len(client.get("/get-posts-by-user", json=listing).get_json()) == 1
+    client.get("/get-posts", json={"num": 0, "page": 1, "comments": False})
+
+    new_id = make_post(author="Listed")
+    assert [post["id"] for post in client.get("/get-posts-by-user", json=listing).get_json()] == [new_id, post_id]
+    assert client.get("/get-posts", json={"num": 1, "page": 1, "comments": False}).get_json()[0]["id"] == new_id
+
+    client.patch("/update-post", json={
+        "id": post_id, "title": "An updated title", "subtitle": "A subtitle", "body": "A body", "img_url": None
+    })
+    # The date of an updated post is the time of the update, it comes first.
+    titles = [post["title"] for post in client.get("/get-posts-by-user", json=listing).get_json()]
+    assert titles[0] == "An updated title"
+
+    client.delete("/delete-posts", json={"ids": [post_id, new_id]})
+    assert client.get("/get-posts-by-user", json=listing).status_code == 404
+
+
+def test_write_of_an_other_process(blog_app, client, make_post):
+    """A write the cache of this process is not told about (made by an other worker) changes
+    the ETag of the posts, the entries keyed by the old one are not served."""
+    from app import db
+    from app.models import Post
+    post_id = make_post()
+    client.get("/get-post", json={"id": post_id})
+    with blog_app.app_context():
+        db.session.execute(
+            update(Post).where(Post.id == post_id).values(title="Changed elsewhere", version=Post.version + 1)
+        )
+        db.session.commit()
+    assert client.get("/get-post", json={"id": post_id}).get_json()["title"] == "Changed elsewhere"
+
+
+def test_cache_stats(client):
+    stats = client.get("/cache-stats").get_json()
+    assert set(stats) == {"size", "maxsize", "hits", "misses", "hit_ratio", "invalidations"}
+    assert 0 <= stats["hit_ratio"] <= 1
@@ -0,0 +1,91 @@
+"""
+Tests of the numbers of comments stored with the posts (see _touch_post and
+repair_comment_counts in app/control.py): kept right by every write of the comments.
+
+Run from the root of the repo:
+
+    python -m pytest tests
+"""
+from sqlalchemy import func, select, update
+
+from app import control
+
+
+def _counts(blog_app, *post_ids):
+    """Returns the list of the (stored, actual) numbers of comments of the posts."""
+    from app import db
+    from app.models import Comment, Post
+    with blog_app.app_context():
+        return [
+            (
+                db.session.execute(select(Post.comment_count).where(Post.id == post_id)).scalar(),
+                db.session.execute(select(func.count(Comment.id)).where(Comment.post_id == post_id)).scalar(),
+            )
+            for post_id in post_ids
+        ]
+
+
+def _comment_ids(client, post_id):
+    return [comment["id"] for comment in client.get("/get-post", json={"id": post_id}).get_json()["comments"]]
+
+
+def test_add_and_delete(blog_app, client, make_post):
+    post_id = make_post()
+    for body in ["First", "Second", "Third"]:
+        assert client.post("/add-comment", json={"author": "Bob", "body": body, "post_id": post_id}).status_code == 200
+    assert _counts(blog_app, post_id) == [(3, 3)]
+    assert client.get("/get-post", json={"id": post_id}).get_json()["comment_count"] == 3
+
+    first, second, third = _comment_ids(client, post_id)
+    client.delete("/delete-comment", json={"comment_id": first})
+    client.delete("/delete-comment", json={"comment_id": first})
+    client.patch("/edit-comment", json={"comment_id": second, "body": "Edited"})
+    assert _counts(blog_app, post_id) == [(2, 2)]
+
+
+def test_add_to_a_missing_post(blog_app, client):
+    response = client.post("/add-comment", json={"author": "Bob", "body": "Lost", "post_id": 10 ** 9})
+    assert response.status_code == 404
+    assert _counts(blog_app, 10 ** 9) == [(None, 0)]
+
+
+def test_delete_many_across_posts(blog_app, client, make_post):
+    one = make_post(comments=["a", "b", "c"])
+    two = make_post(comments=["d", "e"])
+    ids = _comment_ids(client, one)[:2] + _comment_ids(client, two)
+    response = client.delete("/delete-comments", json={"comment_ids": ids + ids[:1] + [10 ** 9]})
+    assert response.get_json()["deleted"] == ids
+    assert _counts(blog_app, one, two) == [(1, 1), (0, 0)]
+
+
+def test_rolled_back_comment_not_counted(blog_app, make_post):
+    from app import transaction
+    post_id = make_post(comments=["Kept"])
+    try:
+        with transaction.batch():
+            control.add_comment(author="Bob", body="Lost", post_id=post_id)
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert _counts(blog_app, post_id) == [(1, 1)]
+
+
+def test_repair(blog_app, client, make_post):
+    from app import db
+    from app.models import Post
+    right = make_post(comments=["a"])
+    wrong = make_post(comments=["b", "c"])
+    with blog_app.app_context():
+        db.session.execute(update(Post).where(Post.id == wrong).values(comment_count=7))
+        db.session.commit()
+    etag = client.get("/get-post", json={"id": wrong}).headers["ETag"]
+
+    result = blog_app.test_cli_runner().invoke(args=["repair-comment-counts"])
+    assert result.exit_code == 0
+    assert result.output == "Fixed the comment count of 1 post(s).\n"
+    assert _counts(blog_app, right, wrong) == [(1, 1), (2, 2)]
+    response = client.get("/get-post", json={"id": wrong})
+    assert response.headers["ETag"] != etag
+    assert response.get_json()["comment_count"] == 2
+
+    assert control.repair_comment_counts() == 0
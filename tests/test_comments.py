@@ -0,0 +1,67 @@
+"""
+Tests of the loading of the comments of the listings (see get_posts in app/control.py): all
+the comments of a page in one query, or the newest "comments_limit" of each post.
+
+Run from the root of the repo:
+
+    python -m pytest tests
+"""
+import pytest
+
+from app import cache, control
+
+
+def _listing(client, num, **fields):
+    return client.get("/get-posts", json={"num": num, "page": 1, "comments": True, **fields}).get_json()
+
+
+@pytest.fixture
+def posts(make_post):
+    """Three new posts, the newest first, with 0, 1 and 3 comments.
+    Returns the list of their ids."""
+    return [
+        make_post(comments=["c1", "c2", "c3"]),
+        make_post(comments=["b1"]),
+        make_post(),
+    ][::-1]
+
+
+def test_all_comments(client, posts):
+    listed = _listing(client, 3)
+    assert [post["id"] for post in listed] == posts
+    assert [[comment["body"] for comment in post["comments"]] for post in listed] == [[], ["b1"], ["c1", "c2", "c3"]]
+    assert [post["comment_count"] for post in listed] == [0, 1, 3]
+    assert all("comment_total" not in post for post in listed)
+
+
+def test_newest_comments(client, posts):
+    listed = _listing(client, 3, comments_limit=2)
+    assert [[comment["body"] for comment in post["comments"]] for post in listed] == [[], ["b1"], ["c2", "c3"]]
+    assert [post["comment_total"] for post in listed] == [0, 1, 3]
+
+
+def test_no_comments(client, posts):
+    listed = _listing(client, 3, comments=False)
+    assert [post["comments"] for post in listed] == [[], [], []]
+    assert [post["comment_count"] for post in listed] == [0, 1, 3]
+
+
+@pytest.mark.parametrize("comments_limit", [None, 2])
+def test_statements_do_not_grow_with_the_posts(statements, posts, comments_limit):
+    counts = []
+    for num in (1, 3):
+        cache.responses.clear()
+        with statements() as run:
+            control.get_posts(num=num, comments=True, comments_limit=comments_limit)
+        counts.append(len(run))
+    assert counts[0] == counts[1] == 3
+
+
+def test_newest_comments_in_batches(statements, monkeypatch, posts):
+    monkeypatch.setattr(control, "COMMENTS_BATCH", 2)
+    cache.responses.clear()
+    with statements() as run:
+        listed = control.get_posts(num=3, comments=True, comments_limit=1)
+    # The validators, the posts, then one query per batch of 2 posts.
+    assert len(run) == 4
+    assert [[comment["body"] for comment in post["comments"]] for post in listed] == [[], ["b1"], ["c3"]]
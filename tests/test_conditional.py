@@ -0,0 +1,49 @@
+"""
+Tests of the conditional GETs of the read endpoints (see not_modified in app/handlers.py).
+
+Run from the root of the repo:
+
+    python -m pytest tests
+"""
+
+
+def _listing(client, user, headers=None):
+    return client.get("/get-posts-by-user", json={"user": user, "num": 2, "page": 2}, headers=headers or {})
+
+
+def test_listing_has_no_last_modified(client, make_post):
+    for _ in range(3):
+        make_post(author="Lister")
+    response = _listing(client, "Lister")
+    assert response.headers["ETag"]
+    assert "Last-Modified" not in response.headers
+
+
+def test_listing_changes_when_a_post_is_deleted(client, make_post):
+    ids = [make_post(author="Pager") for _ in range(4)]
+    response = _listing(client, "Pager")
+    assert [post["id"] for post in response.get_json()] == [ids[1], ids[0]]
+    etag = response.headers["ETag"]
+    assert _listing(client, "Pager", {"If-None-Match": etag}).status_code == 304
+
+    assert client.delete("/delete-post", json={"id": ids[3]}).status_code == 200
+
+    since = "Fri, 01 Jan 2100 00:00:00 GMT"
+    response = _listing(client, "Pager", {"If-Modified-Since": since})
+    assert response.status_code == 200
+    assert [post["id"] for post in response.get_json()] == [ids[0]]
+    assert _listing(client, "Pager", {"If-None-Match": etag}).status_code == 200
+
+
+def test_post_not_modified(client, make_post):
+    post_id = make_post()
+    response = client.get("/get-post", json={"id": post_id})
+    last_modified = response.headers["Last-Modified"]
+    etag = response.headers["ETag"]
+    assert client.get("/get-post", json={"id": post_id}, headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(
+        "/get-post", json={"id": post_id}, headers={"If-Modified-Since": last_modified}
+    ).status_code == 304
+
+    client.post("/add-comment", json={"author": "Bob", "body": "Hi", "post_id": post_id})
+    assert client.get("/get-post", json={"id": post_id}, headers={"If-None-Match": etag}).status_code == 200
@@ -0,0 +1,88 @@
+"""
+Tests of the SQLite engine profile (see app/engine.py): WAL and the pragmas of the profile,
+a single writer connection, the reads of the GET requests on read-only connections.
+
+Run from the root of the repo:
+
+    python -m pytest tests
+"""
+import pytest
+from flask import Flask
+from sqlalchemy import make_url, text
+from sqlalchemy.exc import OperationalError
+
+from app import db, engine
+
+
+def _pragma(connection, name):
+    return connection.execute(text(f"PRAGMA {name}")).scalar()
+
+
+def test_writer_pragmas(blog_app):
+    with blog_app.app_context():
+        with db.engine.connect() as connection:
+            assert _pragma(connection, "journal_mode") == "wal"
+            assert _pragma(connection, "synchronous") == 1
+            assert _pragma(connection, "busy_timeout") == blog_app.config["SQLITE_BUSY_TIMEOUT"]
+            assert _pragma(connection, "query_only") == 0
+
+
+def test_single_writer(blog_app):
+    with blog_app.app_context():
+        pool = db.engine.pool
+    assert pool.size() == 1
+    assert pool._max_overflow == 0
+    assert pool._timeout == blog_app.config["SQLITE_POOL_TIMEOUT"]
+
+
+def test_reader_is_read_only(blog_app):
+    with blog_app.app_context():
+        with db.engines[engine.READER].connect() as connection:
+            assert _pragma(connection, "query_only") == 1
+            assert connection.execute(text("SELECT count(*) FROM posts")).scalar() >= 0
+            with pytest.raises(OperationalError):
+                connection.execute(text("DELETE FROM posts"))
+
+
+@pytest.mark.parametrize("method, bind", [("GET", engine.READER), ("HEAD", engine.READER), ("POST", None)])
+def test_requests_routed(blog_app, method, bind):
+    with blog_app.test_request_context(method=method):
+        expected = db.engines[bind]
+        assert db.session.get_bind() is expected
+
+
+def test_changed_session_reads_from_the_writer(blog_app):
+    from app.models import Post
+    with blog_app.test_request_context(method="GET"):
+        db.session.add(Post(author="a", title="Not flushed", subtitle="s", body="b"))
+        assert db.session.get_bind() is db.engines[None]
+        db.session.rollback()
+
+
+def test_out_of_requests_on_the_writer(blog_app):
+    with blog_app.app_context():
+        assert db.session.get_bind() is db.engines[None]
+
+
+def _configured(**config):
+    app = Flask(__name__)
+    app.config.update({"SQLALCHEMY_DATABASE_URI": "sqlite:////tmp/blog.db", **config})
+    engine.configure(app)
+    return app.config
+
+
+def test_configure():
+    config = _configured()
+    assert config["SQLALCHEMY_ENGINE_OPTIONS"] == {"pool_size": 1, "max_overflow": 0, "pool_timeout": 30}
+    reader = config["SQLALCHEMY_BINDS"][engine.READER]
+    url = make_url(reader["url"])
+    assert url.database == "file:/tmp/blog.db"
+    assert url.query == {"mode": "ro", "uri": "true"}
+    assert reader["pool_size"] == engine.DEFAULTS["SQLITE_POOL_SIZE"]
+
+
+def test_configure_off():
+    assert "SQLALCHEMY_ENGINE_OPTIONS" not in _configured(SQLITE_ENGINE_PROFILE=False)
+    assert "SQLALCHEMY_BINDS" not in _configured(SQLITE_READERS=False)
+    config = _configured(SQLALCHEMY_DATABASE_URI="sqlite://")
+    assert "SQLALCHEMY_ENGINE_OPTIONS" not in config
@@ -0,0 +1,147 @@
+"""
+Tests of the checks of the remote images (see app/images.py), against a local HTTP server.
+
+Run from the root of the repo:
+
+    python -m pytest tests
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app import images
+
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\0" * 20000
+TEXT = b"<html>not an image</html>"
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serves the files of the tests, keeping the connections alive, and records the port
+    and the headers of every request on the server."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.ports.add(self.client_address[1])
+        self.server.requests.append((self.path, dict(self.headers)))
+        if self.path == "/img.png":
+            # Honors the Range header.
+            start, _, end = self.headers["Range"].removeprefix("bytes=").partition("-")
+            part = PNG[int(start):int(end) + 1]
+            self._send(206, part, [("Content-Range", f"bytes {start}-{int(start) + len(part) - 1}/{len(PNG)}")])
+        elif self.path == "/whole.png":
+            # Ignores the Range header, the whole file is sent.
+            self._send(200, PNG[:8000])
+        elif self.path == "/page.html":
+            self._send(200, TEXT)
+        elif self.path == "/redirect":
+            self._send(302, headers=[("Location", "/img.png")])
+        elif self.path == "/large.png":
+            self.send_response(200)
+            self.send_header("Content-Length", str(images.MAX_IMG_BYTES + 1))
+            self.end_headers()
+            self.close_connection = True
+        elif self.path == "/slow.png":
+            self.send_response(200)
+            self.send_header("Content-Length", "100")
+            self.end_headers()
+            try:
+                for byte in PNG[:100]:
+                    self.wfile.write(bytes([byte]))
+                    self.wfile.flush()
+                    time.sleep(0.1)
+            except OSError:
+                pass
+            self.close_connection = True
+        else:
+            self._send(404, b"not found")
+
+
+@pytest.fixture(scope="module")
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def url(server, monkeypatch):
+    """A fresh session and records for every test.
+    Returns a function making the url of a path on the server."""
+    monkeypatch.setattr(images, "session", images._new_session())
+    server.ports = set()
+    server.requests = []
+    return lambda path: f"http://127.0.0.1:{server.server_port}{path}"
+
+
+def test_sniff_png(url, server):
+    assert images.sniff_img_type(url("/img.png")) == "png"
+    path, headers = server.requests[0]
+    assert headers["Range"] == f"bytes=0-{images.SNIFF_BYTES - 1}"
+
+
+def test_sniff_range_ignored(url):
+    assert images.sniff_img_type(url("/whole.png")) == "png"
+
+
+def test_sniff_not_image(url):
+    assert images.sniff_img_type(url("/page.html")) is None
+    assert images.sniff_img_type(url("/missing.png")) is None
+
+
+def test_sniff_redirect(url, server):
+    assert images.sniff_img_type(url("/redirect")) == "png"
+    assert [path for path, headers in server.requests] == ["/redirect", "/img.png"]
+
+
+def test_sniff_too_large(url):
+    assert images.sniff_img_type(url("/large.png")) is None
+
+
+def test_sniff_deadline(url, monkeypatch):
+    monkeypatch.setattr(images, "DEADLINE", 0.3)
+    start = time.monotonic()
+    assert images.sniff_img_type(url("/slow.png")) is None
+    assert time.monotonic() - start < 2
+
+
+def test_sniff_invalid_url():
+    with pytest.raises(images.requests.exceptions.MissingSchema):
+        images.sniff_img_type("example.com/img.png")
+
+
+def test_connection_reused(url, server):
+    for path in ["/img.png", "/img.png", "/whole.png", "/page.html", "/missing.png", "/redirect"]:
+        images.sniff_img_type(url(path))
+    assert len(server.requests) == 7
+    assert len(server.ports) == 1
+
+
+def test_persisted_cache_read_out_of_the_unit(blog_app, monkeypatch):
+    from app import db, transaction
+    monkeypatch.setitem(blog_app.config, "IMG_CACHE_PERSIST", True)
+    img_url = "http://example.com/persisted.png"
+    with transaction.batch():
+        assert images.ValidationCache().get(img_url) == (False, None)
+        # The lookup has not taken the writer connection, held by the unit until its end.
+        assert db.session().get_transaction() is None
+        images.ValidationCache().set(img_url, "png")
+        assert db.session().get_transaction() is not None
+    assert images.ValidationCache().get(img_url) == (True, "png")
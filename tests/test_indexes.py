@@ -0,0 +1,25 @@
+"""
+Tests of the secondary indexes (see app/migrations.py): the hot queries of the app use
+them, according to EXPLAIN QUERY PLAN, the same check as the check-indexes command.
+
+Run from the root of the repo:
+
+    python -m pytest tests
+"""
+import pytest
+
+from app import cli
+
+
+@pytest.mark.parametrize("name", list(cli._hot_queries()))
+def test_hot_query_uses_its_index(blog_app, name):
+    query, index = cli._hot_queries()[name]
+    with blog_app.app_context():
+        plan = cli.explain_query(query)
+    assert any(index in detail for detail in plan), plan
+
+
+def test_check_indexes_command(blog_app):
+    result = blog_app.test_cli_runner().invoke(args=["check-indexes"])
+    assert result.exit_code == 0, result.output
+    assert "FAIL" not in result.output
@@ -0,0 +1,218 @@
+"""
+Tests of the background mail sender (see app/mailer.py), against a local SMTP server (aiosmtpd).
+
+Run from the root of the repo:
+
+    python -m pytest tests
+"""
+import datetime
+import socket
+from email.message import EmailMessage
+
+import pytest
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+from sqlalchemy import delete, select, update
+
+
+class Recorder:
+    """Handler of the SMTP server recording the mails received, with the connection each
+    came on, and the logins. The replies of 'failures' answer the next mails, one each."""
+
+    def __init__(self):
+        self.mails = []
+        self.logins = 0
+        self.failures = []
+        self.password = b"secret"
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.failures:
+            return self.failures.pop(0)
+        self.mails.append((id(session), envelope.mail_from, envelope.rcpt_tos, envelope.content))
+        return "250 OK"
+
+    def authenticate(self, server, session, envelope, mechanism, auth_data):
+        self.logins += 1
+        # Not handled: the server answers a failure itself, with a 535.
+        return AuthResult(success=auth_data.password == self.password, handled=False)
+
+    @property
+    def sessions(self):
+        """Returns the number of connections the mails came on."""
+        return len({session for session, *_ in self.mails})
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Server:
+    """Local SMTP server asking for a login, without TLS, its handler a Recorder.
+    It can be stopped and started again on the same port."""
+
+    def __init__(self):
+        self.handler = Recorder()
+        self.hostname = "127.0.0.1"
+        self.port = _free_port()
+        self._controller = None
+
+    def start(self):
+        self._controller = Controller(
+            self.handler, hostname=self.hostname, port=self.port,
+            authenticator=self.handler.authenticate, auth_require_tls=False
+        )
+        self._controller.start()
+
+    def stop(self):
+        if self._controller:
+            self._controller.stop()
+            self._controller = None
+
+
+@pytest.fixture
+def smtp(blog_app, monkeypatch):
+    """A local SMTP server, set as the server of the app.
+    Returns the Server."""
+    server = Server()
+    server.start()
+    monkeypatch.setitem(blog_app.config, "MAIL_SERVER", server.hostname)
+    monkeypatch.setitem(blog_app.config, "MAIL_PORT", server.port)
+    monkeypatch.setitem(blog_app.config, "MAIL_STARTTLS", False)
+    monkeypatch.setitem(blog_app.config, "MAIL_LOGIN", True)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def mailer(blog_app, smtp, monkeypatch):
+    """An empty outbox and a new sender, sending to the local server.
+    Returns the mailer module."""
+    from app import db, mailer
+    from app.models import OutboxMail
+    with blog_app.app_context():
+        db.session.execute(delete(OutboxMail))
+        db.session.commit()
+    monkeypatch.setattr(mailer, "sender", mailer.MailSender())
+    yield mailer
+    mailer.sender.stop()
+
+
+def _mail(subject):
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg.set_content("Hello")
+    return msg
+
+
+def _outbox(blog_app):
+    """Returns the rows of the outbox, by id."""
+    from app import db
+    from app.models import OutboxMail
+    with blog_app.app_context():
+        return db.session.execute(select(OutboxMail).order_by(OutboxMail.id)).scalars().all()
+
+
+def _make_due(blog_app):
+    """Make the retries of the outbox due now, as if their backoff had passed."""
+    from app import db
+    from app.models import OutboxMail
+    with blog_app.app_context():
+        db.session.execute(update(OutboxMail).values(next_try=datetime.datetime.now()))
+        db.session.commit()
+
+
+def test_queued_mails_share_one_session(blog_app, smtp, mailer):
+    for i in range(5):
+        mailer.enqueue(_mail(f"Mail {i}"))
+
+    assert mailer.sender.drain() == 5
+
+    recorder = smtp.handler
+    assert len(recorder.mails) == 5
+    assert recorder.sessions == 1
+    assert recorder.logins == 1
+    _, mail_from, rcpt_tos, content = recorder.mails[0]
+    assert (mail_from, rcpt_tos) == ("blog@example.com", ["admin@example.com"])
+    assert b"Subject: Mail 0" in content
+    assert all(mail.sent is not None for mail in _outbox(blog_app))
+
+    mailer.enqueue(_mail("Later"))
+    assert mailer.sender.drain() == 1
+    assert len(recorder.mails) == 6
+    assert recorder.sessions == 1
+    assert recorder.logins == 1
+
+
+def test_failed_send_is_retried_with_backoff(blog_app, smtp, mailer):
+    smtp.handler.failures = ["451 Try again later"]
+    mailer.enqueue(_mail("First"))
+    mailer.enqueue(_mail("Second"))
+
+    before = datetime.datetime.now()
+    assert mailer.sender.drain() == 2
+    failed, sent = _outbox(blog_app)
+    assert failed.sent is None
+    assert failed.attempts == 1
+    assert "451" in failed.error
+    assert failed.next_try >= before + datetime.timedelta(seconds=mailer.BACKOFF_BASE)
+    assert sent.sent is not None
+
+    # Not due before its backoff.
+    assert mailer.sender.drain() == 0
+
+    _make_due(blog_app)
+    assert mailer.sender.drain() == 1
+    failed, _ = _outbox(blog_app)
+    assert failed.sent is not None
+    assert failed.attempts == 1
+    assert failed.error is None
+    assert len(smtp.handler.mails) == 2
+
+
+def test_server_down_keeps_the_mails(blog_app, smtp, mailer):
+    smtp.stop()
+    for i in range(3):
+        mailer.enqueue(_mail(f"Mail {i}"))
+
+    assert mailer.sender.drain() == 3
+    mails = _outbox(blog_app)
+    assert all(mail.sent is None and mail.attempts == 1 for mail in mails)
+
+    smtp.start()
+    _make_due(blog_app)
+    assert mailer.sender.drain() == 3
+    assert all(mail.sent is not None for mail in _outbox(blog_app))
+    assert smtp.handler.sessions == 1
+
+
+def test_wrong_login_keeps_the_mails(blog_app, smtp, mailer):
+    smtp.handler.password = b"changed"
+    mailer.enqueue(_mail("First"))
+    assert mailer.sender.drain() == 1
+    mail, = _outbox(blog_app)
+    assert mail.sent is None
+    assert "535" in mail.error
+    assert smtp.handler.mails == []
+
+
+def test_backoff_doubles_up_to_the_max(mailer):
+    assert mailer._backoff(1) == datetime.timedelta(seconds=mailer.BACKOFF_BASE)
+    assert mailer._backoff(3) == datetime.timedelta(seconds=mailer.BACKOFF_BASE * 4)
+    assert mailer._backoff(100) == datetime.timedelta(seconds=mailer.BACKOFF_MAX)
+
+
+def test_sender_started_by_the_servers_only(blog_app, monkeypatch):
+    from app import mailer
+    # The app of the tests has been initialized, without starting the sender.
+    assert mailer.sender._thread is None
+
+    monkeypatch.setattr(mailer, "sender", mailer.MailSender())
+    mailer.start()
+    assert mailer.sender._thread is None
+
+    monkeypatch.setitem(blog_app.config, "MAIL_SENDER", True)
+    mailer.start()
+    assert mailer.sender._thread.is_alive()
+    mailer.sender.stop()
@@ -0,0 +1,102 @@
+"""
+Tests of the metrics of the requests (see app/metrics.py): the histograms, and the
+Prometheus text format of /metrics.
+
+Run from the root of the repo:
+
+    python -m pytest tests
+"""
+import re
+
+import pytest
+
+from app import metrics
+
+# A sample line of the text format: name, optional labels, value.
+SAMPLE = re.compile(r'^([a-z_]+)(?:\{((?:[a-z_]+="(?:[^"\\]|\\.)*",?)*)\})? (\S+)$')
+
+
+@pytest.fixture
+def registry():
+    """Returns the registry of the process, cleared before and after the test."""
+    metrics.registry.clear()
+    yield metrics.registry
+    metrics.registry.clear()
+
+
+def _samples(text):
+    """Helper to parse the samples of the text format, checking every line.
+    Returns a dict of the values by (name, labels)."""
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            assert re.match(r"^# (HELP|TYPE) [a-z_]+ .+$", line), line
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        name, labels, value = match.groups()
+        samples[name, labels or ""] = float(value)
+    return samples
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram((1, 5))
+    for value in (0, 1, 3, 7):
+        histogram.observe(value)
+    assert histogram.samples("h", 'a="b"') == [
+        'h_bucket{a="b",le="1"} 2',
+        'h_bucket{a="b",le="5"} 3',
+        'h_bucket{a="b",le="+Inf"} 4',
+        'h_sum{a="b"} 11',
+        'h_count{a="b"} 4',
+    ]
+    assert histogram.samples("h", "")[-1] == "h_count 4"
+
+
+def test_escape():
+    assert metrics._escape('a"b\\c\nd') == 'a\\"b\\\\c\\nd'
+
+
+def test_metrics_format(client, make_post, registry):
+    post_id = make_post(author="Metrics", comments=["A comment."])
+    assert client.get("/get-post", json={"id": post_id}).status_code == 200
+    assert client.get("/get-post", json={"id": post_id}).status_code == 200
+    assert client.get("/get-post", json={"id": 10 ** 9}).status_code == 404
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type == metrics.CONTENT_TYPE
+    text = response.get_data(as_text=True)
+    assert text.endswith("\n")
+    samples = _samples(text)
+
+    endpoint = 'endpoint="/get-post"'
+    requests = {
+        labels: value for (name, labels), value in samples.items()
+        if name == "blog_http_requests_total" and labels.startswith(endpoint)
+    }
+    assert sum(requests.values()) == 3
+    assert requests[f'{endpoint},method="GET",status="404"'] == 1
+    # The request to /metrics is recorded once its response is ready.
+    assert not any('"/metrics"' in labels for _, labels in samples)
+
+    for name in ("blog_http_request_duration_seconds", "blog_db_statements_per_request"):
+        assert samples[f"{name}_count", endpoint] == 3
+        assert samples[f"{name}_bucket", f'{endpoint},le="+Inf"'] == 3
+        buckets = [value for (sample, labels), value in samples.items()
+                   if sample == f"{name}_bucket" and labels.startswith(endpoint)]
+        assert buckets == sorted(buckets)
+    assert samples["blog_db_statements_per_request_sum", endpoint] >= 2
+    assert samples["blog_img_fetches_total", endpoint] == 0
+    assert samples["blog_img_fetch_duration_seconds_count", ""] == 0
+
+    types = re.findall(r"^# TYPE (\S+) (\S+)$", text, re.MULTILINE)
+    assert len(types) == len(set(types))
+    assert ("blog_http_requests_total", "counter") in types
+    assert ("blog_http_request_duration_seconds", "histogram") in types
+
+
+def test_metrics_cleared(client, registry):
+    client.get("/metrics")
+    samples = _samples(client.get("/metrics").get_data(as_text=True))
+    assert samples['blog_http_requests_total', 'endpoint="/metrics",method="GET",status="200"'] == 1
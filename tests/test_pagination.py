@@ -0,0 +1,94 @@
+"""
+Tests of the keyset (cursor) pagination of the listings (see _posts_query in app/control.py):
+"after" instead of "page", "next_cursor" in the responses.
+
+Run from the root of the repo:
+
+    python -m pytest tests
+"""
+import datetime
+
+from sqlalchemy import update
+
+
+def _by_user(client, user, **fields):
+    return client.get("/get-posts-by-user", json={"user": user, "num": 2, **fields})
+
+
+def _walk(client, url, **fields):
+    """Follow the cursors of a listing from its first page. A full last page has a cursor too,
+    the page after it is a 404.
+    Returns the list of the ids of the posts, by page."""
+    pages, after = [], None
+    while True:
+        response = client.get(url, json={**fields, "after": after})
+        if after is not None and response.status_code == 404:
+            assert response.get_json()["error"][0].startswith("There are no more posts")
+            return pages
+        assert response.status_code == 200
+        body = response.get_json()
+        pages.append([post["id"] for post in body["posts"]])
+        after = body["next_cursor"]
+        if after is None:
+            return pages
+
+
+def test_cursor_pages_follow_each_other(client, make_post):
+    ids = [make_post(author="Keyset") for _ in range(5)]
+    assert _walk(client, "/get-posts-by-user", user="Keyset", num=2) == [ids[4:2:-1], ids[2:0:-1], ids[:1]]
+
+
+def test_same_posts_as_the_offset_pages(client, make_post):
+    for _ in range(3):
+        make_post()
+    walked = sum(_walk(client, "/get-posts", num=2, comments=False), [])
+    listed = [post["id"] for post in client.get("/get-posts", json={"num": 0, "page": 1, "comments": False}).get_json()]
+    assert walked == listed
+
+
+def test_first_page_same_as_page_one(client, make_post):
+    for _ in range(3):
+        make_post(author="First page")
+    first = _by_user(client, "First page", after=None).get_json()
+    assert first["posts"] == _by_user(client, "First page", page=1).get_json()
+    assert first["next_cursor"]
+
+
+def test_posts_of_the_same_date_ordered_by_id(blog_app, client, make_post):
+    from app import db
+    from app.models import Post
+    ids = [make_post(author="Same date") for _ in range(3)]
+    with blog_app.app_context():
+        db.session.execute(update(Post).where(Post.id.in_(ids)).values(date=datetime.datetime(2020, 1, 1)))
+        db.session.commit()
+    assert _walk(client, "/get-posts-by-user", user="Same date", num=1) == [[ids[2]], [ids[1]], [ids[0]]]
+
+
+def test_cursor_of_a_deleted_post(client, make_post):
+    ids = [make_post(author="Deleted") for _ in range(4)]
+    cursor = _by_user(client, "Deleted", after=None).get_json()["next_cursor"]
+    assert client.delete("/delete-post", json={"id": ids[2]}).status_code == 200
+    response = _by_user(client, "Deleted", after=cursor)
+    assert [post["id"] for post in response.get_json()["posts"]] == [ids[1], ids[0]]
+
+
+def test_no_more_posts(client, make_post):
+    make_post(author="Last page")
+    body = _by_user(client, "Last page", after=None).get_json()
+    assert body["next_cursor"] is None
+
+    from app.control import encode_cursor
+    oldest = encode_cursor({"date": datetime.datetime(2000, 1, 1), "id": 1})
+    response = _by_user(client, "Last page", after=oldest)
+    assert response.status_code == 404
+
+
+def test_bad_cursors(client, make_post):
+    make_post(author="Bad cursor")
+    for cursor in ["not a cursor", "e30", "WyJub3QgYSBkYXRlIiwgMV0", "WyIyMDIwLTAxLTAxVDAwOjAwOjAwIiwgIjEiXQ"]:
+        response = _by_user(client, "Bad cursor", after=cursor)
+        assert response.status_code == 400, cursor
+        assert response.get_json() == {"error": ["'after' is not a valid cursor."]}
+        response = client.get("/get-posts", json={"num": 2, "comments": False, "after": cursor})
+        assert response.status_code == 400, cursor
+    assert _by_user(client, "Bad cursor", after=3).get_json() == {"error": ["'after' must be str or null."]}
@@ -0,0 +1,132 @@
+"""
+Tests of the SQL profiler (see app/profiler.py): the normalized statements, the log of the
+slow statements with their plan, the N+1 patterns of the requests, and /debug/sql-profile.
+The profiler is off in the app of the tests, it is turned on for an engine of its own.
+
+Run from the root of the repo:
+
+    python -m pytest tests
+"""
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, text
+
+from app import profiler
+
+
+@pytest.fixture
+def profile(monkeypatch):
+    """Returns the profile of the process, cleared before and after the test, with the profiler
+    on for the requests and a N+1 threshold of 3."""
+    monkeypatch.setattr(profiler, "_enabled", True)
+    monkeypatch.setattr(profiler, "_nplus1_threshold", 3)
+    profiler.profile.clear()
+    yield profiler.profile
+    profiler.profile.clear()
+
+
+def _engine(**config):
+    """Helper to make an in-memory engine timed by the profiler, with a table of 3 items.
+    Returns the engine."""
+    app = Flask(__name__)
+    app.config.update({**profiler.DEFAULTS, "SQL_PROFILER": True, **config})
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+        connection.exec_driver_sql("INSERT INTO items (name) VALUES ('a'), ('b'), ('c')")
+    profiler.setup_engine(app, engine)
+    return engine
+
+
+def test_normalize():
+    assert profiler.normalize("SELECT *\n  FROM items  WHERE id IN (?, ?, ?)") == \
+        "SELECT * FROM items WHERE id IN (?, ...)"
+    assert profiler.normalize("SELECT * FROM items WHERE id IN (?)") == \
+        "SELECT * FROM items WHERE id IN (?)"
+    assert profiler.normalize("INSERT INTO items (id, name) VALUES (?, ?), (?, ?), (?, ?)") == \
+        profiler.normalize("INSERT INTO items (id, name) VALUES (?, ?), (?, ?)") == \
+        "INSERT INTO items (id, name) VALUES (?, ...), ..."
+
+
+def test_statements_aggregated(profile):
+    engine = _engine(SQL_SLOW_MS=10 ** 6)
+    with engine.connect() as connection:
+        for ids in ((1, 2), (1, 2, 3), (3,)):
+            placeholders = ", ".join("?" * len(ids))
+            connection.exec_driver_sql(f"SELECT name FROM items WHERE id IN ({placeholders})", ids)
+    report = profile.report()
+    assert report["slow"] == []
+    counts = {s["statement"]: s["count"] for s in report["statements"]}
+    assert counts == {
+        "SELECT name FROM items WHERE id IN (?, ...)": 2,
+        "SELECT name FROM items WHERE id IN (?)": 1,
+    }
+    for stats in report["statements"]:
+        assert stats["slow"] == 0
+        assert stats["max_ms"] <= stats["total_ms"]
+
+
+def test_slow_statements_logged_with_plan(profile, capsys):
+    engine = _engine(SQL_SLOW_MS=0)
+    with engine.connect() as connection:
+        connection.execute(text("SELECT name FROM items WHERE name = :name"), {"name": "b"})
+    [slow] = profile.report()["slow"]
+    assert slow["statement"] == "SELECT name FROM items WHERE name = ?"
+    assert slow["params"] == "('b',)"
+    assert slow["executemany"] is False
+    assert any("SCAN items" in step for step in slow["plan"])
+    [stats] = profile.report()["statements"]
+    assert stats["slow"] == 1
+    log = capsys.readouterr().out
+    assert "Slow query (" in log and "SELECT name FROM items WHERE name = ?" in log
+    assert "SCAN items" in log
+
+
+def test_slow_statements_without_plan(profile):
+    engine = _engine(SQL_SLOW_MS=0, SQL_EXPLAIN=False)
+    with engine.connect() as connection:
+        connection.exec_driver_sql("SELECT count(*) FROM items")
+    assert profile.report()["slow"][0]["plan"] == []
+
+
+def test_nplus1(profile, capsys):
+    engine = _engine(SQL_SLOW_MS=10 ** 6)
+    profiler.start_request()
+    with engine.connect() as connection:
+        ids = connection.exec_driver_sql("SELECT id FROM items").scalars().all()
+        for id in ids:
+            connection.exec_driver_sql("SELECT name FROM items WHERE id = ?", (id,))
+    profiler.end_request("/items")
+    assert profile.report()["n_plus_one"] == [{
+        "endpoint": "/items", "statement": "SELECT name FROM items WHERE id = ?",
+        "requests": 1, "max_count": 3,
+    }]
+    assert "N+1 queries: /items ran 3 times" in capsys.readouterr().out
+
+    # Under the threshold, or outside of a request: not a N+1 pattern.
+    profiler.start_request()
+    with engine.connect() as connection:
+        for id in ids[:2]:
+            connection.exec_driver_sql("SELECT name FROM items WHERE id = ?", (id,))
+    profiler.end_request("/items")
+    with engine.connect() as connection:
+        for id in ids:
+            connection.exec_driver_sql("SELECT name FROM items WHERE id = ?", (id,))
+    profiler.end_request("/items")
+    assert profile.report()["n_plus_one"][0]["requests"] == 1
+
+
+def test_endpoint(client, profile):
+    profile.record("SELECT 1", 0.002, False)
+    report = client.get("/debug/sql-profile").get_json()
+    assert report["statements"][0]["statement"] == "SELECT 1"
+    assert report["statements"][0]["total_ms"] == 2
+    assert client.delete("/debug/sql-profile").status_code == 200
+    assert client.get("/debug/sql-profile").get_json() == {"statements": [], "slow": [], "n_plus_one": []}
+
+
+def test_endpoint_off(client, monkeypatch):
+    monkeypatch.setattr(profiler, "_enabled", False)
+    response = client.get("/debug/sql-profile")
+    assert response.status_code == 404
+    assert response.get_json()["error"] == ["SQL profiler is not enabled."]
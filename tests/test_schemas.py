@@ -0,0 +1,334 @@
+"""
+Tests of the compiled request validators (see app/schemas.py): every step, and the same
+errors, in the same order, as the checks written by hand in the routes before the schemas.
+
+Run from the root of the repo:
+
+    python -m pytest tests
+"""
+import itertools
+
+import pytest
+
+from app import schemas
+from app.control import validate_email
+
+
+MISSING = object()
+
+
+def _request(**fields):
+    """Returns a request of the given fields, the MISSING ones left out."""
+    return {name: value for name, value in fields.items() if value is not MISSING}
+
+
+def _missing(req, necessary):
+    return [f"Missing param: '{param}'" for param in necessary if param not in req]
+
+
+# Checks of the routes before the schemas, without the responses.
+
+def old_get_posts(req):
+    necessary = ["num", "page", "comments"]
+    cursor_mode = "after" in req
+    if cursor_mode:
+        necessary.remove("page")
+        req["page"] = 1
+    errors = _missing(req, necessary)
+    if errors:
+        return errors
+    if not isinstance(req["comments"], bool):
+        errors.append("'comments' must be boolean.")
+    if not isinstance(req["num"], int):
+        errors.append("'num' must be int.")
+    if not isinstance(req["page"], int):
+        errors.append("'page' must be int.")
+    if cursor_mode and not isinstance(req["after"], (str, type(None))):
+        errors.append("'after' must be str or null.")
+    req.setdefault("comments_limit", None)
+    if req["comments_limit"] is not None and not isinstance(req["comments_limit"], int):
+        errors.append("'comments_limit' must be int.")
+    req.setdefault("summary", False)
+    if not isinstance(req["summary"], bool):
+        errors.append("'summary' must be boolean.")
+    req.setdefault("stream", False)
+    if not isinstance(req["stream"], bool):
+        errors.append("'stream' must be boolean.")
+    req.setdefault("format", "json")
+    if req["format"] not in ("json", "ndjson"):
+        errors.append("'format' must be 'json' or 'ndjson'.")
+    if errors:
+        return errors
+    if not req["num"] >= 0:
+        errors.append("'num' must be >= 0")
+    if not req["page"] >= 1:
+        errors.append("'page' must be >= 1")
+    if req["comments_limit"] is not None and not req["comments_limit"] >= 1:
+        errors.append("'comments_limit' must be >= 1")
+    return errors
+
+
+def old_get_posts_by_user(req):
+    necessary = ["user", "num", "page"]
+    cursor_mode = "after" in req
+    if cursor_mode:
+        necessary.remove("page")
+        req["page"] = 1
+    errors = _missing(req, necessary)
+    if errors:
+        return errors
+    if not isinstance(req["user"], str):
+        errors.append("'user' must be str.")
+    if not isinstance(req["num"], int):
+        errors.append("'num' must be int.")
+    if not isinstance(req["page"], int):
+        errors.append("'page' must be int.")
+    if cursor_mode and not isinstance(req["after"], (str, type(None))):
+        errors.append("'after' must be str or null.")
+    req.setdefault("summary", False)
+    if not isinstance(req["summary"], bool):
+        errors.append("'summary' must be boolean.")
+    req.setdefault("stream", False)
+    if not isinstance(req["stream"], bool):
+        errors.append("'stream' must be boolean.")
+    req.setdefault("format", "json")
+    if req["format"] not in ("json", "ndjson"):
+        errors.append("'format' must be 'json' or 'ndjson'.")
+    if errors:
+        return errors
+    req["user"] = req["user"].strip()
+    if not len(req["user"]) >= 2:
+        errors.append("'user' must be at least 2 characters.")
+    if not req["num"] >= 0:
+        errors.append("'num' must be >= 0")
+    if not req["page"] >= 1:
+        errors.append("'page' must be >= 1")
+    return errors
+
+
+def old_contact(req):
+    errors = _missing(req, ["name", "email", "message"])
+    if errors:
+        return errors
+    if not isinstance(req["name"], str):
+        errors.append("'name' must be str.")
+    if not isinstance(req["email"], str):
+        errors.append("'email' must be str.")
+    if not isinstance(req["message"], str):
+        errors.append("'message' must be str.")
+    if errors:
+        return errors
+    req["name"] = req["name"].strip()
+    req["email"] = req["email"].strip()
+    req["message"] = req["message"].strip()
+    if not len(req["name"]) >= 2:
+        errors.append("'name' must be at least 2 characters.")
+    if not len(req["message"]) >= 2:
+        errors.append("'message' must be at least 2 characters.")
+    if not validate_email(req["email"].strip()):
+        errors.append("'email' is not a valid email address.")
+    return errors
+
+
+def old_search(req):
+    errors = _missing(req, ["query", "num", "page"])
+    if errors:
+        return errors
+    if not isinstance(req["query"], str):
+        errors.append("'query' must be str.")
+    if not isinstance(req["num"], int):
+        errors.append("'num' must be int.")
+    if not isinstance(req["page"], int):
+        errors.append("'page' must be int.")
+    if errors:
+        return errors
+    req["query"] = req["query"].strip()
+    if not len(req["query"]) >= 2:
+        errors.append("'query' must be at least 2 characters.")
+    if not req["num"] >= 1:
+        errors.append("'num' must be >= 1")
+    if not req["page"] >= 1:
+        errors.append("'page' must be >= 1")
+    return errors
+
+
+def old_create_post(req):
+    """Without the check of the image, see test_image_checked_with_the_values."""
+    fields = {"author": 2, "title": 5, "subtitle": 5, "body": 5, "img_url": 2}
+    errors = _missing(req, list(fields))
+    if errors:
+        return errors
+    for param in fields:
+        if not isinstance(req[param], str):
+            errors.append(f"'{param}' must be str.")
+    if errors:
+        return errors
+    for param, min_len in fields.items():
+        req[param] = req[param].strip()
+        if not len(req[param]) >= min_len:
+            errors.append(f"'{param}' must be at least {min_len} characters.")
+    return errors
+
+
+def old_update_post(req):
+    """Without the check of the image."""
+    errors = _missing(req, ["id", "title", "subtitle", "body", "img_url"])
+    if errors:
+        return errors
+    if not isinstance(req["id"], int):
+        errors.append("'id' must be int.")
+    for param in ["title", "subtitle", "body"]:
+        if not isinstance(req[param], str):
+            errors.append(f"'{param}' must be str.")
+    if req["img_url"]:
+        if not isinstance(req["img_url"], str):
+            errors.append("'img_url' must be str.")
+    if errors:
+        return errors
+    for param in ["title", "subtitle", "body"]:
+        req[param] = req[param].strip()
+        if not len(req[param]) >= 5:
+            errors.append(f"'{param}' must be at least 5 characters.")
+    if req["img_url"]:
+        req["img_url"] = req["img_url"].strip()
+        if not len(req["img_url"]) >= 2:
+            errors.append("'img_url' must be at least 2 characters.")
+    return errors
+
+
+def old_add_comment(req):
+    errors = _missing(req, ["author", "body", "post_id"])
+    if errors:
+        return errors
+    if not isinstance(req["author"], str):
+        errors.append("'author' must be str.")
+    if not isinstance(req["body"], str):
+        errors.append("'body' must be str.")
+    if not isinstance(req["post_id"], int):
+        errors.append("'post_id' must be int.")
+    if errors:
+        return errors
+    req["author"] = req["author"].strip()
+    req["body"] = req["body"].strip()
+    if not len(req["author"]) >= 2:
+        errors.append("'author' must be at least 2 characters.")
+    if not len(req["body"]) >= 1:
+        errors.append("'body' must be at least 1 characters.")
+    return errors
+
+
+def old_edit_comment(req):
+    errors = _missing(req, ["comment_id", "body"])
+    if errors:
+        return errors
+    if not isinstance(req["comment_id"], int):
+        errors.append("'comment_id' must be int.")
+    if not isinstance(req["body"], str):
+        errors.append("'body' must be str.")
+    if errors:
+        return errors
+    req["body"] = req["body"].strip()
+    if not len(req["body"]) >= 1:
+        errors.append("'body' must be at least 1 characters.")
+    return errors
+
+
+# Values tried for every field: missing, of a wrong type, out of bounds and valid.
+INTS = [MISSING, "1", -1, 0, 3]
+STRS = [MISSING, 1, " ", " x ", " long enough "]
+BOOLS = [MISSING, "yes", True]
+
+CASES = [
+    (schemas.GET_POSTS, old_get_posts, {
+        "num": INTS, "page": INTS, "comments": BOOLS, "after": [MISSING, None, 1, "cursor"],
+        "comments_limit": [MISSING, None, "2", 0, 2], "format": [MISSING, "xml", "ndjson"],
+    }),
+    (schemas.GET_POSTS_BY_USER, old_get_posts_by_user, {
+        "user": STRS, "num": INTS, "page": INTS, "after": [MISSING, None, 1, "cursor"],
+        "summary": BOOLS, "stream": BOOLS,
+    }),
+    (schemas.CONTACT, old_contact, {
+        "name": STRS, "email": STRS + [" ada@example.com "], "message": STRS,
+    }),
+    (schemas.SEARCH, old_search, {"query": STRS, "num": INTS, "page": INTS}),
+    (schemas.CREATE_POST, old_create_post, {
+        "author": STRS, "title": STRS, "subtitle": STRS, "body": STRS, "img_url": STRS,
+    }),
+    (schemas.UPDATE_POST, old_update_post, {
+        "id": INTS, "title": STRS, "subtitle": STRS, "body": STRS, "img_url": STRS + [None, ""],
+    }),
+    (schemas.ADD_COMMENT, old_add_comment, {"author": STRS, "body": STRS, "post_id": INTS}),
+    (schemas.EDIT_COMMENT, old_edit_comment, {"comment_id": INTS, "body": STRS}),
+]
+
+
+@pytest.mark.parametrize("schema, old, values", CASES, ids=lambda case: getattr(case, "__name__", ""))
+def test_same_errors_as_the_checks_by_hand(schema, old, values):
+    for combination in itertools.product(*values.values()):
+        req = _request(**dict(zip(values, combination)))
+        old_req, new_req = dict(req), dict(req)
+        assert schema.validate(new_req) == old(old_req), req
+        if not old(dict(req)):
+            assert new_req == old_req, req
+
+
+def test_not_an_object():
+    assert schemas.SEARCH.validate(["query"]) == ["Request must be a JSON object."]
+    assert schemas.GET_POSTS.validate("after") == ["Request must be a JSON object."]
+
+
+def test_missing_fields_stop_the_validation():
+    assert schemas.SEARCH.validate({"query": 1}) == ["Missing param: 'num'", "Missing param: 'page'"]
+
+
+def test_wrong_types_stop_the_validation():
+    assert schemas.SEARCH.validate({"query": 1, "num": 0, "page": "1"}) == [
+        "'query' must be str.", "'page' must be int."
+    ]
+
+
+def test_value_bounds():
+    assert schemas.SEARCH.validate({"query": "q", "num": 0, "page": 0}) == [
+        "'query' must be at least 2 characters.", "'num' must be >= 1", "'page' must be >= 1"
+    ]
+    assert schemas.SEARCH.validate({"query": "qq", "num": 1, "page": 1}) == []
+
+
+def test_strips_and_sets_the_defaults():
+    req = {"user": "  ada  ", "num": 5, "page": 1}
+    assert schemas.GET_POSTS_BY_USER.validate(req) == []
+    assert req == {"user": "ada", "num": 5, "page": 1, "summary": False, "stream": False, "format": "json"}
+
+
+def test_after_switches_to_the_cursor_schema():
+    req = {"num": 5, "comments": False, "after": None, "page": 7}
+    assert schemas.GET_POSTS.validate(req) == []
+    assert req["page"] == 1
+    assert schemas.GET_POSTS.validate({"num": 5, "comments": False}) == ["Missing param: 'page'"]
+    assert schemas.GET_POSTS.validate({"num": 5, "comments": False, "after": 3}) == ["'after' must be str or null."]
+
+
+def test_steps_apart():
+    req = {"author": " A ", "title": "t", "subtitle": "subtitle", "body": "a body", "img_url": "x"}
+    assert schemas.CREATE_POST.validate_shape(req) == []
+    assert schemas.CREATE_POST.validate_values(req) == [
+        "'author' must be at least 2 characters.",
+        "'title' must be at least 5 characters.",
+        "'img_url' must be at least 2 characters.",
+    ]
+    assert req["author"] == "A"
+    assert schemas.CREATE_POST.validate_shape({"author": 1}) == [
+        "Missing param: 'title'", "Missing param: 'subtitle'", "Missing param: 'body'", "Missing param: 'img_url'"
+    ]
+
+
+def test_image_checked_with_the_values(blog_app):
+    response = blog_app.test_client().post("/create-post", json={
+        "author": "A", "title": "t", "subtitle": "subtitle", "body": "a body", "img_url": "example.com/img.png"
+    })
+    assert response.status_code == 400
+    assert response.get_json()["error"] == [
+        "'author' must be at least 2 characters.",
+        "'title' must be at least 5 characters.",
+        "'img_url' is not a valid url.",
+    ]
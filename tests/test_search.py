@@ -0,0 +1,86 @@
+"""
+Tests of the full-text search of the posts (see search_posts in app/control.py), and of its
+index kept in sync with the posts by the db.
+
+Run from the root of the repo:
+
+    python -m pytest tests
+"""
+
+
+def _search(client, query, num=10, page=1):
+    return client.get("/search", json={"query": query, "num": num, "page": page})
+
+
+def _found(client, query, **fields):
+    response = _search(client, query, **fields)
+    if response.status_code == 404:
+        return []
+    assert response.status_code == 200
+    return [post["id"] for post in response.get_json()]
+
+
+def test_ranked_by_title_subtitle_body(client, make_post):
+    in_body = make_post(body="Something about zebulon in the body.")
+    in_title = make_post(title="All about zebulon")
+    in_subtitle = make_post(subtitle="Still zebulon")
+    assert _found(client, "zebulon") == [in_title, in_subtitle, in_body]
+    assert _found(client, "zebulon", num=1, page=2) == [in_subtitle]
+
+
+def test_every_word_must_match(client, make_post):
+    both = make_post(body="The quaffle and the snitch.")
+    make_post(body="Only a quaffle.")
+    assert _found(client, "snitch quaffle") == [both]
+
+
+def test_result(client, make_post):
+    post_id = make_post(author="Searcher", title="The murmuration title", body="A murmuration of starlings.")
+    result, = _search(client, "murmuration").get_json()
+    assert result["id"] == post_id
+    assert result["author"] == "Searcher"
+    assert "body" not in result
+    assert "<mark>murmuration</mark>" in result["snippet"]
+
+
+def test_query_syntax_ignored(client, make_post):
+    post_id = make_post(body="Plain words: gribble AND grobble, near.")
+    assert _found(client, 'gribble OR "nothing') == []
+    assert _found(client, "gribble AND grobble*") == [post_id]
+    assert _found(client, "NEAR(gribble grobble)") == [post_id]
+
+
+def test_errors(client):
+    response = _search(client, "?!")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": ["'query' must contain at least one word."]}
+    response = _search(client, "nonexistentword")
+    assert response.status_code == 404
+    assert response.get_json() == {"error": ["There are no posts matching 'nonexistentword'."]}
+    assert _search(client, "x", num=0).status_code == 400
+
+
+def test_index_follows_the_posts(client, make_post):
+    post_id = make_post(body="An old flibbertigibbet.")
+    assert _found(client, "flibbertigibbet") == [post_id]
+
+    client.patch("/update-post", json={
+        "id": post_id, "title": "A searched title", "subtitle": "A subtitle", "body": "A new whatchamacallit.",
+        "img_url": None
+    })
+    assert _found(client, "flibbertigibbet") == []
+    assert _found(client, "whatchamacallit") == [post_id]
+
+    client.delete("/delete-post", json={"id": post_id})
+    assert _found(client, "whatchamacallit") == []
+
+    ids = [make_post(body="Doomed thingamajig.") for _ in range(2)]
+    client.delete("/delete-posts", json={"ids": ids})
+    assert _found(client, "thingamajig") == []
+
+
+def test_rebuild_index(blog_app, client, make_post):
+    post_id = make_post(body="Rebuilt doohickey.")
+    result = blog_app.test_cli_runner().invoke(args=["rebuild-search-index"])
+    assert result.exit_code == 0
+    assert _found(client, "doohickey") == [post_id]
@@ -0,0 +1,77 @@
+"""
+Tests of the synthetic data (see app/seed.py): the chunks of rows, and the "seed" command
+of the cli module at a small size.
+
+Run from the root of the repo:
+
+    python -m pytest tests
+"""
+import datetime
+
+from sqlalchemy import func, select, text
+
+from app import db, seed
+from app.models import Comment, Post, make_excerpt
+
+
+def _chunk(**arguments):
+    now = datetime.datetime(2024, 1, 1).timestamp()
+    defaults = dict(seed=3, chunk=0, first_id=1, posts=30, position=0, total=30, authors=4,
+                    comments=2, start=now - 1000, span=1000)
+    return seed.make_chunk(**{**defaults, **arguments})
+
+
+def test_chunks_are_deterministic():
+    assert _chunk() == _chunk()
+    assert _chunk() != _chunk(seed=4)
+    assert _chunk(chunk=1) != _chunk()
+
+
+def test_chunk_rows():
+    post_rows, comment_rows = _chunk(first_id=101)
+    posts = [dict(zip(seed.POST_COLUMNS, row)) for row in post_rows]
+    comments = [dict(zip(seed.COMMENT_COLUMNS, row)) for row in comment_rows]
+    assert [post["id"] for post in posts] == list(range(101, 131))
+    assert len({post["author"] for post in posts}) <= 4
+    assert len({post["title"] for post in posts}) == 30
+    dates = [post["date"] for post in posts]
+    assert dates == sorted(dates)
+    for post in posts:
+        own = [comment for comment in comments if comment["post_id"] == post["id"]]
+        assert post["comment_count"] == len(own)
+        assert all(post["date"] <= comment["date"] <= post["modified"] for comment in own)
+        assert post["excerpt"] == make_excerpt(post["body"])
+    assert _chunk(comments=0)[1] == []
+
+
+def _count(model):
+    return db.session.execute(select(func.count()).select_from(model)).scalar()
+
+
+def test_seed_command(blog_app):
+    with blog_app.app_context():
+        first_id = (db.session.execute(select(func.max(Post.id))).scalar() or 0) + 1
+        posts, comments = _count(Post), _count(Comment)
+
+    result = blog_app.test_cli_runner().invoke(
+        args=["seed", "--posts", "20", "--comments", "2", "--authors", "3", "--seed", "7"]
+    )
+    assert result.exit_code == 0, result.output
+    with blog_app.app_context():
+        added = _count(Comment) - comments
+        assert _count(Post) - posts == 20
+        assert f"Added 20 post(s) and {added} comment(s)" in result.output
+        assert "20/20 posts" in result.output
+        seeded = db.session.execute(select(Post).where(Post.id >= first_id).order_by(Post.id)).scalars().all()
+        assert [post.id for post in seeded] == list(range(first_id, first_id + 20))
+        assert len({post.author for post in seeded}) <= 3
+        assert sum(post.comment_count for post in seeded) == added
+        # The full-text index trigger is back, and the seeded posts are indexed.
+        assert db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'posts_fts_insert'"
+        )).first() is not None
+        post = seeded[-1]
+        assert db.session.execute(
+            text("SELECT rowid FROM posts_fts WHERE posts_fts MATCH :query"),
+            {"query": f'"{post.title}"'}
+        ).scalars().all() == [post.id]
@@ -0,0 +1,53 @@
+"""
+Tests of the JSON provider of the app (see app/serialize.py).
+
+Run from the root of the repo:
+
+    python -m pytest tests
+"""
+import datetime
+import json
+
+import pytest
+from flask import Flask
+
+from app import serialize
+from app.serialize import FastJSONProvider, PostDict
+
+
+@pytest.fixture
+def provider():
+    return FastJSONProvider(Flask("test"))
+
+
+def test_compact_sorted(provider):
+    assert provider.dumps({"b": 1, "a": "é"}) == '{"a":"é","b":1}'
+
+
+def test_dates_as_http_dates(provider):
+    date = datetime.datetime(2024, 1, 2, 3, 4, 5)
+    assert json.loads(provider.dumps({"date": date})) == {"date": "Tue, 02 Jan 2024 03:04:05 GMT"}
+
+
+def test_post_fragments_cached(provider):
+    serialize.fragments.clear()
+    post = PostDict({"id": 1, "title": "A title"}, (1, 1, None, False, False))
+    assert provider.dumps([post]) == '[{"id":1,"title":"A title"}]'
+    # The fragment is served by its key, whatever the dict holds now.
+    post["title"] = "Changed"
+    assert provider.dumps({"posts": [post], "next_cursor": None}) == '{"next_cursor":null,"posts":[{"id":1,"title":"A title"}]}'
+
+
+@pytest.mark.skipif(serialize.orjson is None, reason="orjson is not installed")
+def test_dumps_keyword_arguments(provider):
+    assert provider.dumps({"b": 1, "a": 2}, sort_keys=False) == '{"b":1,"a":2}'
+    assert provider.dumps({"a": [1]}, indent=2) == '{\n  "a": [\n    1\n  ]\n}'
+    assert provider.dumps({"a": 1}, separators=(",", ":"), ensure_ascii=False) == '{"a":1}'
+    assert provider.dumps({"a": {1}}, default=sorted) == '{"a":[1]}'
+
+
+@pytest.mark.skipif(serialize.orjson is None, reason="orjson is not installed")
+@pytest.mark.parametrize("kwargs", [{"indent": 4}, {"separators": (", ", ": ")}, {"ensure_ascii": True}, {"cls": json.JSONEncoder}])
+def test_dumps_unsupported_keyword_arguments(provider, kwargs):
+    with pytest.raises(TypeError):
+        provider.dumps({"a": 1}, **kwargs)
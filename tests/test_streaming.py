@@ -0,0 +1,79 @@
+"""
+Tests of the streamed listings (see Stream and StreamEncoder in app/handlers.py): a JSON
+array or NDJSON sent in chunks, the same posts as the listings sent at once.
+
+Run from the root of the repo:
+
+    python -m pytest tests
+"""
+import json
+
+import pytest
+
+from app import control, handlers
+
+
+def test_encoder_chunks(monkeypatch):
+    # Every post takes 32 or 33 characters, a chunk is full every 2 posts.
+    monkeypatch.setattr(handlers, "STREAM_CHUNK", 60)
+    encoder = handlers.StreamEncoder(json.dumps)
+    chunks = [encoder.add({"id": i, "title": "x" * 10}) for i in range(5)]
+    chunks.append(encoder.close())
+    assert [chunk is not None for chunk in chunks] == [False, True, False, True, False, True]
+    sent = "".join(chunk for chunk in chunks if chunk)
+    assert json.loads(sent) == [{"id": i, "title": "x" * 10} for i in range(5)]
+
+
+@pytest.mark.parametrize("ndjson", [False, True])
+def test_encoder_empty(ndjson):
+    encoder = handlers.StreamEncoder(json.dumps, ndjson)
+    assert encoder.close() == ("" if ndjson else "[]")
+
+
+def test_encoder_ndjson():
+    encoder = handlers.StreamEncoder(json.dumps, ndjson=True)
+    assert encoder.add({"id": 1}) is None
+    assert encoder.add({"id": 2}) is None
+    assert encoder.close() == '{"id": 1}\n{"id": 2}\n'
+
+
+@pytest.mark.parametrize("url, fields", [
+    ("/get-posts", {"num": 0, "page": 1, "comments": True}),
+    ("/get-posts", {"num": 0, "page": 1, "comments": True, "comments_limit": 1, "summary": True}),
+    ("/get-posts-by-user", {"user": "Streamer", "num": 0, "page": 1}),
+])
+def test_same_posts_as_the_listing(client, make_post, monkeypatch, url, fields):
+    for i in range(5):
+        make_post(author="Streamer", comments=["First", "Second"][:i % 3])
+    # Several batches and chunks even for a few posts.
+    monkeypatch.setattr(control, "STREAM_BATCH", 2)
+    monkeypatch.setattr(handlers, "STREAM_CHUNK", 100)
+    listed = client.get(url, json=fields).get_json()
+
+    response = client.get(url, json={**fields, "stream": True})
+    assert response.status_code == 200
+    assert response.mimetype == "application/json"
+    assert response.is_streamed
+    assert response.get_json() == listed
+
+    response = client.get(url, json={**fields, "stream": True, "format": "ndjson"})
+    assert response.mimetype == "application/x-ndjson"
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line) for line in lines] == listed
+
+
+def test_stream_of_a_cursor_page(client, make_post):
+    ids = [make_post(author="Stream cursor") for _ in range(3)]
+    fields = {"user": "Stream cursor", "num": 2}
+    cursor = client.get("/get-posts-by-user", json={**fields, "after": None}).get_json()["next_cursor"]
+    response = client.get("/get-posts-by-user", json={**fields, "after": cursor, "stream": True})
+    assert [post["id"] for post in response.get_json()] == ids[:1]
+
+
+def test_stream_errors(client):
+    response = client.get("/get-posts-by-user", json={"user": "Nobody here", "num": 0, "page": 1, "stream": True})
+    assert response.status_code == 404
+    response = client.get("/get-posts", json={"num": 0, "comments": False, "after": "bad", "stream": True})
+    assert response.get_json() == {"error": ["'after' is not a valid cursor."]}
+    response = client.get("/get-posts", json={"num": 0, "page": 1, "comments": False, "format": "xml"})
+    assert response.status_code == 400
@@ -0,0 +1,62 @@
+"""
+Tests of the summary mode of the listings (see make_excerpt in app/models.py): an "excerpt"
+of the body instead of the body, which is not loaded.
+
+Run from the root of the repo:
+
+    python -m pytest tests
+"""
+from app import cache, control
+from app.models import EXCERPT_LENGTH, make_excerpt
+
+
+def test_short_body_kept():
+    assert make_excerpt("  A short\n\tbody.  ") == "A short body."
+
+
+def test_long_body_cut_at_a_word():
+    body = "word " * 100
+    excerpt = make_excerpt(body)
+    assert len(excerpt) <= EXCERPT_LENGTH
+    assert excerpt.endswith("word…")
+    assert make_excerpt("x" * 1000) == "x" * (EXCERPT_LENGTH - 1) + "…"
+    assert make_excerpt("a" * EXCERPT_LENGTH) == "a" * EXCERPT_LENGTH
+
+
+def test_summary_listings(client, make_post):
+    body = "A long body. " * 50
+    post_id = make_post(author="Summed up", body=body)
+    for url, fields in [
+        ("/get-posts", {"num": 1, "page": 1, "comments": False}),
+        ("/get-posts-by-user", {"user": "Summed up", "num": 1, "page": 1}),
+        ("/get-posts-by-user", {"user": "Summed up", "num": 1, "after": None}),
+    ]:
+        full = client.get(url, json=fields).get_json()
+        summary = client.get(url, json={**fields, "summary": True}).get_json()
+        full, summary = (body["posts"] if "posts" in body else body for body in (full, summary))
+        assert full[0]["id"] == summary[0]["id"] == post_id
+        assert full[0]["body"] == body
+        assert "excerpt" not in full[0]
+        assert "body" not in summary[0]
+        assert summary[0]["excerpt"] == make_excerpt(body)
+        del full[0]["body"], summary[0]["excerpt"]
+        assert full[0] == summary[0]
+
+
+def test_excerpt_follows_the_updates(client, make_post):
+    post_id = make_post(author="Updated summary")
+    client.patch("/update-post", json={
+        "id": post_id, "title": "A summed up title", "subtitle": "A subtitle", "body": "<b>New</b> body", "img_url": None
+    })
+    post, = client.get("/get-posts-by-user", json={"user": "Updated summary", "num": 1, "page": 1, "summary": True}).get_json()
+    assert post["excerpt"] == "&lt;b&gt;New&lt;/b&gt; body"
+
+
+def test_body_not_loaded(statements, make_post):
+    make_post()
+    cache.responses.clear()
+    with statements() as run:
+        control.get_posts(num=5, summary=True)
+    select_posts = [statement for statement in run if "FROM posts" in statement][-1]
+    assert "posts.excerpt" in select_posts
+    assert "posts.body" not in select_posts
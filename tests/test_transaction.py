@@ -0,0 +1,105 @@
+"""
+Tests of the units of work (see app/transaction.py): one commit at the end of the unit,
+a rollback on an error, the work of at_end run after both, the nested units joining the outer one.
+
+Run from the root of the repo:
+
+    python -m pytest tests
+"""
+import pytest
+from sqlalchemy import select
+
+from app import control, db, transaction
+from app.engine import READER
+from app.models import Comment, Post
+
+
+def _committed(blog_app, post_id):
+    """Returns the bodies of the comments of a post and its number of comments, as committed:
+    read through the reader engine, which does not see the changes of a unit not committed yet."""
+    with blog_app.app_context():
+        with db.engines[READER].connect() as connection:
+            comments = connection.execute(
+                select(Comment.body).where(Comment.post_id == post_id).order_by(Comment.id)
+            ).scalars().all()
+            count = connection.execute(select(Post.comment_count).where(Post.id == post_id)).scalar()
+    return comments, count
+
+
+def test_batch_commits_at_the_end(blog_app, make_post):
+    post_id = make_post()
+    with transaction.batch():
+        control.add_comment(author="Bob", body="First", post_id=post_id)
+        control.add_comment(author="Bob", body="Second", post_id=post_id)
+        assert _committed(blog_app, post_id) == ([], 0)
+    assert _committed(blog_app, post_id) == (["First", "Second"], 2)
+
+
+def test_batch_rolls_back_on_an_exception(blog_app, make_post):
+    post_id = make_post(comments=["Kept"])
+    with pytest.raises(ValueError):
+        with transaction.batch():
+            control.add_comment(author="Bob", body="Lost", post_id=post_id)
+            raise ValueError("failed")
+    assert _committed(blog_app, post_id) == (["Kept"], 1)
+
+
+def test_error_response_rolls_back(blog_app, make_post):
+    post_id = make_post()
+    for status, expected in [(400, ([], 0)), (200, (["Saved"], 1))]:
+        with blog_app.test_request_context(method="POST"):
+            transaction.begin()
+            control.add_comment(author="Bob", body="Saved", post_id=post_id)
+            transaction.end(commit=status < 400)
+        assert _committed(blog_app, post_id) == expected
+
+
+def test_at_end_runs_after_the_commit(blog_app, make_post):
+    post_id = make_post()
+    seen = []
+    with transaction.batch():
+        control.add_comment(author="Bob", body="First", post_id=post_id)
+        transaction.at_end(lambda: seen.append(_committed(blog_app, post_id)))
+        assert seen == []
+    assert seen == [(["First"], 1)]
+
+
+def test_at_end_runs_after_a_rollback(blog_app, make_post):
+    post_id = make_post()
+    seen = []
+    with pytest.raises(ValueError):
+        with transaction.batch():
+            control.add_comment(author="Bob", body="Lost", post_id=post_id)
+            transaction.at_end(lambda: seen.append(_committed(blog_app, post_id)))
+            raise ValueError("failed")
+    assert seen == [([], 0)]
+
+
+def test_at_end_out_of_a_unit_runs_now(blog_app):
+    seen = []
+    transaction.at_end(seen.append, "now")
+    assert seen == ["now"]
+
+
+def test_nested_batch_joins_the_outer_one(blog_app, make_post):
+    post_id = make_post()
+    with transaction.batch():
+        with transaction.batch():
+            control.add_comment(author="Bob", body="Inner", post_id=post_id)
+        # Not committed by the end of the inner block.
+        assert _committed(blog_app, post_id) == ([], 0)
+        control.add_comment(author="Bob", body="Outer", post_id=post_id)
+    assert _committed(blog_app, post_id) == (["Inner", "Outer"], 2)
+
+    with pytest.raises(ValueError):
+        with transaction.batch():
+            control.add_comment(author="Bob", body="Lost", post_id=post_id)
+            with transaction.batch():
+                raise ValueError("failed")
+    assert _committed(blog_app, post_id) == (["Inner", "Outer"], 2)
+
+
+def test_control_commits_out_of_a_unit(blog_app, make_post):
+    post_id = make_post()
+    control.add_comment(author="Bob", body="Alone", post_id=post_id)
+    assert _committed(blog_app, post_id) == (["Alone"], 1)
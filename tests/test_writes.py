@@ -0,0 +1,78 @@
+"""
+Tests of the endpoints changing posts and comments (see app/handlers.py), on ids with
+and without a row: a missing id is a 404 with a plain message.
+
+Run from the root of the repo:
+
+    python -m pytest tests
+"""
+from sqlalchemy import select
+
+
+def _comment_ids(blog_app, post_id):
+    from app import db
+    from app.models import Comment
+    with blog_app.app_context():
+        return db.session.execute(
+            select(Comment.id).where(Comment.post_id == post_id).order_by(Comment.id)
+        ).scalars().all()
+
+
+def test_update_post(client, make_post):
+    post_id = make_post(author="Writer")
+    response = client.patch("/update-post", json={
+        "id": post_id, "title": "A new title", "subtitle": "A new subtitle", "body": "A new body", "img_url": None
+    })
+    assert response.status_code == 200
+    post = client.get("/get-post", json={"id": post_id}).get_json()
+    assert post["title"] == "A new title"
+    assert post["body"] == "A new body"
+
+
+def test_update_missing_post(client):
+    response = client.patch("/update-post", json={
+        "id": 10 ** 9, "title": "A new title", "subtitle": "A new subtitle", "body": "A new body", "img_url": None
+    })
+    assert response.status_code == 404
+    assert response.get_json() == {"error": ["There is no post with the 'id' of 1000000000."]}
+
+
+def test_edit_comment(blog_app, client, make_post):
+    post_id = make_post(comments=["First"])
+    comment_id, = _comment_ids(blog_app, post_id)
+    response = client.patch("/edit-comment", json={"comment_id": comment_id, "body": "Edited"})
+    assert response.status_code == 200
+    post = client.get("/get-post", json={"id": post_id}).get_json()
+    assert [comment["body"] for comment in post["comments"]] == ["Edited"]
+
+
+def test_edit_missing_comment(client):
+    response = client.patch("/edit-comment", json={"comment_id": 10 ** 9, "body": "Edited"})
+    assert response.status_code == 404
+    assert response.get_json() == {"error": ["There is no comment with the 'comment_id' of 1000000000."]}
+
+
+def test_delete_comment(blog_app, client, make_post):
+    post_id = make_post(comments=["First", "Second"])
+    first, second = _comment_ids(blog_app, post_id)
+    assert client.delete("/delete-comment", json={"comment_id": first}).status_code == 200
+    assert _comment_ids(blog_app, post_id) == [second]
+    response = client.delete("/delete-comment", json={"comment_id": first})
+    assert response.status_code == 404
+    assert response.get_json() == {"error": [f"There is no comment with the 'comment_id' of {first}."]}
+
+
+def test_delete_post(blog_app, client, make_post):
+    post_id = make_post(comments=["First"])
+    assert client.delete("/delete-post", json={"id": post_id}).status_code == 200
+    assert _comment_ids(blog_app, post_id) == []
+    assert client.delete("/delete-post", json={"id": post_id}).status_code == 404
+
+
+def test_delete_many(blog_app, client, make_post):
+    ids = [make_post(), make_post()]
+    response = client.delete("/delete-posts", json={"ids": ids + [10 ** 9]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["deleted"] == ids
+    assert body["missing"] == [10 ** 9]
@@ -0,0 +1,11 @@
+"""
+WSGI entry point of the blog app for production servers, see gunicorn.conf.py:
+
+    gunicorn wsgi:app
+
+main.py runs the development server of Flask instead.
+"""
+from app.server import create_app
+
+
+app = create_app()